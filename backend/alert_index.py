@@ -0,0 +1,119 @@
+"""
+In-memory index of active price alerts.
+
+Threshold alerts (a target price, or a percentage drop from the price when
+the alert was set, stored as the equivalent target) are kept per product in
+a list sorted by threshold, so a new price finds every triggered alert with
+one binary search. All-time-low alerts fire when a price undercuts the
+lowest price seen for the product, which the index tracks itself. Work per
+price update depends only on that product's triggered alerts, not on how
+many alerts exist.
+
+The index is rebuilt from price_alerts and price_stats at startup and kept
+in sync by the alert endpoints; alerts leave it once their email is sent.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+TARGET = 'target'
+PERCENT_DROP = 'percent_drop'
+ALL_TIME_LOW = 'all_time_low'
+
+ALERT_TYPES = (TARGET, PERCENT_DROP, ALL_TIME_LOW)
+
+def alert_threshold(alert_type: str, target_price: Optional[float],
+                    percent_drop: Optional[float], reference_price: Optional[float]) -> Optional[float]:
+    """Price at or below which a threshold alert fires; None for all-time-low alerts."""
+    if alert_type == PERCENT_DROP:
+        return reference_price * (1 - percent_drop / 100)
+    if alert_type == ALL_TIME_LOW:
+        return None
+    return target_price
+
+class AlertIndex:
+    """Active alerts per product, sorted by threshold."""
+
+    def __init__(self):
+        self.loaded = False
+        # product_id -> sorted [(threshold, alert_id)]
+        self._thresholds: Dict[int, List[Tuple[float, int]]] = {}
+        # product_id -> all-time-low alert ids
+        self._all_time_low: Dict[int, Set[int]] = {}
+        # product_id -> lowest price observed
+        self._lows: Dict[int, float] = {}
+        # alert_id -> (product_id, threshold or None)
+        self._alerts: Dict[int, Tuple[int, Optional[float]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def __contains__(self, alert_id: int) -> bool:
+        return alert_id in self._alerts
+
+    def add(self, alert_id: int, product_id: int, threshold: Optional[float]):
+        """Index an alert; a threshold of None makes it an all-time-low alert."""
+        self.remove(alert_id)
+        self._alerts[alert_id] = (product_id, threshold)
+        if threshold is None:
+            self._all_time_low.setdefault(product_id, set()).add(alert_id)
+        else:
+            insort(self._thresholds.setdefault(product_id, []), (threshold, alert_id))
+
+    def remove(self, alert_id: int):
+        entry = self._alerts.pop(alert_id, None)
+        if entry is None:
+            return
+        product_id, threshold = entry
+        if threshold is None:
+            self._all_time_low[product_id].discard(alert_id)
+            return
+        entries = self._thresholds[product_id]
+        position = bisect_left(entries, (threshold, alert_id))
+        if position < len(entries) and entries[position] == (threshold, alert_id):
+            del entries[position]
+
+    def set_low(self, product_id: int, price: Optional[float]):
+        if price is not None:
+            self._lows[product_id] = price
+
+    def observe(self, product_id: int, price: float) -> List[int]:
+        """Record a new price and return the ids of the alerts it triggers."""
+        triggered = []
+        entries = self._thresholds.get(product_id)
+        if entries:
+            # Every threshold >= price has been reached
+            position = bisect_left(entries, (price, -1))
+            triggered.extend(alert_id for _, alert_id in entries[position:])
+        low = self._lows.get(product_id)
+        if low is None or price < low:
+            if low is not None:
+                triggered.extend(self._all_time_low.get(product_id, ()))
+            self._lows[product_id] = price
+        return triggered
+
+    def rebuild(self, alerts: Iterable[Tuple[int, int, Optional[float]]],
+                lows: Iterable[Tuple[int, Optional[float]]]):
+        """Replace the contents with (alert_id, product_id, threshold) rows and (product_id, low) rows."""
+        self.__init__()
+        for product_id, low in lows:
+            self.set_low(product_id, low)
+        for alert_id, product_id, threshold in alerts:
+            self._alerts[alert_id] = (product_id, threshold)
+            if threshold is None:
+                self._all_time_low.setdefault(product_id, set()).add(alert_id)
+            else:
+                self._thresholds.setdefault(product_id, []).append((threshold, alert_id))
+        for entries in self._thresholds.values():
+            entries.sort()
+        self.loaded = True
+
+# target_price holds the resolved threshold for percent-drop alerts too.
+# prices.db deletes alerts once sent; the SQLAlchemy schema flags them.
+ACTIVE_ALERTS_SQL = '''
+    SELECT id, product_id,
+           CASE WHEN alert_type = 'all_time_low' THEN NULL ELSE target_price END
+    FROM price_alerts
+'''
+UNSENT_ALERTS_SQL = ACTIVE_ALERTS_SQL + ' WHERE COALESCE(is_sent, false) = false'
+
+LOWS_SQL = 'SELECT product_id, min_price FROM price_stats'
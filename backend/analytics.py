@@ -0,0 +1,180 @@
+"""
+Trend statistics and short-term price forecasts over many products at once.
+
+Histories are loaded with one query into flat NumPy arrays sorted by product
+and time, and every statistic is a grouped reduction over those arrays
+(np.bincount by product index), so the cost is a few passes over the rows
+whatever the number of products.
+
+Per product: moving averages over the last 7 and 30 days, volatility (std of
+log returns between observations), a least-squares linear trend, a forecast
+`horizon_days` ahead with a 95% band from the trend residuals, and the
+probability of a drop of at least `drop_threshold` by then under a random
+walk with the observed drift and volatility.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import extract, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.models import PriceHistory
+
+DAY_SECONDS = 86400.0
+
+# Two-sided 95% normal quantile for the forecast band
+Z_95 = 1.959964
+
+class PriceSeries:
+    """Price histories of many products as flat arrays grouped by product."""
+
+    def __init__(self, product_ids: np.ndarray, times: np.ndarray, prices: np.ndarray):
+        # Rows must be sorted by product, then time
+        self.times = np.asarray(times, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        ids = np.asarray(product_ids, dtype=np.int64)
+        if len(ids):
+            self.starts = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1))
+        else:
+            self.starts = np.zeros(0, dtype=np.int64)
+        self.product_ids = ids[self.starts]
+        self.counts = np.diff(np.append(self.starts, len(ids)))
+        # Group index of every row
+        self.group = np.repeat(np.arange(len(self.starts)), self.counts)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_rows(cls, rows: List) -> 'PriceSeries':
+        """From (product_id, epoch seconds, price) rows in query order."""
+        if not rows:
+            empty = np.zeros(0)
+            return cls(empty, empty, empty)
+        data = np.array(rows, dtype=np.float64)
+        return cls(data[:, 0], data[:, 1], data[:, 2])
+
+def _series_query(product_ids: Optional[Iterable[int]], days: int):
+    query = (
+        select(PriceHistory.product_id, extract('epoch', PriceHistory.timestamp), PriceHistory.price)
+        .where(PriceHistory.timestamp >= datetime.utcnow() - timedelta(days=days))
+        .where(PriceHistory.price.isnot(None))
+        .order_by(PriceHistory.product_id, PriceHistory.timestamp)
+    )
+    if product_ids is not None:
+        query = query.where(PriceHistory.product_id.in_(list(product_ids)))
+    return query
+
+async def load_series(db: AsyncSession, product_ids: Optional[Iterable[int]] = None,
+                      days: int = 90) -> PriceSeries:
+    """The last `days` of history for `product_ids` (all products if None)."""
+    result = await db.execute(_series_query(product_ids, days))
+    return PriceSeries.from_rows(result.all())
+
+def load_series_sync(conn: Connection, product_ids: Optional[Iterable[int]] = None,
+                     days: int = 90) -> PriceSeries:
+    """load_series() for a synchronous connection, e.g. batch jobs."""
+    return PriceSeries.from_rows(conn.execute(_series_query(product_ids, days)).all())
+
+def _normal_cdf(x: np.ndarray) -> np.ndarray:
+    # Abramowitz & Stegun 7.1.26 erf approximation, max error 1.5e-7
+    z = np.abs(x) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+def analyze(series: PriceSeries, horizon_days: float = 7.0, drop_threshold: float = 0.05) -> Dict[str, np.ndarray]:
+    """Per-product statistics as arrays aligned with series.product_ids."""
+    groups = len(series)
+    counts = series.counts.astype(np.float64)
+    if groups == 0:
+        return {}
+    g, p = series.group, series.prices
+    ends = series.starts + series.counts - 1
+    last_price = p[ends]
+    first_time, last_time = series.times[series.starts], series.times[ends]
+
+    def group_sum(values, mask=None):
+        if mask is None:
+            return np.bincount(g, weights=values, minlength=groups)
+        return np.bincount(g[mask], weights=values[mask], minlength=groups)
+
+    # Days relative to each product's latest observation (<= 0)
+    t = (series.times - last_time[g]) / DAY_SECONDS
+
+    averages = {}
+    for window in (7, 30):
+        mask = t > -window
+        averages[window] = group_sum(p, mask) / np.bincount(g[mask], minlength=groups)
+
+    # Least-squares line p = intercept + slope * t
+    sum_t, sum_p = group_sum(t), group_sum(p)
+    sum_tt, sum_tp, sum_pp = group_sum(t * t), group_sum(t * p), group_sum(p * p)
+    denom = counts * sum_tt - sum_t * sum_t
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denom > 0, (counts * sum_tp - sum_t * sum_p) / denom, 0.0)
+        intercept = (sum_p - slope * sum_t) / counts
+        sse = (sum_pp - 2 * intercept * sum_p - 2 * slope * sum_tp + counts * intercept ** 2
+               + 2 * intercept * slope * sum_t + slope ** 2 * sum_tt)
+        resid_std = np.where(counts > 2, np.sqrt(np.maximum(sse, 0) / (counts - 2)), np.nan)
+    forecast = np.where(counts > 1, intercept + slope * horizon_days, last_price)
+    band = Z_95 * resid_std
+
+    # Log returns between consecutive observations of the same product
+    log_p = np.log(np.maximum(p, 1e-9))
+    same = g[1:] == g[:-1]
+    returns = np.diff(log_p)[same]
+    rg = g[1:][same]
+    steps = np.bincount(rg, minlength=groups).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drift = np.bincount(rg, weights=returns, minlength=groups) / steps
+        variance = np.bincount(rg, weights=returns * returns, minlength=groups) / steps - drift ** 2
+        volatility = np.where(steps > 1, np.sqrt(np.maximum(variance, 0) * steps / (steps - 1)), np.nan)
+
+        # Observations expected before the horizon, at the product's usual interval
+        step_days = (last_time - first_time) / DAY_SECONDS / steps
+        k = np.where(step_days > 0, horizon_days / step_days, np.nan)
+        threshold = np.log(1 - drop_threshold)
+        z = (threshold - k * drift) / (volatility * np.sqrt(k))
+        drop_probability = np.where(
+            volatility > 0, _normal_cdf(z), np.where(k * drift <= threshold, 1.0, 0.0)
+        )
+    drop_probability = np.where(np.isnan(k) | np.isnan(volatility), np.nan, drop_probability)
+
+    return {
+        'product_id': series.product_ids,
+        'points': series.counts,
+        'last_price': last_price,
+        'ma_7d': averages[7],
+        'ma_30d': averages[30],
+        'volatility': volatility,
+        'trend_per_day': slope,
+        'forecast': forecast,
+        'forecast_low': forecast - band,
+        'forecast_high': forecast + band,
+        'drop_probability': drop_probability,
+    }
+
+def _clean(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 6)
+
+def forecast_payloads(stats: Dict[str, np.ndarray], horizon_days: float,
+                      drop_threshold: float) -> Dict[int, Dict]:
+    """JSON-ready forecast per product id."""
+    if not stats:
+        return {}
+    columns = {name: values.tolist() for name, values in stats.items()}
+    payloads = {}
+    for i, product_id in enumerate(columns['product_id']):
+        payloads[int(product_id)] = {
+            'product_id': int(product_id),
+            'points': int(columns['points'][i]),
+            'horizon_days': horizon_days,
+            'drop_threshold': drop_threshold,
+            **{name: _clean(columns[name][i]) for name in columns if name not in ('product_id', 'points')},
+        }
+    return payloads
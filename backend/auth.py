@@ -1,13 +1,40 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import firebase_admin
-from firebase_admin import credentials, auth
-from typing import Optional
+from firebase_admin import credentials
+from collections import OrderedDict, deque
+from cryptography import x509
+from typing import Dict, Optional
+import aiohttp
+import asyncio
+import hashlib
+import jwt
 import os
+import re
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Google's X.509 certificates for Firebase ID token signatures
+FIREBASE_CERTS_URL = os.getenv(
+    "FIREBASE_CERTS_URL",
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+
+# Verified tokens kept in memory; each entry lives until the token's exp
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+
+# Refresh signing keys this long before Google's Cache-Control max-age runs out
+KEY_REFRESH_MARGIN_SECONDS = 300
+
+# A token with an unknown kid refetches the keys at most this often; between
+# fetches it is rejected without touching the network
+UNKNOWN_KID_REFETCH_SECONDS = 60
+
+# Clock skew tolerated on exp/iat/auth_time
+CLOCK_SKEW_SECONDS = 10
+
 # Initialize Firebase Admin only if credentials are available
 firebase_initialized = False
 if all([
@@ -39,9 +66,170 @@ if all([
 
 security = HTTPBearer(auto_error=False)
 
+class FirebaseKeySet:
+    """
+    Public keys for Firebase ID tokens by key id.
+
+    Keys are fetched from `url` and kept until Google's Cache-Control max-age
+    expires. refresh_forever() renews them ahead of that in the background,
+    so request handlers only fetch keys on a cold start or, rate limited, an
+    unknown kid.
+    """
+
+    def __init__(self, url: str = FIREBASE_CERTS_URL):
+        self.url = url
+        self.keys: Dict[str, object] = {}
+        self.expires_at = 0.0
+        self.fetched_at = float("-inf")
+        self.refreshes = 0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        self.fetched_at = time.monotonic()
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+            async with session.get(self.url) as response:
+                response.raise_for_status()
+                certs = await response.json()
+                cache_control = response.headers.get("Cache-Control", "")
+        self.keys = {
+            kid: x509.load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in certs.items()
+        }
+        match = re.search(r"max-age=(\d+)", cache_control)
+        self.expires_at = time.monotonic() + (int(match.group(1)) if match else 3600)
+        self.refreshes += 1
+
+    def _needs_refresh(self, kid: str) -> bool:
+        now = time.monotonic()
+        if now >= self.expires_at:
+            return True
+        return kid not in self.keys and now - self.fetched_at >= UNKNOWN_KID_REFETCH_SECONDS
+
+    async def get(self, kid: str):
+        """
+        Key for `kid`, or None. Fetches the key set if it is stale, or if it
+        lacks `kid` and was last fetched UNKNOWN_KID_REFETCH_SECONDS ago.
+        """
+        if self._needs_refresh(kid):
+            async with self._lock:
+                # Another request may have refreshed while we waited
+                if self._needs_refresh(kid):
+                    await self.refresh()
+        return self.keys.get(kid)
+
+    async def refresh_forever(self):
+        while True:
+            try:
+                await self.refresh()
+                delay = self.expires_at - time.monotonic() - KEY_REFRESH_MARGIN_SECONDS
+            except Exception as e:
+                print(f"Error refreshing Firebase signing keys: {str(e)}")  # Debug log
+                delay = 60
+            await asyncio.sleep(max(delay, 60))
+
+key_set = FirebaseKeySet()
+_key_refresh_task: Optional[asyncio.Task] = None
+
+# token sha256 -> (claims, exp); most recently used last
+_token_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+_auth_stats = {"cache_hits": 0, "cache_misses": 0, "failures": 0}
+_verify_ms: deque = deque(maxlen=1000)
+
+async def verify_id_token(token: str, project_id: str, keys: FirebaseKeySet = key_set) -> Dict:
+    """
+    Check a Firebase ID token's signature and claims and return the claims.
+
+    Same rules as firebase_admin.auth.verify_id_token: RS256 signed by a
+    current Google key, audience is the project id, issuer is
+    securetoken.google.com/<project id>, a non-empty subject and an auth_time
+    that is not in the future.
+    """
+    header = jwt.get_unverified_header(token)
+    if header.get("alg") != "RS256" or not header.get("kid"):
+        raise jwt.InvalidTokenError("Unexpected token header")
+    key = await keys.get(header["kid"])
+    if key is None:
+        raise jwt.InvalidTokenError("Unknown signing key")
+    claims = jwt.decode(
+        token,
+        key=key,
+        algorithms=["RS256"],
+        audience=project_id,
+        issuer=f"https://securetoken.google.com/{project_id}",
+        leeway=CLOCK_SKEW_SECONDS,
+        options={"require": ["exp", "iat", "sub", "auth_time"]},
+    )
+    if not claims.get("sub"):
+        raise jwt.InvalidTokenError("Token has no subject")
+    auth_time = claims["auth_time"]
+    if not isinstance(auth_time, (int, float)) or auth_time > time.time() + CLOCK_SKEW_SECONDS:
+        raise jwt.InvalidTokenError("Token has an invalid auth_time")
+    return claims
+
+async def verify_token_cached(token: str, project_id: str, keys: FirebaseKeySet = key_set) -> Dict:
+    """verify_id_token() with verified tokens served from an LRU until they expire."""
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    entry = _token_cache.get(digest)
+    if entry is not None:
+        claims, expires = entry
+        if time.time() < expires:
+            _token_cache.move_to_end(digest)
+            _auth_stats["cache_hits"] += 1
+            return claims
+        del _token_cache[digest]
+
+    _auth_stats["cache_misses"] += 1
+    started = time.perf_counter()
+    try:
+        claims = await verify_id_token(token, project_id, keys)
+    except Exception:
+        _auth_stats["failures"] += 1
+        raise
+    finally:
+        _verify_ms.append((time.perf_counter() - started) * 1000)
+
+    _token_cache[digest] = (claims, claims["exp"])
+    if len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return claims
+
+def clear_token_cache():
+    _token_cache.clear()
+
+def get_auth_stats() -> Dict:
+    """Token cache hit rate and time spent verifying uncached tokens."""
+    samples = sorted(_verify_ms)
+    lookups = _auth_stats["cache_hits"] + _auth_stats["cache_misses"]
+    return {
+        **_auth_stats,
+        "hit_rate": round(_auth_stats["cache_hits"] / lookups, 3) if lookups else None,
+        "cached_tokens": len(_token_cache),
+        "verify_ms_p50": round(samples[len(samples) // 2], 3) if samples else None,
+        "verify_ms_p99": round(samples[int(len(samples) * 0.99)], 3) if samples else None,
+        "verify_ms_max": round(samples[-1], 3) if samples else None,
+        "key_refreshes": key_set.refreshes,
+        "keys": len(key_set.keys),
+    }
+
+def start_key_refresh():
+    """Keep the signing keys fresh in the background; no-op without Firebase."""
+    global _key_refresh_task
+    if firebase_initialized and _key_refresh_task is None:
+        _key_refresh_task = asyncio.create_task(key_set.refresh_forever())
+
+async def stop_key_refresh():
+    global _key_refresh_task
+    if _key_refresh_task is not None:
+        _key_refresh_task.cancel()
+        _key_refresh_task = None
+
 async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> str:
     """
     Verify Firebase token and return user email. For development, returns a default email if no Firebase credentials.
+
+    Verified tokens are cached until they expire, so repeat requests with the
+    same token skip signature checks.
     """
     if not firebase_initialized:
         return "dev@example.com"  # Default user for development
@@ -55,7 +243,7 @@ async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] =
         
     try:
         token = credentials.credentials
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await verify_token_cached(token, os.getenv("FIREBASE_PROJECT_ID"))
         return decoded_token['email']
     except Exception as e:
         raise HTTPException(
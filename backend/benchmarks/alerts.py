@@ -0,0 +1,117 @@
+"""
+Alert trigger detection: the in-memory AlertIndex versus the SQL alert scan.
+
+    python -m backend.benchmarks.alerts --alerts 10000 100000 1000000
+
+For each alert count, builds an SQLite database of products and alerts
+(target, percent-drop and all-time-low), rebuilds an AlertIndex from it,
+then times a stream of price updates two ways: AlertIndex.observe per
+update, and the join over products and price_alerts that the checkers used
+to run. Both must find the same triggered target alerts.
+"""
+import argparse
+import random
+import sqlite3
+import time
+
+from backend.alert_index import ACTIVE_ALERTS_SQL, LOWS_SQL, AlertIndex, alert_threshold
+from backend.benchmarks.report import percentile, summarize, write_report
+
+# The scan the alert checkers ran after every refresh
+SCAN_SQL = '''
+    SELECT pa.id FROM products p
+    JOIN price_alerts pa ON p.id = pa.product_id
+    WHERE p.current_price <= pa.target_price AND pa.alert_type <> 'all_time_low'
+'''
+
+def build(alerts: int, products: int, seed: int = 0) -> sqlite3.Connection:
+    rng = random.Random(seed)
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE products (id INTEGER PRIMARY KEY, current_price REAL);
+        CREATE TABLE price_stats (product_id INTEGER PRIMARY KEY, min_price REAL);
+        CREATE TABLE price_alerts (id INTEGER PRIMARY KEY, product_id INTEGER, alert_type TEXT,
+                                   target_price REAL, percent_drop REAL, reference_price REAL);
+        CREATE INDEX ix_price_alerts_product_id ON price_alerts (product_id);
+    ''')
+    prices = [round(rng.uniform(10, 5000), 2) for _ in range(products)]
+    conn.executemany('INSERT INTO products VALUES (?, ?)', enumerate(prices, 1))
+    conn.executemany('INSERT INTO price_stats VALUES (?, ?)',
+                     ((i, round(p * 0.9, 2)) for i, p in enumerate(prices, 1)))
+    rows = []
+    for alert_id in range(1, alerts + 1):
+        product_id = rng.randint(1, products)
+        price = prices[product_id - 1]
+        alert_type = rng.choices(('target', 'percent_drop', 'all_time_low'), (6, 3, 1))[0]
+        target = round(price * rng.uniform(0.7, 0.99), 2) if alert_type == 'target' else None
+        drop = rng.choice((5, 10, 20)) if alert_type == 'percent_drop' else None
+        threshold = alert_threshold(alert_type, target, drop, price)
+        rows.append((alert_id, product_id, alert_type, threshold, drop, price))
+    conn.executemany('INSERT INTO price_alerts VALUES (?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    return conn
+
+def run_one(alerts: int, args) -> dict:
+    rng = random.Random(1)
+    conn = build(alerts, args.products)
+    report = {'alerts': alerts, 'products': args.products}
+
+    index = AlertIndex()
+    started = time.perf_counter()
+    index.rebuild(conn.execute(ACTIVE_ALERTS_SQL).fetchall(), conn.execute(LOWS_SQL).fetchall())
+    report['rebuild_seconds'] = round(time.perf_counter() - started, 3)
+
+    updates = []
+    for _ in range(args.updates):
+        product_id = rng.randint(1, args.products)
+        (price,) = conn.execute('SELECT current_price FROM products WHERE id = ?', (product_id,)).fetchone()
+        updates.append((product_id, round(price * rng.uniform(0.75, 1.05), 2)))
+
+    latencies, triggered = [], 0
+    started = time.perf_counter()
+    for product_id, price in updates:
+        began = time.perf_counter()
+        triggered += len(index.observe(product_id, price))
+        latencies.append(time.perf_counter() - began)
+    report['index'] = summarize(latencies, time.perf_counter() - started)
+    # Sub-millisecond, so also in microseconds
+    report['index']['p50_us'] = round(percentile(latencies, 50) * 1e6, 2)
+    report['index']['p99_us'] = round(percentile(latencies, 99) * 1e6, 2)
+    report['triggered'] = triggered
+
+    # The scan reads every alert whatever changed, so a few runs are enough
+    latencies = []
+    started = time.perf_counter()
+    for product_id, price in updates[:args.scan_updates]:
+        conn.execute('UPDATE products SET current_price = ? WHERE id = ?', (price, product_id))
+        began = time.perf_counter()
+        conn.execute(SCAN_SQL).fetchall()
+        latencies.append(time.perf_counter() - began)
+    report['sql_scan'] = summarize(latencies, time.perf_counter() - started)
+
+    # With every update applied, the scan and the index agree on target alerts
+    for product_id, price in updates[args.scan_updates:]:
+        conn.execute('UPDATE products SET current_price = ? WHERE id = ?', (price, product_id))
+    # No lows, so all-time-low alerts cannot fire
+    check = AlertIndex()
+    check.rebuild(conn.execute(ACTIVE_ALERTS_SQL).fetchall(), [])
+    indexed = set()
+    for product_id, price in conn.execute('SELECT id, current_price FROM products'):
+        indexed.update(check.observe(product_id, price))
+    scanned = {alert_id for (alert_id,) in conn.execute(SCAN_SQL)}
+    report['agrees'] = indexed == scanned
+    conn.close()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--alerts', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--scan-updates', type=int, default=20)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report({'runs': [run_one(alerts, args) for alerts in args.alerts]}, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Vectorized trend/forecast statistics versus a per-row Python loop.
+
+    python -m backend.benchmarks.analytics --products 100000 --points 60
+    python -m backend.benchmarks.analytics --dir /tmp/pp-load   # also time the load query
+
+Generates random-walk histories (one observation per 12 hours), runs
+analytics.analyze over all of them, and a straightforward per-product loop
+over --naive-products of them, checking both agree. With --dir the series
+are also loaded from the load-test database generated by datagen.
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+
+from backend.benchmarks.report import write_report
+
+def _synthetic(products: int, points: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ids = np.repeat(np.arange(1, products + 1), points)
+    start = time.time() - points * 43200
+    times = np.tile(start + np.arange(points) * 43200.0, products)
+    base = rng.uniform(10, 5000, products)
+    steps = rng.normal(0, 0.01, (products, points)).cumsum(axis=1)
+    prices = np.round(base[:, None] * np.exp(steps), 2).ravel()
+    return ids, times, prices
+
+def naive(ids, times, prices, horizon_days: float, drop_threshold: float) -> dict:
+    """The same statistics one product at a time, in plain Python."""
+    out = {}
+    rows = list(zip(ids.tolist(), times.tolist(), prices.tolist()))
+    i = 0
+    while i < len(rows):
+        product_id = rows[i][0]
+        j = i
+        while j < len(rows) and rows[j][0] == product_id:
+            j += 1
+        series = rows[i:j]
+        last_t, last_p = series[-1][1], series[-1][2]
+        ts = [(t - last_t) / 86400 for _, t, _ in series]
+        ps = [p for _, _, p in series]
+        n = len(ps)
+        ma7 = [p for t, p in zip(ts, ps) if t > -7]
+        mean_t, mean_p = sum(ts) / n, sum(ps) / n
+        sxx = sum((t - mean_t) ** 2 for t in ts)
+        slope = sum((t - mean_t) * (p - mean_p) for t, p in zip(ts, ps)) / sxx if sxx else 0.0
+        intercept = mean_p - slope * mean_t
+        returns = [math.log(b) - math.log(a) for a, b in zip(ps, ps[1:])]
+        drift = sum(returns) / len(returns)
+        vol = math.sqrt(sum((r - drift) ** 2 for r in returns) / (len(returns) - 1))
+        k = horizon_days / ((last_t - series[0][1]) / 86400 / len(returns))
+        z = (math.log(1 - drop_threshold) - k * drift) / (vol * math.sqrt(k))
+        out[product_id] = {
+            'ma_7d': sum(ma7) / len(ma7),
+            'forecast': intercept + slope * horizon_days,
+            'volatility': vol,
+            'drop_probability': 0.5 * (1 + math.erf(z / math.sqrt(2))),
+            'last_price': last_p,
+        }
+        i = j
+    return out
+
+def run(args) -> dict:
+    from backend.analytics import PriceSeries, analyze
+
+    ids, times, prices = _synthetic(args.products, args.points)
+    report = {'products': args.products, 'points_per_product': args.points, 'rows': len(prices)}
+
+    started = time.perf_counter()
+    series = PriceSeries(ids, times, prices)
+    stats = analyze(series, args.horizon_days, args.drop_threshold)
+    report['vectorized_seconds'] = round(time.perf_counter() - started, 3)
+
+    cut = args.naive_products * args.points
+    started = time.perf_counter()
+    reference = naive(ids[:cut], times[:cut], prices[:cut], args.horizon_days, args.drop_threshold)
+    naive_seconds = time.perf_counter() - started
+    report['naive_seconds'] = round(naive_seconds, 3)
+    report['naive_products'] = args.naive_products
+    report['naive_extrapolated_seconds'] = round(naive_seconds * args.products / args.naive_products, 2)
+    report['speedup'] = round(report['naive_extrapolated_seconds'] / report['vectorized_seconds'], 1)
+
+    worst = {}
+    for name in ('ma_7d', 'forecast', 'volatility', 'drop_probability', 'last_price'):
+        expected = np.array([reference[i + 1][name] for i in range(args.naive_products)])
+        actual = stats[name][:args.naive_products]
+        worst[name] = float(np.max(np.abs(actual - expected) / np.maximum(np.abs(expected), 1e-9)))
+    report['max_relative_difference'] = worst
+
+    if args.dir:
+        from sqlalchemy import create_engine
+        from backend.analytics import load_series_sync
+
+        engine = create_engine(f"sqlite:///{os.path.join(args.dir, 'pricepulse.db')}")
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            loaded = load_series_sync(conn, days=args.days)
+        load_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        analyze(loaded, args.horizon_days, args.drop_threshold)
+        report['database'] = {
+            'products': len(loaded), 'rows': len(loaded.prices),
+            'load_seconds': round(load_seconds, 3),
+            'analyze_seconds': round(time.perf_counter() - started, 3),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--points', type=int, default=60)
+    parser.add_argument('--naive-products', type=int, default=2000)
+    parser.add_argument('--horizon-days', type=float, default=7.0)
+    parser.add_argument('--drop-threshold', type=float, default=0.05)
+    parser.add_argument('--dir', help='datagen directory whose pricepulse.db to load')
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(run(args), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Firebase ID token verification with and without the verified-token cache.
+
+    python -m backend.benchmarks.auth_tokens --users 50 --requests 5000
+
+Mints tokens with a locally generated key served by FirebaseCertsStub, then
+replays dashboard-like traffic (each user sends many requests with the same
+token) through auth.verify_token_cached, once with the cache cleared before
+every request and once with it warm. Also checks that tampered, expired,
+wrong-audience and future auth_time tokens are rejected, and that tokens
+with unknown key ids do not each refetch the keys.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import jwt
+
+from backend.benchmarks.report import summarize, write_report
+from backend.benchmarks.stubs import FirebaseCertsStub
+
+async def _replay(auth, tokens, requests: int, keys, project_id: str, cached: bool) -> dict:
+    rng = random.Random(0)
+    auth.clear_token_cache()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        token = rng.choice(tokens)
+        if not cached:
+            auth.clear_token_cache()
+        t0 = time.perf_counter()
+        await auth.verify_token_cached(token, project_id, keys)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+async def _rejected(auth, token: str, keys, project_id: str) -> bool:
+    try:
+        await auth.verify_token_cached(token, project_id, keys)
+    except jwt.InvalidTokenError:
+        return True
+    return False
+
+async def run(args) -> dict:
+    stub = FirebaseCertsStub()
+    url = await stub.start()
+
+    from backend import auth
+
+    keys = auth.FirebaseKeySet(url)
+    tokens = [stub.mint(f'user{i}@example.com') for i in range(args.users)]
+
+    report = {'users': args.users, 'requests': args.requests}
+    report['uncached'] = await _replay(auth, tokens, args.requests, keys, stub.project_id, cached=False)
+    report['cached'] = await _replay(auth, tokens, args.requests, keys, stub.project_id, cached=True)
+    report['key_fetches'] = stub.requests
+
+    good = tokens[0]
+    tampered = good[:-4] + ('AAAA' if not good.endswith('AAAA') else 'BBBB')
+    report['rejects'] = {
+        'tampered': await _rejected(auth, tampered, keys, stub.project_id),
+        'expired': await _rejected(auth, stub.mint('old@example.com', lifetime=-60), keys, stub.project_id),
+        'wrong_audience': await _rejected(auth, stub.mint('x@example.com', aud='other'), keys, stub.project_id),
+        'future_auth_time': await _rejected(
+            auth, stub.mint('x@example.com', auth_time=int(time.time()) + 3600), keys, stub.project_id),
+    }
+    # Tokens with unknown kids refetch the keys at most once per UNKNOWN_KID_REFETCH_SECONDS
+    fetches = stub.requests
+    unknown = [stub.mint(f'x{i}@example.com', kid=f'unknown{i}') for i in range(100)]
+    report['rejects']['unknown_kid'] = all([await _rejected(auth, token, keys, stub.project_id) for token in unknown])
+    report['unknown_kid_key_fetches'] = stub.requests - fetches
+    report['stats'] = auth.get_auth_stats()
+    await stub.stop()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(asyncio.run(run(args)), args.output)
+
+if __name__ == '__main__':
+    main()
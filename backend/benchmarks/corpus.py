@@ -0,0 +1,24 @@
+"""Saved Amazon product pages replayed by the offline benchmarks."""
+import glob
+import os
+from typing import List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The page the scraper last saved for debugging seeds the corpus; more pages
+# can be dropped into benchmarks/corpus/ as <ASIN>.html
+SEED_PAGE = os.path.join(BACKEND_DIR, 'debug_page.html')
+CORPUS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'corpus')
+
+def load_corpus() -> List[Tuple[str, bytes]]:
+    """Return (name, raw html) for every saved page."""
+    pages = []
+    if os.path.exists(SEED_PAGE):
+        with open(SEED_PAGE, 'rb') as f:
+            pages.append((os.path.basename(SEED_PAGE), f.read()))
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.html'))):
+        with open(path, 'rb') as f:
+            pages.append((os.path.basename(path), f.read()))
+    if not pages:
+        raise FileNotFoundError(f"No saved pages found at {SEED_PAGE} or {CORPUS_DIR}")
+    return pages
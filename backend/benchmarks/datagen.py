@@ -0,0 +1,145 @@
+"""
+Populate prices.db and pricepulse.db with synthetic products and history.
+
+    python -m backend.benchmarks.datagen --dir /tmp/pp-load --products 100000 --days 730
+
+Products use the same URLs as the replay benchmark so /track and /compare
+can scrape them from ScrapingBeeStub. Prices follow a random walk with one
+point every `24 / points-per-day` hours, ending now.
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from backend.benchmarks.replay import product_url
+from backend.canonical import canonical_key
+
+CHUNK = 50000
+
+def _timestamp(value: datetime) -> str:
+    # Same text form sqlite3 and SQLAlchemy write for datetimes
+    return value.isoformat(sep=' ')
+
+def _product_rows(count: int, seed: int):
+    rng = random.Random(seed)
+    now = _timestamp(datetime.utcnow())
+    for i in range(count):
+        price = round(rng.uniform(5, 50000), 2)
+        url = product_url(i)
+        yield (i + 1, url, f'Synthetic product {i}', price,
+               f'https://m.media-amazon.com/images/I/{i}.jpg', now, canonical_key(url))
+
+def _history_rows(products: int, days: int, points_per_day: int, seed: int):
+    rng = random.Random(seed)
+    step = timedelta(hours=24 / points_per_day)
+    points = days * points_per_day
+    start = datetime.utcnow() - step * points
+    stamps = [_timestamp(start + step * n) for n in range(points)]
+    for product_id in range(1, products + 1):
+        price = rng.uniform(5, 50000)
+        for stamp in stamps:
+            price = max(1.0, price * (1 + rng.gauss(0, 0.01)))
+            yield (product_id, round(price, 2), stamp)
+
+# auth.get_current_user returns this identity when Firebase is not configured
+DEV_USER = 'dev@example.com'
+
+def _subscription_rows(products: int, users: int, per_user: int, seed: int):
+    rng = random.Random(seed)
+    now = _timestamp(datetime.utcnow())
+    per_user = min(per_user, products)
+    for n in range(users):
+        user = DEV_USER if n == 0 else f'user{n}@example.com'
+        for product_id in sorted(rng.sample(range(1, products + 1), per_user)):
+            yield (user, product_id, now)
+
+def _insert(conn: sqlite3.Connection, sql: str, rows) -> int:
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            conn.executemany(sql, chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        conn.executemany(sql, chunk)
+        total += len(chunk)
+    conn.commit()
+    return total
+
+def _bulk_connection(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    # Generated data can be recreated, so skip durability for speed
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    return conn
+
+def generate(directory: str, products: int, days: int, points_per_day: int,
+             users: int = 100, per_user: int = 200, seed: int = 1) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    prices_db = os.path.join(directory, 'prices.db')
+    pricepulse_db = os.path.join(directory, 'pricepulse.db')
+    for path in (prices_db, pricepulse_db):
+        if os.path.exists(path):
+            os.remove(path)
+    os.environ['PRICES_DB_PATH'] = prices_db
+    os.environ['DATABASE_URL'] = f'sqlite:///{pricepulse_db}'
+
+    logging.getLogger('apscheduler').setLevel(logging.WARNING)
+    # Importing the app modules creates both schemas at the paths above
+    with contextlib.redirect_stdout(io.StringIO()):
+        from backend import main, models  # noqa: F401
+    main.scheduler.shutdown(wait=False)
+    models.engine.dispose()
+
+    started = time.perf_counter()
+    report = {'directory': directory, 'products': products, 'days': days,
+              'points_per_day': points_per_day, 'users': users, 'products_per_user': per_user}
+
+    conn = _bulk_connection(prices_db)
+    _insert(conn, '''INSERT INTO products (id, url, name, current_price, image_url, last_updated, canonical_key)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''', _product_rows(products, seed))
+    report['history_rows'] = _insert(
+        conn, 'INSERT INTO price_history (product_id, price, timestamp) VALUES (?, ?, ?)',
+        _history_rows(products, days, points_per_day, seed))
+    conn.close()
+
+    conn = _bulk_connection(pricepulse_db)
+    _insert(conn, '''INSERT INTO products (id, amazon_url, name, current_price, image_url, created_at, canonical_key)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''', _product_rows(products, seed))
+    _insert(conn, 'INSERT INTO price_history (product_id, price, timestamp) VALUES (?, ?, ?)',
+            _history_rows(products, days, points_per_day, seed))
+    report['subscriptions'] = _insert(
+        conn, 'INSERT INTO subscriptions (user_id, product_id, created_at) VALUES (?, ?, ?)',
+        _subscription_rows(products, users, per_user, seed))
+    conn.close()
+
+    report['seconds'] = round(time.perf_counter() - started, 1)
+    report['size_mb'] = {
+        os.path.basename(path): round(os.path.getsize(path) / 1e6, 1)
+        for path in (prices_db, pricepulse_db)
+    }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', required=True, help='directory for the two database files')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--points-per-day', type=int, default=1)
+    parser.add_argument('--users', type=int, default=100, help=f'subscribers; the first is {DEV_USER}')
+    parser.add_argument('--products-per-user', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    print(generate(args.dir, args.products, args.days, args.points_per_day,
+                   args.users, args.products_per_user, args.seed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Concurrent ORM reads through the async engine versus the sync one.
+
+    python -m backend.benchmarks.db_async --dir /tmp/pp-load --requests 500 --concurrency 32
+
+Runs the price-history query of GET /products/{id}/price-history three ways:
+
+* sync_in_loop    - sync Session called straight from a coroutine, as the
+                    old `async def` handlers did; every query blocks the loop
+* sync_threadpool - sync Session in a worker thread, as for plain `def` handlers
+* async           - AsyncSession from backend.database
+
+A ticker coroutine measures how long the event loop stalls while each mode
+runs, which is what other requests on the same worker would wait for.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from backend.benchmarks.report import summarize, write_report
+
+async def _loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+async def _run_mode(query, products: int, requests: int, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    ids = [rng.randint(1, products) for _ in range(requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(product_id):
+        async with semaphore:
+            started = time.perf_counter()
+            await query(product_id)
+            latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    lag = asyncio.create_task(_loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(pid) for pid in ids))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    summary = summarize(latencies, elapsed)
+    summary['max_loop_stall_ms'] = round(await lag * 1000, 2)
+    return summary
+
+async def run(args) -> dict:
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(args.dir, 'pricepulse.db')}"
+    from sqlalchemy import func, select
+    from backend import models
+    from backend.database import AsyncSessionLocal, SessionLocal, async_engine, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+    with SessionLocal() as db:
+        products = db.scalar(select(func.max(models.Product.id))) or 0
+
+    def history_query(product_id):
+        start = datetime.utcnow() - timedelta(days=args.days)
+        return (
+            select(models.PriceHistory)
+            .where(models.PriceHistory.product_id == product_id)
+            .where(models.PriceHistory.timestamp >= start)
+            .order_by(models.PriceHistory.timestamp)
+        )
+
+    def sync_query(product_id):
+        with SessionLocal() as db:
+            return db.execute(history_query(product_id)).scalars().all()
+
+    async def sync_in_loop(product_id):
+        return sync_query(product_id)
+
+    async def sync_threadpool(product_id):
+        return await asyncio.to_thread(sync_query, product_id)
+
+    async def async_query(product_id):
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(history_query(product_id))).scalars().all()
+
+    report = {
+        'products': products,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'history_days': args.days,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'modes': {},
+    }
+    for name, query in (('sync_in_loop', sync_in_loop),
+                        ('sync_threadpool', sync_threadpool),
+                        ('async', async_query)):
+        report['modes'][name] = await _run_mode(query, products, args.requests, args.concurrency, args.seed)
+    await async_engine.dispose()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', required=True, help='directory populated by backend.benchmarks.datagen')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(asyncio.run(run(args)), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Memory and throughput of price-history export on a large database.
+
+    python -m backend.benchmarks.datagen --dir /tmp/pp-export --products 10000 --days 365
+    python -m backend.benchmarks.export --dir /tmp/pp-export
+
+Exports the whole price_history table of the generated pricepulse.db in each
+available format through backend.export (chunked, streamed to a file) and,
+for comparison, as CSV built from a single fetchall(). Reports rows/second,
+output size and the Python heap peak of each run.
+"""
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+from backend.benchmarks.report import measure_memory, write_report
+
+def _naive_csv(conn, path: str) -> int:
+    from backend.export import COLUMNS, export_query
+
+    rows = conn.execute(export_query()).all()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    writer.writerows((p, k, t.isoformat(), price) for p, k, t, price in rows)
+    data = buffer.getvalue().encode()
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+def run(args) -> dict:
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(args.dir, 'pricepulse.db')}"
+    from backend import export
+
+    engine = create_engine(os.environ['DATABASE_URL'])
+    with engine.connect() as conn:
+        rows = conn.execute(text('SELECT COUNT(*) FROM price_history')).scalar()
+    report = {'rows': rows, 'chunk_rows': args.chunk_rows, 'pyarrow_available': export.pa is not None}
+
+    formats = [f for f in export.EXPORT_FORMATS if export.supports(f)]
+    out_dir = tempfile.mkdtemp()
+    for format in formats:
+        path = os.path.join(out_dir, f'export.{format}')
+        result = {}
+        with measure_memory(result):
+            with engine.connect() as conn:
+                result['bytes'] = export.write_export(
+                    export.export_sync(conn, format, chunk_rows=args.chunk_rows), path
+                )
+        result['rows_per_sec'] = round(rows / result['wall_seconds'])
+        report[f'streamed_{format}'] = result
+        os.unlink(path)
+
+    if not args.skip_naive:
+        path = os.path.join(out_dir, 'naive.csv')
+        result = {}
+        with measure_memory(result):
+            with engine.connect() as conn:
+                result['bytes'] = _naive_csv(conn, path)
+        result['rows_per_sec'] = round(rows / result['wall_seconds'])
+        report['fetchall_csv'] = result
+        os.unlink(path)
+    os.rmdir(out_dir)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', required=True, help='datagen directory')
+    parser.add_argument('--chunk-rows', type=int, default=50000)
+    parser.add_argument('--skip-naive', action='store_true', help='skip the fetchall() baseline')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(run(args), args.output)
+
+if __name__ == '__main__':
+    main()
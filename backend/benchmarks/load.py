@@ -0,0 +1,142 @@
+"""
+In-process load test of the FastAPI endpoints against generated data.
+
+    python -m backend.benchmarks.datagen --dir /tmp/pp-load --products 100000
+    python -m backend.benchmarks.load --dir /tmp/pp-load --requests 500 --output run.json
+    python -m backend.benchmarks.load --dir /tmp/pp-load --compare run.json
+
+Requests go through httpx's ASGI transport, so no server or network is
+involved; scrapes triggered by /track and /compare hit ScrapingBeeStub.
+Results per endpoint are requests/sec and latency percentiles.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+
+import httpx
+
+from backend.benchmarks.datagen import DEV_USER
+from backend.benchmarks.replay import _drive, product_url
+from backend.benchmarks.report import max_rss_mb, write_report
+from backend.benchmarks.stubs import ScrapingBeeStub
+
+def _product_count(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT MAX(id) FROM products').fetchone()[0] or 0
+
+def endpoint_requests(client: httpx.AsyncClient, products: int, subscribed: int,
+                      history_days: int, rng: random.Random):
+    """Request factories keyed by the endpoint name used in the report."""
+    def product_id():
+        return rng.randint(1, products)
+
+    async def list_products(_):
+        response = await client.get('/products/', params={'skip': rng.randint(0, max(0, subscribed - 100)), 'limit': 100})
+        response.raise_for_status()
+
+    async def price_history(_):
+        response = await client.get(f'/products/{product_id()}/price-history', params={'days': history_days})
+        response.raise_for_status()
+
+    async def track(_):
+        response = await client.post('/track', json={'url': product_url(product_id() - 1)})
+        response.raise_for_status()
+
+    async def compare(_):
+        response = await client.get(f'/compare/{product_id()}')
+        response.raise_for_status()
+
+    return {
+        'GET /products/': list_products,
+        'GET /products/{id}/price-history': price_history,
+        'POST /track': track,
+        'GET /compare/{id}': compare,
+    }
+
+async def run(args) -> dict:
+    stub = ScrapingBeeStub(latency_ms=args.upstream_latency_ms)
+    os.environ['SCRAPINGBEE_API_URL'] = await stub.start()
+    os.environ['PRICES_DB_PATH'] = os.path.join(args.dir, 'prices.db')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(args.dir, 'pricepulse.db')}"
+    for name in ('backend.scraper', 'httpx', 'apscheduler'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from backend import main, scraper
+
+    products = _product_count(os.environ['PRICES_DB_PATH'])
+    with sqlite3.connect(os.environ['PRICES_DB_PATH']) as conn:
+        history_rows = conn.execute('SELECT COUNT(*) FROM price_history').fetchone()[0]
+    with sqlite3.connect(os.path.join(args.dir, 'pricepulse.db')) as conn:
+        # Products listed by GET /products/ for the development user
+        subscribed = conn.execute('SELECT COUNT(*) FROM subscriptions WHERE user_id = ?',
+                                  (DEV_USER,)).fetchone()[0]
+
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'products': products,
+        'history_rows': history_rows,
+        'requests_per_endpoint': args.requests,
+        'concurrency': args.concurrency,
+        'history_days': args.history_days,
+        'endpoints': {},
+    }
+
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://load', timeout=None) as client:
+        await scraper.scrape_amazon_product_async(product_url(0))
+        factories = endpoint_requests(client, products, subscribed, args.history_days, rng)
+        selected = args.endpoints.split(',') if args.endpoints else list(factories)
+        for name in selected:
+            with contextlib.redirect_stdout(io.StringIO()):
+                summary, _ = await _drive(factories[name], args.requests, args.concurrency)
+            report['endpoints'][name] = summary
+
+    report['max_rss_mb'] = round(max_rss_mb(), 1)
+    main.scheduler.shutdown(wait=False)
+    await scraper.close_http_session()
+    scraper.shutdown_parser_pool()
+    await stub.stop()
+    return report
+
+def compare(previous: dict, current: dict) -> dict:
+    """Relative change in throughput and p99 latency per endpoint."""
+    changes = {}
+    for name, now in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            'per_sec_change_pct': round((now['per_sec'] / before['per_sec'] - 1) * 100, 1) if before['per_sec'] else None,
+            'p99_change_pct': round((now['p99_ms'] / before['p99_ms'] - 1) * 100, 1) if before['p99_ms'] else None,
+        }
+    return changes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', required=True, help='directory populated by backend.benchmarks.datagen')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--history-days', type=int, default=365)
+    parser.add_argument('--endpoints', help='comma-separated subset of endpoint names')
+    parser.add_argument('--upstream-latency-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--compare', help='earlier JSON report to compare against')
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as f:
+            report['compared_to'] = {'file': args.compare, 'changes': compare(json.load(f), report)}
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Parse throughput of scraper.parse_product_bytes against worker count.
+
+    python -m backend.benchmarks.parse_throughput --pages 64 --workers 1,2,4
+
+Each run parses the saved corpus round-robin in a fresh process pool and
+reports pages per second; `inline` is the single-process baseline.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.benchmarks.corpus import load_corpus
+from backend.scraper import parse_product_bytes
+
+def _quiet_logging():
+    logging.getLogger('backend.scraper').setLevel(logging.WARNING)
+
+def _parse_all(pages, pool=None):
+    started = time.perf_counter()
+    if pool is None:
+        results = [parse_product_bytes(html, name) for name, html in pages]
+    else:
+        names = [name for name, _ in pages]
+        results = list(pool.map(parse_product_bytes, [html for _, html in pages], names))
+    elapsed = time.perf_counter() - started
+    parsed = sum(1 for info, _, _ in results if info['current_price'])
+    return elapsed, parsed
+
+def run(total_pages: int, worker_counts):
+    _quiet_logging()
+    corpus = load_corpus()
+    pages = [corpus[i % len(corpus)] for i in range(total_pages)]
+    report = {
+        'corpus_pages': len(corpus),
+        'pages': total_pages,
+        'mb_per_page': round(sum(len(html) for _, html in corpus) / len(corpus) / 1e6, 2),
+        'cpu_count': os.cpu_count(),
+        'runs': {},
+    }
+
+    elapsed, parsed = _parse_all(pages)
+    report['runs']['inline'] = {
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(total_pages / elapsed, 2),
+        'parsed': parsed,
+    }
+
+    for workers in worker_counts:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_quiet_logging
+        ) as pool:
+            # Warm up so worker start-up and imports are not timed
+            list(pool.map(parse_product_bytes, [pages[0][1]] * workers, [pages[0][0]] * workers))
+            elapsed, parsed = _parse_all(pages, pool)
+        report['runs'][f'{workers}_workers'] = {
+            'seconds': round(elapsed, 3),
+            'pages_per_sec': round(total_pages / elapsed, 2),
+            'speedup': round(report['runs']['inline']['seconds'] / elapsed, 2),
+            'parsed': parsed,
+        }
+    return report
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, cpus} & set(range(1, cpus + 1)))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=32)
+    parser.add_argument('--workers', default=','.join(map(str, default_workers)))
+    args = parser.parse_args()
+    worker_counts = [int(w) for w in args.workers.split(',') if w]
+    print(json.dumps(run(args.pages, worker_counts), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Refresh-cycle pricing through SP-API batches versus per-product scraping.
+
+    python -m backend.benchmarks.price_source --products 200 --rate 5
+
+Prices the replay benchmark's synthetic products with FakeSPAPI (batched,
+rate limited, token cached) and with ScrapingBeeStub, reporting upstream
+requests and wall time for each. A share of ASINs can be left unpriced by
+the fake to exercise the scraping fallback, and a last cycle against a
+fake that never answers in time checks every product is still scraped.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import yaml
+
+from backend.benchmarks.replay import product_url
+from backend.benchmarks.report import write_report
+from backend.benchmarks.stubs import FakeSPAPI, ScrapingBeeStub
+
+async def run(args) -> dict:
+    urls = [product_url(i) for i in range(args.products)]
+    unpriced = {url.rsplit('/', 1)[1] for url in urls[:int(args.products * args.unpriced)]}
+    fake = FakeSPAPI(rate=args.rate, burst=args.burst, unpriced=unpriced)
+    base = await fake.start()
+    stub = ScrapingBeeStub()
+    os.environ['SCRAPINGBEE_API_URL'] = await stub.start()
+    logging.getLogger('backend.scraper').setLevel(logging.WARNING)
+
+    config = {
+        'credentials': {'refresh_token': 'fake', 'lwa_app_id': 'fake', 'lwa_client_secret': 'fake'},
+        'endpoints': {'na': base, 'eu': base, 'fe': base},
+        'pricing': {'enabled': True, 'lwa_token_url': f'{base}/auth/o2/token',
+                    'batch_size': 20, 'requests_per_second': args.rate, 'burst': args.burst},
+    }
+    config_file = tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False)
+    yaml.safe_dump(config, config_file)
+    config_file.close()
+    os.environ['AMAZON_CONFIG_PATH'] = config_file.name
+
+    from backend import price_sources, scraper
+
+    report = {'products': args.products, 'unpriced_by_sp_api': len(unpriced), 'cycles': args.cycles}
+
+    started = time.perf_counter()
+    for _ in range(args.cycles):
+        prices = await price_sources.fetch_current_prices(urls)
+    report['sp_api'] = {
+        'seconds': round(time.perf_counter() - started, 3),
+        'priced': sum(1 for p in prices.values() if p),
+        'pricing_requests': fake.pricing_requests,
+        'throttled': fake.throttled,
+        'tokens_issued': fake.tokens_issued,
+        'fallback_scrapes': stub.requests,
+    }
+
+    # SP-API timing out on every batch: the cycle must fall back, not fail
+    timeout_source = price_sources.SPAPIPriceSource({
+        **config, 'pricing': {**config['pricing'], 'timeout_seconds': 0.2, 'requests_per_second': 1000}
+    })
+    price_sources._sp_api_source = timeout_source
+    fake.delay_seconds = 1.0
+    scraped_before = stub.requests
+    prices = await price_sources.fetch_current_prices(urls)
+    fake.delay_seconds = 0.0
+    price_sources._sp_api_source = None
+    report['sp_api_timeout'] = {
+        'priced': sum(1 for p in prices.values() if p),
+        'fallback_scrapes': stub.requests - scraped_before,
+        'all_scraped': stub.requests - scraped_before == len(urls),
+    }
+
+    scraped_before = stub.requests
+    started = time.perf_counter()
+    for _ in range(args.cycles):
+        prices = await price_sources.ScrapingPriceSource().get_prices(urls)
+    report['scraping'] = {
+        'seconds': round(time.perf_counter() - started, 3),
+        'priced': sum(1 for p in prices.values() if p),
+        'scrapes': stub.requests - scraped_before,
+    }
+
+    await scraper.close_http_session()
+    scraper.shutdown_parser_pool()
+    await stub.stop()
+    await fake.stop()
+    os.unlink(config_file.name)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--cycles', type=int, default=1)
+    parser.add_argument('--rate', type=float, default=0.5, help='fake SP-API requests/second')
+    parser.add_argument('--burst', type=int, default=1)
+    parser.add_argument('--unpriced', type=float, default=0.05,
+                        help='fraction of ASINs the fake SP-API cannot price')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(asyncio.run(run(args)), args.output)
+
+if __name__ == '__main__':
+    main()
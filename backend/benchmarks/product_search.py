@@ -0,0 +1,233 @@
+"""
+Product search latency at catalog scale: FTS5 index versus LIKE scans.
+
+    python -m backend.benchmarks.product_search --products 1000000
+
+Fills a temporary SQLite database with synthetic products (brand, adjective,
+noun and model code names, random ASINs) all subscribed to by one user,
+builds the product_search index, then times search_products() for several
+query shapes, deep keyset pages versus OFFSET, the LIKE substring scan it
+replaces, and inserts and renames with the sync triggers in place.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import string
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from backend.benchmarks.report import summarize, write_report
+
+BRANDS = ['sony', 'samsung', 'philips', 'bosch', 'logitech', 'anker', 'lenovo', 'dell', 'canon',
+          'nikon', 'puma', 'adidas', 'prestige', 'havells', 'bajaj', 'boat', 'jbl', 'xiaomi', 'asus', 'hp']
+ADJECTIVES = ['wireless', 'portable', 'stainless', 'smart', 'compact', 'ergonomic', 'waterproof',
+              'rechargeable', 'digital', 'premium', 'classic', 'ultra', 'mini', 'pro', 'heavy']
+USER = 'bench@example.com'
+
+NOUNS = ['headphones', 'speaker', 'blender', 'kettle', 'mouse', 'keyboard', 'charger', 'camera',
+         'trimmer', 'backpack', 'shoes', 'monitor', 'router', 'lamp', 'bottle', 'watch', 'fan', 'iron']
+
+def _asin(rng: random.Random) -> str:
+    return 'B0' + ''.join(rng.choices(string.ascii_uppercase + string.digits, k=8))
+
+def _name(rng: random.Random) -> str:
+    model = rng.choice(string.ascii_uppercase) + str(rng.randint(100, 99999))
+    return f"{rng.choice(BRANDS).title()} {rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()} {model}"
+
+def build(path: str, products: int, seed: int = 0):
+    """Products table shaped like the ORM's; returns the ASINs and some names."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE products (id INTEGER PRIMARY KEY, amazon_url VARCHAR, name VARCHAR,
+                    image_url VARCHAR, current_price FLOAT, canonical_key VARCHAR UNIQUE)''')
+    conn.execute('''CREATE TABLE subscriptions (id INTEGER PRIMARY KEY, user_id VARCHAR NOT NULL,
+                    product_id INTEGER, created_at DATETIME, UNIQUE (user_id, product_id))''')
+    asins, names = [], []
+    for start in range(0, products, 50000):
+        rows = []
+        for _ in range(min(50000, products - start)):
+            asin = _asin(rng)
+            name = _name(rng)
+            asins.append(asin)
+            if len(asins) % 1000 == 0:
+                names.append(name)
+            rows.append((f"https://www.amazon.com/dp/{asin}", name, None,
+                         round(rng.uniform(5, 2000), 2), f"amazon.com:{asin}"))
+        conn.executemany('INSERT INTO products (amazon_url, name, image_url, current_price, canonical_key) '
+                         'VALUES (?, ?, ?, ?, ?)', rows)
+    conn.execute('INSERT INTO subscriptions (user_id, product_id) SELECT ?, id FROM products', (USER,))
+    conn.commit()
+    conn.close()
+    return asins, names
+
+async def _time_queries(session_factory, queries, limit: int, repeat: int) -> dict:
+    from backend.product_search import search_products
+
+    report = {}
+    async with session_factory() as db:
+        for label, query in queries:
+            latencies, hits = [], 0
+            started = time.perf_counter()
+            for _ in range(repeat):
+                began = time.perf_counter()
+                page = await search_products(db, USER, query, limit)
+                latencies.append(time.perf_counter() - began)
+                hits = len(page['items'])
+            report[label] = {'query': query, 'page_items': hits,
+                             **summarize(latencies, time.perf_counter() - started)}
+    return report
+
+async def _deep_pages(session_factory, query: str, limit: int, pages: int) -> dict:
+    from backend.product_search import SEARCH_SQL, match_query, search_products
+
+    async with session_factory() as db:
+        cursor, keyset_ids, last_page_seconds = None, [], 0.0
+        for _ in range(pages):
+            began = time.perf_counter()
+            page = await search_products(db, USER, query, limit, cursor)
+            last_page_seconds = time.perf_counter() - began
+            keyset_ids += [item['id'] for item in page['items']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        offset_sql = SEARCH_SQL.format(after='') + ' OFFSET :offset'
+        began = time.perf_counter()
+        result = await db.execute(text(offset_sql), {
+            'user_id': USER, 'match': match_query(query), 'limit': limit,
+            'offset': (pages - 1) * limit
+        })
+        offset_ids = [row.id for row in result.all()]
+        offset_seconds = time.perf_counter() - began
+        began = time.perf_counter()
+        result = await db.execute(text(SEARCH_SQL.format(after='')), {
+            'user_id': USER, 'match': match_query(query), 'limit': pages * limit
+        })
+        all_ids = [row.id for row in result.all()]
+    return {
+        'query': query, 'pages': pages,
+        'keyset_last_page_ms': round(last_page_seconds * 1000, 2),
+        'offset_last_page_ms': round(offset_seconds * 1000, 2),
+        'keyset_matches_single_query': keyset_ids == all_ids,
+        'offset_matches_keyset': offset_ids == keyset_ids[-limit:],
+    }
+
+def _like_scan(path: str, queries, limit: int, repeat: int) -> dict:
+    from backend.product_search import LIKE_SQL
+
+    engine = create_engine(f"sqlite:///{path}")
+    report = {}
+    with engine.connect() as conn:
+        for label, query in queries:
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(repeat):
+                began = time.perf_counter()
+                conn.execute(text(LIKE_SQL), {'user_id': USER, 'pattern': f"%{query.lower()}%",
+                                              'asin_pattern': f"%:%{query.lower()}%",
+                                              'after_id': 0, 'limit': limit}).all()
+                latencies.append(time.perf_counter() - began)
+            report[label] = summarize(latencies, time.perf_counter() - started)
+    engine.dispose()
+    return report
+
+def _write_rates(conn: sqlite3.Connection, count: int, rng: random.Random) -> dict:
+    top = conn.execute('SELECT MAX(id) FROM products').fetchone()[0]
+    rates = {}
+    with conn:
+        started = time.perf_counter()
+        for _ in range(count):
+            asin = _asin(rng)
+            conn.execute('INSERT INTO products (amazon_url, name, current_price, canonical_key) '
+                         'VALUES (?, ?, ?, ?)',
+                         (f"https://www.amazon.com/dp/{asin}", _name(rng), 10.0, f"amazon.com:{asin}"))
+        rates['insert_per_sec'] = round(count / (time.perf_counter() - started))
+        started = time.perf_counter()
+        for _ in range(count):
+            conn.execute('UPDATE products SET name = ? WHERE id = ?', (_name(rng), rng.randint(1, top)))
+        rates['rename_per_sec'] = round(count / (time.perf_counter() - started))
+        started = time.perf_counter()
+        for _ in range(count):
+            # Price refreshes rewrite the unchanged name, which the trigger skips
+            conn.execute('UPDATE products SET name = name, current_price = ? WHERE id = ?',
+                         (rng.uniform(5, 2000), rng.randint(1, top)))
+        rates['price_refresh_per_sec'] = round(count / (time.perf_counter() - started))
+    return rates
+
+def _writes(path: str, count: int) -> dict:
+    """Write rates in one transaction (no fsync per row), with the triggers and without."""
+    conn = sqlite3.connect(path)
+    report = {'count': count, 'with_index': _write_rates(conn, count, random.Random(1))}
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        conn.execute(f'DROP TRIGGER {name}')
+    report['without_index'] = _write_rates(conn, count, random.Random(2))
+    conn.close()
+    return report
+
+def run(args) -> dict:
+    from backend.product_search import create_search_index
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'search.db')
+    try:
+        started = time.perf_counter()
+        asins, names = build(path, args.products)
+        report = {'products': args.products, 'generate_seconds': round(time.perf_counter() - started, 1)}
+
+        engine = create_engine(f"sqlite:///{path}")
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            create_search_index(conn)
+        report['index_build_seconds'] = round(time.perf_counter() - started, 1)
+        with engine.connect() as conn:
+            try:
+                report['index_mb'] = round(conn.execute(text(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'product_search%'"
+                )).scalar() / 1e6, 1)
+            except Exception:
+                pass
+        engine.dispose()
+
+        rng = random.Random(2)
+        queries = [
+            ('brand', rng.choice(BRANDS)),
+            ('two_word_prefix', f"{rng.choice(BRANDS)[:4]} {rng.choice(NOUNS)[:4]}"),
+            ('short_prefix', rng.choice(NOUNS)[:2]),
+            ('model_code', rng.choice(names).split()[-1]),
+            ('asin_prefix', rng.choice(asins)[:7]),
+            ('full_asin', rng.choice(asins)),
+        ]
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        session_factory = lambda: AsyncSession(async_engine)
+
+        async def timed():
+            first = await _time_queries(session_factory, queries, args.limit, args.repeat)
+            deep = await _deep_pages(session_factory, queries[0][1], args.limit, args.pages)
+            await async_engine.dispose()
+            return first, deep
+
+        report['fts_first_page'], report['deep_pages'] = asyncio.run(timed())
+        report['like_first_page'] = _like_scan(path, queries, args.limit, max(1, args.repeat // 10))
+        report['writes'] = _writes(path, args.writes)
+    finally:
+        shutil.rmtree(directory)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--writes', type=int, default=20000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(run(args), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Offline replay of the scrape -> store -> history path.
+
+    python -m backend.benchmarks.replay --products 200 --concurrency 16 --cycles 2
+
+Saved product pages are served by ScrapingBeeStub in place of ScrapingBee,
+and both databases live in a temporary directory. The phases are:
+
+* track    - POST /track (scrape, save_product_info, history) per product
+* products - POST /products/ through the SQLAlchemy router
+* history  - GET /products/{id}/price-history for every ORM product
+* refresh  - main.update_all_prices and scheduler.update_product_prices
+
+Each phase reports throughput, p50/p90/p99 latency and peak memory.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+import httpx
+
+from backend.benchmarks.report import measure_memory, summarize, write_report
+from backend.benchmarks.stubs import ScrapingBeeStub
+
+def product_url(index: int) -> str:
+    """URL of the index-th synthetic product; ASINs are unique per index."""
+    return f'https://www.amazon.com/dp/B0RPL{index:05d}'
+
+async def _drive(request, count: int, concurrency: int):
+    """Run request(i) for i in range(count), at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    results = [None] * count
+
+    async def one(index):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                results[index] = await request(index)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return summarize(latencies, time.perf_counter() - started, errors), results
+
+async def _phase(report, name, request, count, concurrency):
+    result = {}
+    with measure_memory(result), contextlib.redirect_stdout(io.StringIO()):
+        summary, results = await _drive(request, count, concurrency)
+    summary.update(result)
+    report['phases'][name] = summary
+    return results
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='pricepulse-replay-')
+    stub = ScrapingBeeStub(latency_ms=args.upstream_latency_ms)
+    os.environ['SCRAPINGBEE_API_URL'] = await stub.start()
+    os.environ['PRICES_DB_PATH'] = os.path.join(workdir, 'prices.db')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'pricepulse.db')}"
+    for name in ('backend.scraper', 'httpx', 'apscheduler'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    # Imported late so the modules pick up the environment above
+    with contextlib.redirect_stdout(io.StringIO()):
+        from backend import main, scheduler, scraper
+
+    report = {
+        'products': args.products,
+        'concurrency': args.concurrency,
+        'cycles': args.cycles,
+        'upstream_latency_ms': args.upstream_latency_ms,
+        'corpus_pages': len(stub.pages),
+        'workdir': workdir,
+        'phases': {},
+    }
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://replay', timeout=None) as client:
+        # Warm the parser pool so process start-up is not timed
+        await scraper.scrape_amazon_product_async(product_url(args.products))
+
+        async def track(i):
+            response = await client.post('/track', json={'url': product_url(i)})
+            response.raise_for_status()
+            return response.json()['product']['id']
+
+        async def create(i):
+            response = await client.post('/products/', json={'url': product_url(i)})
+            response.raise_for_status()
+            return response.json()['id']
+
+        await _phase(report, 'track', track, args.products, args.concurrency)
+        product_ids = await _phase(report, 'products', create, args.products, args.concurrency)
+        product_ids = [pid for pid in product_ids if pid is not None]
+
+        async def history(i):
+            response = await client.get(f'/products/{product_ids[i]}/price-history')
+            response.raise_for_status()
+            return len(response.json())
+
+        await _phase(report, 'history', history, len(product_ids), args.concurrency)
+
+    async def refresh(_):
+        await main.update_all_prices()
+        await scheduler.update_product_prices()
+
+    await _phase(report, 'refresh', refresh, args.cycles, 1)
+    report['phases']['refresh']['products_per_sec'] = round(
+        2 * args.products * args.cycles / report['phases']['refresh']['seconds'], 2
+    )
+
+    with sqlite3.connect(os.environ['PRICES_DB_PATH']) as conn:
+        report['price_history_rows'] = conn.execute('SELECT COUNT(*) FROM price_history').fetchone()[0]
+    report['upstream_requests'] = stub.requests
+    report['scrape_tiers'] = scraper.get_scrape_stats()
+
+    main.scheduler.shutdown(wait=False)
+    await scraper.close_http_session()
+    scraper.shutdown_parser_pool()
+    await stub.stop()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--cycles', type=int, default=1, help='scheduler refresh cycles')
+    parser.add_argument('--upstream-latency-ms', type=float, default=0.0,
+                        help='delay added by the ScrapingBee stub per request')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    write_report(asyncio.run(run(args)), args.output)
+
+if __name__ == '__main__':
+    main()
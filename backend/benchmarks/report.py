@@ -0,0 +1,58 @@
+"""Timing and memory summaries shared by the benchmarks."""
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `samples`."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict:
+    """Throughput and latency percentiles (ms) for one benchmark phase."""
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'per_sec': round(count / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+@contextmanager
+def measure_memory(result: Dict):
+    """Record the traced Python heap peak of the block into `result`."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield result
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['wall_seconds'] = round(time.perf_counter() - started, 3)
+        result['peak_traced_mb'] = round(peak / 1e6, 2)
+        result['max_rss_mb'] = round(max_rss_mb(), 1)
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+
+def write_report(report: Dict, output: Optional[str] = None):
+    """Print the report and optionally save it as JSON for later comparison."""
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
@@ -0,0 +1,73 @@
+"""
+Bytes and time per price-history response, by encoder, format and encoding.
+
+    python -m backend.benchmarks.serialization --points 10000
+
+Compares the previous path (Pydantic validation of ORM rows through
+List[PriceHistoryBase], jsonable_encoder, stdlib json) with the orjson path
+in backend.responses, in row and columnar form, uncompressed, gzip and
+brotli (when the brotli package is installed).
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from starlette.requests import Request
+
+from backend import responses
+from backend.benchmarks.report import write_report
+from backend.schemas import PriceHistoryBase
+
+def _request(accept_encoding: str) -> Request:
+    headers = [(b'accept-encoding', accept_encoding.encode())] if accept_encoding else []
+    return Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': headers})
+
+def _time(fn, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, round(best * 1000, 3)
+
+def run(args) -> dict:
+    start = datetime(2024, 1, 1)
+    rows = [(round(999 + (i % 37) * 0.5, 2), start + timedelta(minutes=30 * i)) for i in range(args.points)]
+    orm_rows = [SimpleNamespace(price=price, timestamp=timestamp) for price, timestamp in rows]
+    adapter = TypeAdapter(List[PriceHistoryBase])
+
+    def pydantic_path() -> bytes:
+        validated = adapter.validate_python(orm_rows, from_attributes=True)
+        return json.dumps(jsonable_encoder(validated)).encode()
+
+    encodings = ['', 'gzip'] + (['br'] if responses.brotli is not None else [])
+    report = {'points': args.points, 'repeat': args.repeat, 'brotli_available': responses.brotli is not None}
+
+    body, ms = _time(pydantic_path, args.repeat)
+    report['pydantic_rows'] = {'bytes': len(body), 'ms': ms}
+
+    for format in responses.HISTORY_FORMATS:
+        for encoding in encodings:
+            request = _request(encoding)
+            response, ms = _time(
+                lambda: responses.fast_json_response(request, responses.history_payload(rows, format)),
+                args.repeat
+            )
+            report[f'orjson_{format}_{encoding or "identity"}'] = {'bytes': len(response.body), 'ms': ms}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(run(args), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Chart reads from the binary series store versus SQLite price_history.
+
+    python -m backend.benchmarks.datagen --dir /tmp/pp-series --products 2000 --days 730 --points-per-day 4
+    python -m backend.benchmarks.series_store --dir /tmp/pp-series
+
+Builds a series store from the datagen pricepulse.db in a temporary
+directory, then times /products/{id}/price-history bodies for random
+products both ways (query or slice, payload, orjson encoding) over several
+`days` windows and both formats, and compares bytes per point. SQLite is
+timed with the schema as created by the models; --with-index adds an index
+on (product_id, timestamp) first.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from sqlalchemy import create_engine, text
+
+from backend.benchmarks.report import summarize, write_report
+
+HISTORY_SQL = text('''
+    SELECT price, timestamp FROM price_history
+    WHERE product_id = :product_id AND timestamp >= :start
+    ORDER BY timestamp
+''')
+
+def _sqlite_bytes(conn) -> int:
+    """Pages used by price_history and its indexes, or the file size without dbstat."""
+    try:
+        return conn.execute(text('''
+            SELECT SUM(pgsize) FROM dbstat
+            WHERE name = 'price_history' OR name IN (
+                SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'price_history')
+        ''')).scalar()
+    except Exception:
+        return os.path.getsize(conn.engine.url.database)
+
+def run(args) -> dict:
+    from backend.responses import epoch_seconds, history_payload
+    from backend.series_store import SeriesStore, rebuild_store, series_payload
+
+    engine = create_engine(f"sqlite:///{os.path.join(args.dir, 'pricepulse.db')}")
+    store_dir = tempfile.mkdtemp()
+    store = SeriesStore(store_dir)
+    report = {}
+    try:
+        with engine.begin() as conn:
+            if args.with_index:
+                conn.execute(text(
+                    'CREATE INDEX IF NOT EXISTS ix_price_history_product_time ON price_history (product_id, timestamp)'
+                ))
+            started = time.perf_counter()
+            report['store'] = rebuild_store(conn, store)
+            report['rebuild_seconds'] = round(time.perf_counter() - started, 2)
+            sqlite_bytes = _sqlite_bytes(conn)
+            product_ids = conn.execute(text('SELECT DISTINCT product_id FROM price_history')).scalars().all()
+
+        points = report['store']['points']
+        store_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(store_dir) for name in names if name.endswith('.pts')
+        )
+        report['bytes_per_point'] = {
+            'sqlite': round(sqlite_bytes / points, 1),
+            'store': round(store_bytes / points, 1),
+        }
+
+        rng = random.Random(0)
+        sample = [rng.choice(product_ids) for _ in range(args.reads)]
+        now = datetime.utcnow()
+        with engine.connect() as conn:
+            for days in args.days:
+                start = now - timedelta(days=days)
+                # Same text form the stored timestamps use
+                params = {'start': start.isoformat(sep=' ')}
+                for format in ('columnar', 'rows'):
+                    timings = {'sqlite': [], 'store': []}
+                    sizes = {'sqlite': 0, 'store': 0}
+                    for product_id in sample:
+                        began = time.perf_counter()
+                        rows = conn.execute(HISTORY_SQL, {**params, 'product_id': product_id}).all()
+                        body = orjson.dumps(history_payload(rows, format))
+                        timings['sqlite'].append(time.perf_counter() - began)
+                        sizes['sqlite'] += len(body)
+
+                        began = time.perf_counter()
+                        times, prices = store.read(product_id, start=epoch_seconds(start))
+                        body = orjson.dumps(series_payload(times, prices, format),
+                                            option=orjson.OPT_SERIALIZE_NUMPY)
+                        timings['store'].append(time.perf_counter() - began)
+                        sizes['store'] += len(body)
+                    elapsed = {name: sum(values) for name, values in timings.items()}
+                    report[f'{days}d_{format}'] = {
+                        name: {**summarize(values, elapsed[name]), 'avg_body_bytes': sizes[name] // len(sample)}
+                        for name, values in timings.items()
+                    }
+    finally:
+        shutil.rmtree(store_dir)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', required=True, help='datagen directory')
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365, 730])
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--with-index', action='store_true',
+                        help='index price_history (product_id, timestamp) before timing SQLite')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(run(args), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""Local stand-ins for upstream services, so benchmarks run without network."""
+import asyncio
+import re
+import socket
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from backend.benchmarks.corpus import load_corpus
+
+class ScrapingBeeStub:
+    """
+    Serves saved product pages in place of the ScrapingBee HTML API.
+
+    A request for a URL whose ASIN matches a corpus file named <ASIN>.html
+    gets that page; any other ASIN gets a corpus page chosen by hashing the
+    ASIN, so repeat scrapes of a product always see the same page.
+
+    `max_concurrent` answers 429 beyond that many in-flight requests, like a
+    plan's concurrency limit, and `fail_status` is returned to every request
+    while `failing` is set, to simulate an outage.
+    """
+
+    def __init__(self, pages: Optional[List[Tuple[str, bytes]]] = None, latency_ms: float = 0.0,
+                 max_concurrent: Optional[int] = None, fail_status: int = 500):
+        self.pages = pages or load_corpus()
+        self.by_asin: Dict[str, bytes] = {
+            name[:-len('.html')]: html for name, html in self.pages if name.endswith('.html')
+        }
+        self.latency = latency_ms / 1000
+        self.max_concurrent = max_concurrent
+        self.fail_status = fail_status
+        self.failing = False
+        self.in_flight = 0
+        self.requests = 0
+        self.rejected = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = None
+
+    def page_for(self, target_url: str) -> bytes:
+        match = re.search(r'/(?:dp|gp/product)/([A-Z0-9]{10})', target_url)
+        asin = match.group(1) if match else target_url
+        if asin in self.by_asin:
+            return self.by_asin[asin]
+        return self.pages[zlib.crc32(asin.encode()) % len(self.pages)][1]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.failing:
+            self.rejected += 1
+            return web.Response(status=self.fail_status, text='upstream error')
+        if self.max_concurrent is not None and self.in_flight >= self.max_concurrent:
+            self.rejected += 1
+            return web.Response(status=429, text='too many concurrent requests')
+        self.in_flight += 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        if 'url' not in request.query:
+            return web.Response(status=400, text='missing url')
+        return web.Response(body=self.page_for(request.query['url']), content_type='text/html')
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving and return the API URL to use as SCRAPINGBEE_API_URL."""
+        app = web.Application()
+        app.router.add_get('/api/v1/', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((host, port))
+        await web.SockSite(self._runner, sock).start()
+        self.url = f'http://{host}:{sock.getsockname()[1]}/api/v1/'
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+class FakeSPAPI:
+    """
+    Login with Amazon token endpoint plus the SP-API competitive pricing
+    operation, enforcing the operation's 20-ASIN limit and rate limit.
+
+    Prices are derived from the ASIN so repeated runs agree; ASINs listed in
+    `unpriced` come back with a ClientError status, as for unknown products.
+    Pricing responses are held back `delay_seconds` to simulate a hung API.
+    """
+
+    def __init__(self, rate: float = 0.5, burst: int = 1, unpriced: Optional[set] = None):
+        self.rate = rate
+        self.burst = burst
+        self.unpriced = unpriced or set()
+        self.delay_seconds = 0.0
+        self.tokens_issued = 0
+        self.pricing_requests = 0
+        self.throttled = 0
+        self._issued = set()
+        self._bucket = float(burst)
+        self._bucket_updated = 0.0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = None
+
+    def price_for(self, asin: str) -> float:
+        return round(5 + zlib.crc32(asin.encode()) % 100000 / 10, 2)
+
+    async def token(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        if form.get('grant_type') != 'refresh_token' or not form.get('refresh_token'):
+            return web.json_response({'error': 'invalid_grant'}, status=400)
+        self.tokens_issued += 1
+        token = f'Atza|fake-{self.tokens_issued}'
+        self._issued.add(token)
+        return web.json_response({'access_token': token, 'token_type': 'bearer', 'expires_in': 3600})
+
+    def _take(self) -> bool:
+        now = asyncio.get_running_loop().time()
+        if self._bucket_updated:
+            self._bucket = min(self.burst, self._bucket + (now - self._bucket_updated) * self.rate)
+        self._bucket_updated = now
+        if self._bucket >= 1:
+            self._bucket -= 1
+            return True
+        return False
+
+    async def competitive_price(self, request: web.Request) -> web.Response:
+        if self.delay_seconds:
+            await asyncio.sleep(self.delay_seconds)
+        if request.headers.get('x-amz-access-token') not in self._issued:
+            return web.json_response({'errors': [{'code': 'Unauthorized'}]}, status=403)
+        if not self._take():
+            self.throttled += 1
+            return web.json_response({'errors': [{'code': 'QuotaExceeded'}]}, status=429,
+                                     headers={'x-amzn-RateLimit-Limit': str(self.rate)})
+        asins = [a for a in request.query.get('Asins', '').split(',') if a]
+        if not asins or len(asins) > 20:
+            return web.json_response({'errors': [{'code': 'InvalidInput'}]}, status=400)
+        self.pricing_requests += 1
+        payload = []
+        for asin in asins:
+            if asin in self.unpriced:
+                payload.append({'status': 'ClientError', 'ASIN': asin})
+                continue
+            amount = self.price_for(asin)
+            payload.append({
+                'status': 'Success',
+                'ASIN': asin,
+                'Product': {'CompetitivePricing': {'CompetitivePrices': [{
+                    'CompetitivePriceId': '1',
+                    'condition': 'New',
+                    'Price': {
+                        'LandedPrice': {'CurrencyCode': 'USD', 'Amount': amount},
+                        'ListingPrice': {'CurrencyCode': 'USD', 'Amount': amount},
+                    },
+                }]}},
+            })
+        return web.json_response({'payload': payload})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving and return the base URL for endpoints and lwa_token_url."""
+        app = web.Application()
+        app.router.add_post('/auth/o2/token', self.token)
+        app.router.add_get('/products/pricing/v0/competitivePrice', self.competitive_price)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((host, port))
+        await web.SockSite(self._runner, sock).start()
+        self.url = f'http://{host}:{sock.getsockname()[1]}'
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+class FirebaseCertsStub:
+    """
+    Serves a locally generated signing certificate in the format of Google's
+    securetoken certificate endpoint, and mints ID tokens signed with it.
+    """
+
+    def __init__(self, project_id: str = 'pricepulse-bench', max_age: int = 3600):
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+        import datetime
+
+        self.project_id = project_id
+        self.max_age = max_age
+        self.kid = 'bench-key'
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'securetoken.system.gserviceaccount.com')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(self.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        self.cert_pem = cert.public_bytes(serialization.Encoding.PEM).decode()
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = None
+
+    def mint(self, email: str, lifetime: int = 3600, kid: Optional[str] = None, **overrides) -> str:
+        import time
+        import jwt
+
+        now = int(time.time())
+        claims = {
+            'iss': f'https://securetoken.google.com/{self.project_id}',
+            'aud': self.project_id,
+            'sub': email,
+            'email': email,
+            'iat': now,
+            'auth_time': now,
+            'exp': now + lifetime,
+        }
+        claims.update(overrides)
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': kid or self.kid})
+
+    async def certs(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.json_response(
+            {self.kid: self.cert_pem},
+            headers={'Cache-Control': f'public, max-age={self.max_age}'}
+        )
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving and return the URL to use as FIREBASE_CERTS_URL."""
+        app = web.Application()
+        app.router.add_get('/certs', self.certs)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((host, port))
+        await web.SockSite(self._runner, sock).start()
+        self.url = f'http://{host}:{sock.getsockname()[1]}/certs'
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
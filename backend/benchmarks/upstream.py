@@ -0,0 +1,124 @@
+"""
+Scheduled scraping against a throttling and failing ScrapingBee.
+
+    python -m backend.benchmarks.upstream --products 200 --plan-limit 5
+
+Runs one refresh cycle against a ScrapingBeeStub that answers 429 above
+--plan-limit concurrent requests, reporting how the adaptive limit settles,
+how many requests were throttled and how many products were priced. A second
+cycle starts with the stub failing every request for --outage seconds, to
+show the circuit opening, probing and the cycle resuming once it closes.
+Finally checks that scrapes failing on our side (a session raising
+RuntimeError) never count against ScrapingBee or open the circuit.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+
+from backend.benchmarks.replay import product_url
+from backend.benchmarks.report import write_report
+from backend.benchmarks.stubs import ScrapingBeeStub
+
+async def _cycle(stub: ScrapingBeeStub, urls, price_sources, scraper) -> dict:
+    guard = scraper.get_upstream_guard()
+    requests_before, rejected_before = stub.requests, stub.rejected
+    limits = []
+
+    async def sample():
+        while True:
+            limits.append(guard.limiter.limit)
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    prices = await price_sources.ScrapingPriceSource().get_prices(urls)
+    seconds = time.perf_counter() - started
+    sampler.cancel()
+    return {
+        'seconds': round(seconds, 3),
+        'priced': sum(1 for p in prices.values() if p),
+        'requests': stub.requests - requests_before,
+        'upstream_errors': stub.rejected - rejected_before,
+        'concurrency_limit_mean': round(sum(limits) / len(limits), 2) if limits else None,
+        'upstream_state': guard.state(),
+    }
+
+async def _internal_errors(scraper, urls) -> dict:
+    """Scrapes whose session raises a non-network error, against a hair-trigger breaker."""
+    guard = scraper.UpstreamGuard('scrapingbee', {'min_requests': 3, 'window': 5})
+    scraper._upstream_guard = guard
+
+    class BrokenSession:
+        def get(self, *args, **kwargs):
+            raise RuntimeError('bug in request setup')
+
+    async def broken_session():
+        return BrokenSession()
+
+    get_session = scraper._get_http_session
+    scraper._get_http_session = broken_session
+    try:
+        results = Counter()
+        for url in urls[:10]:
+            results[(await scraper.scrape_amazon_product_async(url))['error']] += 1
+    finally:
+        scraper._get_http_session = get_session
+    state = guard.state()
+    return {
+        'results': dict(results),
+        'upstream_state': state,
+        'breaker_untouched': state['circuit'] == 'closed' and state['outcomes']['failed'] == 0
+                             and state['in_flight'] == 0,
+    }
+
+async def run(args) -> dict:
+    urls = [product_url(i) for i in range(args.products)]
+    stub = ScrapingBeeStub(latency_ms=args.latency_ms, max_concurrent=args.plan_limit)
+    os.environ['SCRAPINGBEE_API_URL'] = await stub.start()
+    logging.getLogger('backend.scraper').setLevel(logging.CRITICAL)
+
+    from backend import price_sources, scraper
+
+    config = scraper.load_scraping_config()
+    upstream = dict(config.get('upstream') or {})
+    # Short cool-down so the outage phase finishes quickly
+    upstream['open_seconds'] = args.open_seconds
+    scraper._upstream_guard = scraper.UpstreamGuard('scrapingbee', upstream)
+
+    report = {'products': args.products, 'plan_limit': args.plan_limit, 'latency_ms': args.latency_ms}
+    report['throttled_cycle'] = await _cycle(stub, urls, price_sources, scraper)
+
+    async def outage():
+        stub.failing = True
+        await asyncio.sleep(args.outage)
+        stub.failing = False
+
+    # Forget learned tiers so the outage cycle scrapes from scratch
+    scraper._asin_tiers.clear()
+    outage_task = asyncio.create_task(outage())
+    report['outage_cycle'] = await _cycle(stub, urls, price_sources, scraper)
+    report['outage_cycle']['outage_seconds'] = args.outage
+    await outage_task
+
+    report['internal_errors'] = await _internal_errors(scraper, urls)
+    await scraper.close_http_session()
+    scraper.shutdown_parser_pool()
+    await stub.stop()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--plan-limit', type=int, default=5, help='stub concurrency before 429s')
+    parser.add_argument('--latency-ms', type=float, default=1000.0)
+    parser.add_argument('--outage', type=float, default=3.0, help='seconds the stub fails every request')
+    parser.add_argument('--open-seconds', type=float, default=1.0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    write_report(asyncio.run(run(args)), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import re
+from typing import Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# Amazon storefront domains; the domain identifies the marketplace
+MARKETPLACE_DOMAINS = {
+    'amazon.com', 'amazon.ca', 'amazon.com.mx', 'amazon.com.br',
+    'amazon.co.uk', 'amazon.de', 'amazon.fr', 'amazon.it', 'amazon.es',
+    'amazon.nl', 'amazon.se', 'amazon.pl', 'amazon.com.be', 'amazon.com.tr',
+    'amazon.ae', 'amazon.sa', 'amazon.eg', 'amazon.in',
+    'amazon.co.jp', 'amazon.com.au', 'amazon.sg',
+}
+
+# Path forms that carry an ASIN: /dp/, /gp/product/, /gp/aw/d/, /exec/obidos/ASIN/, /o/ASIN/
+ASIN_PATH_PATTERN = re.compile(
+    r'/(?:dp|gp/product|gp/aw/d|exec/obidos/asin|o/asin)/([A-Z0-9]{10})(?:[/?]|$)',
+    re.IGNORECASE
+)
+
+def parse_amazon_url(url: str) -> Optional[Tuple[str, str]]:
+    """Return (ASIN, marketplace domain) for an Amazon product URL, or None."""
+    parsed = urlparse(url.strip() if '://' in url else f'https://{url.strip()}')
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    elif host.startswith('smile.') or host.startswith('m.'):
+        host = host.split('.', 1)[1]
+    if host not in MARKETPLACE_DOMAINS:
+        return None
+
+    match = ASIN_PATH_PATTERN.search(parsed.path)
+    if match:
+        return match.group(1).upper(), host
+
+    asin = parse_qs(parsed.query).get('asin', [None])[0]
+    if asin and re.fullmatch(r'[A-Za-z0-9]{10}', asin):
+        return asin.upper(), host
+    return None
+
+def canonical_key(url: str) -> Optional[str]:
+    """Identity of a product across URL variants, e.g. 'amazon.in:B0CHFM8N75'."""
+    parsed = parse_amazon_url(url)
+    if not parsed:
+        return None
+    asin, marketplace = parsed
+    return f'{marketplace}:{asin}'
+
+def canonical_url(url: str) -> Optional[str]:
+    """Tracking-free product URL for the same ASIN and marketplace."""
+    parsed = parse_amazon_url(url)
+    if not parsed:
+        return None
+    asin, marketplace = parsed
+    return f'https://www.{marketplace}/dp/{asin}'
@@ -1,14 +1,57 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+import os
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./pricepulse.db"
+# Drivers used for each backend; DATABASE_URL may name either form
+SYNC_DRIVERS = {"sqlite": "sqlite", "postgresql": "postgresql"}
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _with_driver(url: str, drivers: dict) -> str:
+    parsed = make_url(url.replace("postgres://", "postgresql://", 1))
+    backend = parsed.get_backend_name()
+    if backend not in drivers:
+        return url
+    return parsed.set(drivername=drivers[backend]).render_as_string(hide_password=False)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./pricepulse.db")
+SQLALCHEMY_DATABASE_URL = _with_driver(DATABASE_URL, SYNC_DRIVERS)
+ASYNC_DATABASE_URL = _with_driver(DATABASE_URL, ASYNC_DRIVERS)
+
+# Connection pool sizing, per engine. Ignored for in-memory SQLite.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def _engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False}}
+        if parsed.database in (None, "", ":memory:"):
+            return options
+        # SQLAlchemy 2.0 gives aiosqlite file databases a NullPool, which
+        # rejects the sizing options below; pool them like the sync engine
+        async_driver = parsed.get_driver_name() == "aiosqlite"
+        options["poolclass"] = AsyncAdaptedQueuePool if async_driver else QueuePool
+    else:
+        options = {"pool_pre_ping": True}
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return options
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Used by the router, scheduler and alert checks so queries don't block the event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -16,4 +59,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
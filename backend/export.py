@@ -0,0 +1,190 @@
+"""
+Bulk export of price history as CSV, Parquet or Arrow IPC.
+
+Rows are read through a server-side cursor in chunks of CHUNK_ROWS and each
+chunk is encoded and handed to the client before the next is fetched, so
+memory stays flat however many rows are exported. Parquet and Arrow need
+pyarrow; CSV does not. Offline exports of the whole database:
+
+    python -m backend.export --format parquet --output history.parquet
+"""
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+
+from backend.database import AsyncSessionLocal
+from backend.models import PriceHistory, Product, Subscription
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # CSV only
+    pa = pq = None
+
+CHUNK_ROWS = 50000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+COLUMNS = ('product_id', 'canonical_key', 'timestamp', 'price')
+
+def supports(format: str) -> bool:
+    return format == 'csv' or (format in EXPORT_FORMATS and pa is not None)
+
+def export_query(product_ids: Optional[Sequence[int]] = None, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, user_id: Optional[str] = None):
+    """History rows matching the filters, in insertion order; only the
+    products `user_id` tracks when given."""
+    query = (
+        select(PriceHistory.product_id, Product.canonical_key, PriceHistory.timestamp, PriceHistory.price)
+        .join(Product, Product.id == PriceHistory.product_id)
+        .order_by(PriceHistory.id)
+    )
+    if user_id is not None:
+        query = query.join(
+            Subscription,
+            (Subscription.product_id == PriceHistory.product_id) & (Subscription.user_id == user_id)
+        )
+    if product_ids:
+        query = query.where(PriceHistory.product_id.in_(list(product_ids)))
+    if start is not None:
+        query = query.where(PriceHistory.timestamp >= start)
+    if end is not None:
+        query = query.where(PriceHistory.timestamp < end)
+    return query
+
+def _arrow_schema():
+    return pa.schema([
+        ('product_id', pa.int64()),
+        ('canonical_key', pa.string()),
+        ('timestamp', pa.timestamp('us')),
+        ('price', pa.float64()),
+    ])
+
+def _record_batch(rows: List):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, _arrow_schema())],
+        schema=_arrow_schema()
+    )
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects bytes until drained, for streaming writers."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+class _Encoder:
+    """Turns chunks of rows into bytes for one export format."""
+
+    def __init__(self, format: str):
+        if format != 'csv' and pa is None:
+            raise RuntimeError(f"{format} export requires pyarrow")
+        self.format = format
+        self.sink = _ChunkSink()
+        self.writer = None
+
+    def header(self) -> bytes:
+        if self.format == 'csv':
+            return (','.join(COLUMNS) + '\r\n').encode()
+        if self.format == 'parquet':
+            self.writer = pq.ParquetWriter(self.sink, _arrow_schema(), compression='zstd')
+        else:
+            self.writer = pa.ipc.new_stream(self.sink, _arrow_schema())
+        return self.sink.drain()
+
+    def chunk(self, rows: List) -> bytes:
+        if self.format == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(
+                (product_id, key, timestamp.isoformat() if timestamp else '', price)
+                for product_id, key, timestamp, price in rows
+            )
+            return buffer.getvalue().encode()
+        # For Parquet each chunk becomes one row group
+        self.writer.write_batch(_record_batch(rows))
+        return self.sink.drain()
+
+    def footer(self) -> bytes:
+        if self.writer is not None:
+            self.writer.close()
+        return self.sink.drain()
+
+async def stream_export(format: str, product_ids: Optional[Sequence[int]] = None,
+                        start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        chunk_rows: int = CHUNK_ROWS, user_id: Optional[str] = None) -> AsyncIterator[bytes]:
+    """Encoded export, chunk by chunk, for a StreamingResponse."""
+    encoder = _Encoder(format)
+    yield encoder.header()
+    # Own session: request-scoped dependencies close before the body is sent
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            export_query(product_ids, start, end, user_id).execution_options(yield_per=chunk_rows)
+        )
+        async for rows in result.partitions(chunk_rows):
+            yield encoder.chunk(rows)
+    yield encoder.footer()
+
+def export_sync(conn: Connection, format: str, product_ids: Optional[Sequence[int]] = None,
+                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """stream_export() over a synchronous connection."""
+    encoder = _Encoder(format)
+    yield encoder.header()
+    result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(
+        export_query(product_ids, start, end)
+    )
+    for rows in result.partitions(chunk_rows):
+        yield encoder.chunk(rows)
+    yield encoder.footer()
+
+def write_export(chunks: Iterable[bytes], path: str) -> int:
+    """Write an export to `path`; returns bytes written."""
+    written = 0
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+if __name__ == '__main__':
+    import argparse
+    from backend.database import engine
+
+    parser = argparse.ArgumentParser(description='Export price history')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--product-id', type=int, action='append', dest='product_ids')
+    parser.add_argument('--start', type=datetime.fromisoformat)
+    parser.add_argument('--end', type=datetime.fromisoformat)
+    args = parser.parse_args()
+    with engine.connect() as conn:
+        size = write_export(
+            export_sync(conn, args.format, args.product_ids, args.start, args.end), args.output
+        )
+    print(f"Wrote {size} bytes to {args.output}")
@@ -1,7 +1,7 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Literal, Optional
 import requests
 from bs4 import BeautifulSoup
 import re
@@ -13,7 +13,8 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from dotenv import load_dotenv
 from backend.routes import router
-from backend.scheduler import start_scheduler
+from backend.database import AsyncSessionLocal
+from backend.scheduler import load_alert_index as load_orm_alert_index, start_scheduler
 import time
 import random
 from selenium import webdriver
@@ -24,10 +25,25 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 import aiohttp
-from backend.scraper import scrape_amazon_product
+from backend.alert_index import (
+    ACTIVE_ALERTS_SQL, ALL_TIME_LOW, LOWS_SQL, PERCENT_DROP, TARGET, AlertIndex, alert_threshold
+)
+from backend.auth import get_auth_stats, start_key_refresh, stop_key_refresh
+from backend.canonical import canonical_key, canonical_url
+from backend.responses import HISTORY_FORMATS, fast_json_response, history_payload
+from backend.migrations import migrate_prices_db
+from backend.price_sources import fetch_current_prices
+from backend.price_stats import record_price
+from backend.scraper import (
+    scrape_amazon_product_async, get_scrape_stats, get_selector_stats,
+    get_upstream_state, shutdown_parser_pool, close_http_session, UPSTREAM_FAILING, SCRAPER_ERROR
+)
 
 load_dotenv()
 
+# SQLite file backing /track, /alerts and /compare
+DB_PATH = os.getenv("PRICES_DB_PATH", "prices.db")
+
 app = FastAPI(title="PricePulse API")
 
 app.add_middleware(
@@ -46,7 +62,9 @@ class ProductURL(BaseModel):
 class AlertRequest(BaseModel):
     url: str
     email: EmailStr
-    target_price: float
+    alert_type: Literal['target', 'percent_drop', 'all_time_low'] = 'target'
+    target_price: Optional[float] = None
+    percent_drop: Optional[float] = Field(None, gt=0, lt=100)
 
 class PriceComparisonResponse(BaseModel):
     flipkart: Optional[dict] = None
@@ -97,7 +115,7 @@ email_conf = ConnectionConfig(
 fastmail = FastMail(email_conf)
 
 def init_db():
-    conn = sqlite3.connect('prices.db')
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
     # Drop the existing price_comparisons table if it exists
@@ -109,7 +127,8 @@ def init_db():
                   name TEXT,
                   current_price REAL,
                   image_url TEXT,
-                  last_updated TIMESTAMP)''')
+                  last_updated TIMESTAMP,
+                  canonical_key TEXT)''')
     
     c.execute('''CREATE TABLE IF NOT EXISTS price_history
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -124,6 +143,9 @@ def init_db():
                   email TEXT,
                   target_price REAL,
                   created_at TIMESTAMP,
+                  alert_type TEXT DEFAULT 'target',
+                  percent_drop REAL,
+                  reference_price REAL,
                   FOREIGN KEY (product_id) REFERENCES products (id))''')
     
     c.execute('''CREATE TABLE IF NOT EXISTS price_comparisons
@@ -138,42 +160,104 @@ def init_db():
                   timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                   FOREIGN KEY (product_id) REFERENCES products (id))''')
     
+    # Summary statistics maintained by backend.price_stats
+    c.execute('''CREATE TABLE IF NOT EXISTS price_stats
+                 (product_id INTEGER PRIMARY KEY,
+                  current_price REAL,
+                  previous_price REAL,
+                  min_price REAL,
+                  min_at TIMESTAMP,
+                  max_price REAL,
+                  samples INTEGER DEFAULT 0,
+                  first_seen TIMESTAMP,
+                  last_seen TIMESTAMP,
+                  last_change_at TIMESTAMP,
+                  FOREIGN KEY (product_id) REFERENCES products (id))''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS price_daily
+                 (product_id INTEGER,
+                  day TEXT,
+                  price_sum REAL NOT NULL,
+                  samples INTEGER NOT NULL,
+                  PRIMARY KEY (product_id, day),
+                  FOREIGN KEY (product_id) REFERENCES products (id))''')
+    
     conn.commit()
     conn.close()
 
+    # Backfill canonical keys and merge URL variants of the same product
+    print(f"Canonical key migration: {migrate_prices_db(DB_PATH)}")  # Debug log
+
 init_db()
 
-def extract_product_info(url: str):
-    # Extract product ID from URL
-    product_id = re.search(r'/dp/([A-Z0-9]{10})', url)
-    if not product_id:
+# Active alerts by product and threshold, and the alerts triggered since the
+# last check_price_alerts() run
+price_alert_index = AlertIndex()
+pending_alert_ids = set()
+
+# SQLite's default limit on bound parameters is 999
+ALERT_BATCH_SIZE = 500
+
+def load_alert_index():
+    """Rebuild price_alert_index, queueing alerts the current prices already meet."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    try:
+        alerts = c.execute(ACTIVE_ALERTS_SQL).fetchall()
+        price_alert_index.rebuild(alerts, c.execute(LOWS_SQL).fetchall())
+        c.execute('SELECT id, current_price FROM products WHERE current_price IS NOT NULL')
+        for product_id, current_price in c.fetchall():
+            pending_alert_ids.update(price_alert_index.observe(product_id, current_price))
+        print(f"Loaded {len(price_alert_index)} price alerts, {len(pending_alert_ids)} triggered")  # Debug log
+    finally:
+        conn.close()
+
+load_alert_index()
+
+async def extract_product_info(url: str):
+    # Extract ASIN and marketplace from URL
+    product_key = canonical_key(url)
+    if not product_key:
         raise HTTPException(status_code=400, detail="Invalid Amazon product URL")
     
-    product_id = product_id.group(1)
-    print(f"Extracted product ID: {product_id}")  # Debug log
+    print(f"Extracted product key: {product_key}")  # Debug log
     
     try:
-        # Use ScrapingBee for scraping
-        product_info = scrape_amazon_product(url)
+        # Use ScrapingBee for scraping, without tracking parameters
+        product_info = await scrape_amazon_product_async(canonical_url(url))
         
+        if product_info.get('error') == UPSTREAM_FAILING:
+            # ScrapingBee is throttling or down; the product itself may be fine
+            state = get_upstream_state()
+            raise HTTPException(
+                status_code=503,
+                detail="Price source temporarily unavailable, try again shortly",
+                headers={"Retry-After": str(max(1, int(state['retry_after_s'])))}
+            )
+        if product_info.get('error') == SCRAPER_ERROR:
+            raise HTTPException(status_code=500, detail="Scraper error, see server logs")
         if not product_info['name'] or not product_info['current_price']:
             raise HTTPException(status_code=400, detail="Could not extract product information")
         
+        product_info.pop('error', None)
         return product_info
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error extracting product info: {str(e)}")  # Debug log
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 def save_product_info(url: str, product_info: dict):
-    conn = sqlite3.connect('prices.db')
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
     try:
         print(f"Saving product info: {product_info}")  # Debug log
         
-        # First check if product exists
-        c.execute('SELECT id FROM products WHERE url = ?', (url,))
+        # First check if product exists, under any URL variant
+        product_key = canonical_key(url)
+        c.execute('SELECT id FROM products WHERE canonical_key = ?', (product_key,))
         result = c.fetchone()
         
         if result:
@@ -183,21 +267,25 @@ def save_product_info(url: str, product_info: dict):
                         SET name = ?, current_price = ?, image_url = ?, last_updated = ?
                         WHERE id = ?''',
                      (product_info['name'], product_info['current_price'],
-                      product_info['image_url'], datetime.now(), product_id))
+                      product_info['image_url'], datetime.utcnow(), product_id))
         else:
             print("Creating new product")  # Debug log
-            c.execute('''INSERT INTO products (url, name, current_price, image_url, last_updated)
-                        VALUES (?, ?, ?, ?, ?)''',
-                     (url, product_info['name'], product_info['current_price'],
-                      product_info['image_url'], datetime.now()))
+            c.execute('''INSERT INTO products (url, name, current_price, image_url, last_updated, canonical_key)
+                        VALUES (?, ?, ?, ?, ?, ?)''',
+                     (canonical_url(url) or url, product_info['name'], product_info['current_price'],
+                      product_info['image_url'], datetime.utcnow(), product_key))
             product_id = c.lastrowid
         
         # Add price to history
+        now = datetime.utcnow()
         c.execute('''INSERT INTO price_history (product_id, price, timestamp)
                     VALUES (?, ?, ?)''',
-                 (product_id, product_info['current_price'], datetime.now()))
+                 (product_id, product_info['current_price'], now))
+        record_price(c, product_id, product_info['current_price'], now)
         
         conn.commit()
+        if product_info['current_price'] is not None:
+            pending_alert_ids.update(price_alert_index.observe(product_id, product_info['current_price']))
         return product_id
     except sqlite3.Error as e:
         print(f"Database error: {str(e)}")  # Debug log
@@ -206,36 +294,48 @@ def save_product_info(url: str, product_info: dict):
     finally:
         conn.close()
 
-def get_price_history(product_id: int):
-    conn = sqlite3.connect('prices.db')
+def get_price_history(product_id: int, format: str = 'rows'):
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
     try:
         c.execute('''SELECT price, timestamp FROM price_history
                      WHERE product_id = ? ORDER BY timestamp DESC''', (product_id,))
-        history = [{'price': row[0], 'timestamp': row[1]} for row in c.fetchall()]
-        return history
+        return history_payload(c.fetchall(), format)
     except sqlite3.Error as e:
         print(f"Error fetching price history: {str(e)}")  # Debug log
-        return []  # Return empty list on error
+        return history_payload([], format)  # Return empty history on error
     finally:
         conn.close()
 
 async def check_price_alerts():
-    conn = sqlite3.connect('prices.db')
+    """Email the alerts price_alert_index reported as triggered, then delete them."""
+    if not pending_alert_ids:
+        return
+    alert_ids = list(pending_alert_ids)
+    pending_alert_ids.difference_update(alert_ids)
+    
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
     try:
-        c.execute('''
-            SELECT p.id, p.name, p.current_price, pa.email, pa.target_price
-            FROM products p
-            JOIN price_alerts pa ON p.id = pa.product_id
-            WHERE p.current_price <= pa.target_price
-        ''')
+        alerts = []
+        for i in range(0, len(alert_ids), ALERT_BATCH_SIZE):
+            batch = alert_ids[i:i + ALERT_BATCH_SIZE]
+            c.execute(f'''
+                SELECT pa.id, p.name, p.url, p.current_price, pa.email, pa.alert_type, pa.target_price
+                FROM price_alerts pa
+                JOIN products p ON p.id = pa.product_id
+                WHERE pa.id IN ({','.join('?' * len(batch))})
+            ''', batch)
+            alerts.extend(c.fetchall())
         
-        alerts = c.fetchall()
         for alert in alerts:
-            product_id, name, current_price, email, target_price = alert
+            alert_id, name, url, current_price, email, alert_type, target_price = alert
+            if alert_type == ALL_TIME_LOW:
+                reason = "which is its lowest price yet"
+            else:
+                reason = f"which is below your target price of ${target_price}"
             
             message = MessageSchema(
                 subject="Price Alert!",
@@ -243,49 +343,65 @@ async def check_price_alerts():
                 body=f"""
                 Price Alert for {name}!
                 
-                The price has dropped to ${current_price}, which is below your target price of ${target_price}.
+                The price has dropped to ${current_price}, {reason}.
                 
                 Check it out here: {url}
                 """,
                 subtype="html"
             )
             
-            await fastmail.send_message(message)
+            try:
+                await fastmail.send_message(message)
+            except Exception as e:
+                print(f"Error sending alert {alert_id}: {str(e)}")  # Debug log
+                pending_alert_ids.add(alert_id)  # Retry on the next run
+                continue
             
             # Remove the alert after sending
-            c.execute('DELETE FROM price_alerts WHERE product_id = ? AND email = ?',
-                     (product_id, email))
-        
-        conn.commit()
+            c.execute('DELETE FROM price_alerts WHERE id = ?', (alert_id,))
+            conn.commit()
+            price_alert_index.remove(alert_id)
     except Exception as e:
         print(f"Error checking price alerts: {str(e)}")
+        pending_alert_ids.update(alert_ids)
     finally:
         conn.close()
 
 async def update_all_prices():
-    conn = sqlite3.connect('prices.db')
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
     try:
         c.execute('SELECT id, url FROM products')
-        products = c.fetchall()
+        # Older rows may store URLs with tracking parameters; price the
+        # canonical form, which the SP-API ASIN lookup and result keys use
+        products = [(product_id, canonical_url(url) or url) for product_id, url in c.fetchall()]
+        
+        # SP-API in batches when configured, scraping for the rest
+        prices = await fetch_current_prices(url for _, url in products)
         
+        updated = []
         for product_id, url in products:
-            try:
-                product_info = extract_product_info(url)
-                c.execute('''UPDATE products 
-                            SET current_price = ?, last_updated = ?
-                            WHERE id = ?''',
-                         (product_info['current_price'], datetime.now(), product_id))
-                
-                c.execute('''INSERT INTO price_history (product_id, price, timestamp)
-                            VALUES (?, ?, ?)''',
-                         (product_id, product_info['current_price'], datetime.now()))
-                
-            except Exception as e:
-                print(f"Error updating product {product_id}: {str(e)}")
+            current_price = prices.get(url)
+            if not current_price:
+                print(f"Error updating product {product_id}: no price found")
+                continue
+            now = datetime.utcnow()
+            c.execute('''UPDATE products 
+                        SET current_price = ?, last_updated = ?
+                        WHERE id = ?''',
+                     (current_price, now, product_id))
+            
+            c.execute('''INSERT INTO price_history (product_id, price, timestamp)
+                        VALUES (?, ?, ?)''',
+                     (product_id, current_price, now))
+            record_price(c, product_id, current_price, now)
+            updated.append((product_id, current_price))
         
         conn.commit()
+        # Only committed prices move the index's lows and trigger alerts
+        for product_id, current_price in updated:
+            pending_alert_ids.update(price_alert_index.observe(product_id, current_price))
     except Exception as e:
         print(f"Error updating prices: {str(e)}")
     finally:
@@ -297,33 +413,38 @@ scheduler.add_job(check_price_alerts, 'interval', minutes=30)
 scheduler.start()
 
 @app.post("/track")
-async def track_product(product: ProductURL):
+async def track_product(
+    product: ProductURL,
+    request: Request,
+    format: str = Query('rows', pattern=f"^({'|'.join(HISTORY_FORMATS)})$")
+):
     try:
         print(f"Received URL: {product.url}")  # Debug log
         
-        # Extract product ID from URL
-        product_id = re.search(r'/dp/([A-Z0-9]{10})', product.url)
-        if not product_id:
+        # Extract ASIN and marketplace from URL
+        product_key = canonical_key(product.url)
+        if not product_key:
             print("Invalid URL format - no product ID found")  # Debug log
             raise HTTPException(status_code=400, detail="Invalid Amazon product URL")
         
-        product_id = product_id.group(1)
-        print(f"Extracted product ID: {product_id}")  # Debug log
+        print(f"Extracted product key: {product_key}")  # Debug log
         
         # Try to get real product info
         try:
-            product_info = extract_product_info(product.url)
+            product_info = await extract_product_info(product.url)
             print(f"Extracted product info: {product_info}")  # Debug log
             db_product_id = save_product_info(product.url, product_info)
-            price_history = get_price_history(db_product_id)
+            price_history = get_price_history(db_product_id, format)
             
             # Add product ID to the response
             product_info['id'] = db_product_id
             
-            return {
+            return fast_json_response(request, {
                 "product": product_info,
                 "price_history": price_history
-            }
+            })
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error scraping product: {str(e)}")  # Debug log
             raise HTTPException(status_code=500, detail=f"Failed to fetch product information: {str(e)}")
@@ -338,23 +459,58 @@ async def track_product(product: ProductURL):
 @app.post("/alerts")
 async def create_alert(alert: AlertRequest):
     try:
-        product_info = extract_product_info(alert.url)
+        if alert.alert_type == TARGET and alert.target_price is None:
+            raise HTTPException(status_code=422, detail="target_price is required for target alerts")
+        if alert.alert_type == PERCENT_DROP and alert.percent_drop is None:
+            raise HTTPException(status_code=422, detail="percent_drop is required for percent_drop alerts")
+        
+        product_info = await extract_product_info(alert.url)
         product_id = save_product_info(alert.url, product_info)
         
-        conn = sqlite3.connect('prices.db')
+        # Percent drops are stored as the target price they resolve to
+        reference_price = product_info['current_price']
+        if alert.alert_type == PERCENT_DROP and not reference_price:
+            raise HTTPException(status_code=422, detail="No current price to measure the drop from")
+        threshold = alert_threshold(alert.alert_type, alert.target_price, alert.percent_drop, reference_price)
+        
+        conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
         
-        c.execute('''INSERT INTO price_alerts (product_id, email, target_price, created_at)
-                     VALUES (?, ?, ?, ?)''',
-                  (product_id, alert.email, alert.target_price, datetime.now()))
+        c.execute('''INSERT INTO price_alerts (product_id, email, target_price, created_at,
+                                               alert_type, percent_drop, reference_price)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                  (product_id, alert.email, threshold, datetime.utcnow(),
+                   alert.alert_type, alert.percent_drop, reference_price))
+        alert_id = c.lastrowid
         
         conn.commit()
         conn.close()
         
+        price_alert_index.add(alert_id, product_id, threshold)
+        if threshold is not None and reference_price is not None and reference_price <= threshold:
+            pending_alert_ids.add(alert_id)
+        
         return {"message": "Price alert created successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.on_event("startup")
+async def startup_auth():
+    start_key_refresh()
+
+@app.on_event("startup")
+async def startup_alert_index():
+    async with AsyncSessionLocal() as db:
+        await load_orm_alert_index(db)
+
+@app.on_event("shutdown")
+async def shutdown_scraper():
+    await stop_key_refresh()
+    await close_http_session()
+    shutdown_parser_pool()
+
 @app.get("/")
 async def root():
     return {"message": "PricePulse API is running"}
@@ -363,12 +519,32 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/auth/stats")
+async def auth_stats():
+    """Verified-token cache hit rate and token verification time."""
+    return get_auth_stats()
+
+@app.get("/scraper/stats")
+async def scraper_stats():
+    """Per-tier scrape latency and ScrapingBee credits saved by tiering."""
+    return get_scrape_stats()
+
+@app.get("/scraper/upstream")
+async def scraper_upstream():
+    """ScrapingBee circuit state and current concurrency limit."""
+    return get_upstream_state()
+
+@app.get("/scraper/selectors")
+async def scraper_selectors():
+    """Hit rates of the learned price extraction strategies."""
+    return get_selector_stats()
+
 @app.get("/compare/{product_id}", response_model=PriceComparisonResponse)
 async def compare_prices(product_id: int):
     """Get price comparison from multiple platforms for a product."""
     try:
         # Get product from database
-        conn = sqlite3.connect('prices.db')
+        conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
         c.execute("SELECT url, name FROM products WHERE id = ?", (product_id,))
         product = c.fetchone()
@@ -379,7 +555,7 @@ async def compare_prices(product_id: int):
         url, name = product
         
         # Get product data
-        product_data = extract_product_info(url)
+        product_data = await extract_product_info(url)
         
         # Get multi-platform prices using OpenRouter
         price_comparison = await get_multi_platform_prices(product_data)
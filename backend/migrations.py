@@ -0,0 +1,286 @@
+"""
+In-place schema upgrades for existing databases.
+
+Both prices.db (main.py) and the SQLAlchemy database run these at startup;
+every step is idempotent, and one-off data conversions are recorded in
+schema_migrations so they never run twice. They can also be run by hand:
+
+    python -m backend.migrations
+"""
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from backend.canonical import canonical_key
+from backend.price_stats import rebuild_stats
+from backend.product_search import create_search_index
+from backend.series_store import rebuild_store, series_store, store_in_sync
+
+# Tables whose rows point at products.id and follow a merged product
+PRODUCT_CHILD_TABLES = ('price_history', 'price_alerts', 'price_comparisons', 'subscriptions')
+
+CANONICAL_KEY_INDEX = 'ix_products_canonical_key'
+
+# prices.db columns main.py wrote in server local time before switching to UTC
+LOCAL_TIME_COLUMNS = (
+    ('products', 'last_updated'),
+    ('price_history', 'timestamp'),
+    ('price_alerts', 'created_at'),
+)
+
+logger = logging.getLogger(__name__)
+
+# Names of the one-off conversions applied to a database
+MIGRATIONS_TABLE = 'schema_migrations'
+
+# Subscriber given every product tracked before subscriptions existed, when
+# products were listed for everyone. No default: without it those products
+# are left unlisted until it is set.
+LEGACY_PRODUCTS_OWNER = os.getenv('LEGACY_PRODUCTS_OWNER')
+
+def _add_column(conn: Connection, table: str, column: str, ddl_type: str):
+    columns = {c['name'] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+
+def _applied(conn: Connection, name: str) -> bool:
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (name VARCHAR PRIMARY KEY, applied_at TIMESTAMP)'
+    ))
+    return conn.execute(
+        text(f'SELECT 1 FROM {MIGRATIONS_TABLE} WHERE name = :name'), {'name': name}
+    ).first() is not None
+
+def _mark_applied(conn: Connection, name: str):
+    conn.execute(
+        text(f'INSERT INTO {MIGRATIONS_TABLE} (name, applied_at) VALUES (:name, :now)'),
+        {'name': name, 'now': datetime.utcnow()}
+    )
+
+def _merge_products(conn: Connection, keeper: int, duplicates: list):
+    """Move history, alerts and comparisons of `duplicates` onto `keeper`."""
+    existing = set(inspect(conn).get_table_names())
+    params = {'keeper': keeper, **{f'd{i}': d for i, d in enumerate(duplicates)}}
+    in_list = ', '.join(f':d{i}' for i in range(len(duplicates)))
+    if 'subscriptions' in existing:
+        # A user subscribed to two variants keeps a single subscription
+        conn.execute(text(f'''
+            DELETE FROM subscriptions WHERE product_id IN ({in_list}) AND user_id IN (
+                SELECT user_id FROM subscriptions WHERE product_id = :keeper
+            )'''), params)
+        conn.execute(text(f'''
+            DELETE FROM subscriptions WHERE product_id IN ({in_list}) AND id NOT IN (
+                SELECT MIN(id) FROM subscriptions WHERE product_id IN ({in_list}) GROUP BY user_id
+            )'''), params)
+    for table in PRODUCT_CHILD_TABLES:
+        if table in existing:
+            conn.execute(text(f'UPDATE {table} SET product_id = :keeper WHERE product_id IN ({in_list})'), params)
+    conn.execute(text(f'DELETE FROM products WHERE id IN ({in_list})'), params)
+    # Latest observed price wins once the histories are combined
+    if 'price_history' in existing:
+        conn.execute(text('''
+            UPDATE products SET current_price = (
+                SELECT price FROM price_history WHERE product_id = :keeper
+                ORDER BY timestamp DESC LIMIT 1
+            ) WHERE id = :keeper AND EXISTS (
+                SELECT 1 FROM price_history WHERE product_id = :keeper
+            )'''), {'keeper': keeper})
+
+def migrate_canonical_keys(engine: Engine, url_column: str) -> dict:
+    """
+    Give every product a canonical_key and merge rows that share one.
+
+    `url_column` is the column holding the product URL ('url' in prices.db,
+    'amazon_url' in the SQLAlchemy schema). The oldest row of each duplicate
+    group is kept. A unique index on canonical_key is created last.
+    """
+    merged = 0
+    with engine.begin() as conn:
+        if 'products' not in inspect(conn).get_table_names():
+            return {'backfilled': 0, 'merged': 0}
+        _add_column(conn, 'products', 'canonical_key', 'VARCHAR')
+
+        rows = conn.execute(text(
+            f'SELECT id, {url_column} FROM products WHERE canonical_key IS NULL'
+        )).fetchall()
+        updates = [
+            {'id': product_id, 'key': canonical_key(url)}
+            for product_id, url in rows if url and canonical_key(url)
+        ]
+        if updates:
+            conn.execute(text('UPDATE products SET canonical_key = :key WHERE id = :id'), updates)
+
+        groups = conn.execute(text('''
+            SELECT canonical_key FROM products
+            WHERE canonical_key IS NOT NULL
+            GROUP BY canonical_key HAVING COUNT(*) > 1
+        ''')).scalars().all()
+        for key in groups:
+            ids = conn.execute(
+                text('SELECT id FROM products WHERE canonical_key = :key ORDER BY id'), {'key': key}
+            ).scalars().all()
+            _merge_products(conn, ids[0], ids[1:])
+            merged += len(ids) - 1
+
+        conn.execute(text(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS {CANONICAL_KEY_INDEX} ON products (canonical_key)'
+        ))
+    return {'backfilled': len(updates), 'merged': merged}
+
+def migrate_utc_timestamps(engine: Engine) -> int:
+    """
+    Convert the local-time timestamps main.py stored before it wrote UTC, once;
+    SQLite's 'utc' modifier applies the offset in effect at each row's time.
+    Returns the rows converted.
+    """
+    name = 'utc_timestamps'
+    with engine.begin() as conn:
+        tables = set(inspect(conn).get_table_names())
+        if _applied(conn, name):
+            return 0
+        converted = 0
+        for table, column in LOCAL_TIME_COLUMNS:
+            if table in tables:
+                converted += conn.execute(text(
+                    f"UPDATE {table} SET {column} = strftime('%Y-%m-%d %H:%M:%f', {column}, 'utc') "
+                    f"WHERE datetime({column}) IS NOT NULL"
+                )).rowcount
+        _mark_applied(conn, name)
+        return converted
+
+def migrate_price_stats(engine: Engine, merged: int) -> dict:
+    """Build price_stats from history if it is empty, or products were merged
+    or timestamps converted."""
+    with engine.begin() as conn:
+        if not {'price_stats', 'price_history'} <= set(inspect(conn).get_table_names()):
+            return {}
+        has_stats = conn.execute(text('SELECT 1 FROM price_stats LIMIT 1')).first()
+        has_history = conn.execute(text('SELECT 1 FROM price_history LIMIT 1')).first()
+        if merged or (has_history and not has_stats):
+            return rebuild_stats(conn)
+    return {}
+
+def migrate_product_search(engine: Engine) -> dict:
+    """Full-text index and sync triggers for product search (SQLite only)."""
+    with engine.begin() as conn:
+        if 'products' not in inspect(conn).get_table_names():
+            return {}
+        return create_search_index(conn)
+
+def migrate_series_store(engine: Engine, merged: int) -> dict:
+    """Build the binary history store, if enabled, when missing or stale, or products were merged."""
+    if series_store is None:
+        return {}
+    with engine.connect() as conn:
+        if series_store.ready and not merged and store_in_sync(conn, series_store):
+            return {}
+        return rebuild_store(conn, series_store)
+
+def migrate_prices_db(path: str) -> dict:
+    """Upgrade the sqlite3 database used by main.py."""
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        migrate_alert_types(engine)
+        result = migrate_canonical_keys(engine, 'url')
+        result['utc'] = migrate_utc_timestamps(engine)
+        result['stats'] = migrate_price_stats(engine, result['merged'] or result['utc'])
+        result['search'] = migrate_product_search(engine)
+        return result
+    finally:
+        engine.dispose()
+
+def migrate_alert_owners(engine: Engine):
+    """Add price_alerts.user_id, which links alerts to subscribers."""
+    with engine.begin() as conn:
+        if 'price_alerts' not in inspect(conn).get_table_names():
+            return
+        _add_column(conn, 'price_alerts', 'user_id', 'VARCHAR')
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_price_alerts_user_id ON price_alerts (user_id)'
+        ))
+
+def migrate_alert_types(engine: Engine):
+    """Columns for percent-drop and all-time-low alerts."""
+    with engine.begin() as conn:
+        if 'price_alerts' not in inspect(conn).get_table_names():
+            return
+        _add_column(conn, 'price_alerts', 'alert_type', "VARCHAR DEFAULT 'target'")
+        _add_column(conn, 'price_alerts', 'percent_drop', 'FLOAT')
+        _add_column(conn, 'price_alerts', 'reference_price', 'FLOAT')
+
+def _subscribe_missing(conn: Connection, pairs) -> int:
+    """Insert the (user_id, product_id) subscriptions that do not exist yet."""
+    existing = set(conn.execute(text('SELECT user_id, product_id FROM subscriptions')).all())
+    rows = [
+        {'user_id': user_id, 'product_id': product_id, 'now': datetime.utcnow()}
+        for user_id, product_id in set(pairs) - existing
+    ]
+    if rows:
+        conn.execute(text(
+            'INSERT INTO subscriptions (user_id, product_id, created_at) VALUES (:user_id, :product_id, :now)'
+        ), rows)
+    return len(rows)
+
+def migrate_subscriptions(engine: Engine) -> int:
+    """
+    Subscribe users to the products tracked before subscriptions existed, so
+    they stay listed: each alert's owner to its product, and
+    LEGACY_PRODUCTS_OWNER to every such product nobody is subscribed to.
+    Runs once; while LEGACY_PRODUCTS_OWNER is unset the products tracked up to
+    the first attempt stay pending and are backfilled once it is set.
+    """
+    name, pending = 'legacy_subscriptions', 'legacy_subscriptions_pending'
+    with engine.begin() as conn:
+        tables = set(inspect(conn).get_table_names())
+        if not {'products', 'subscriptions'} <= tables or _applied(conn, name):
+            return 0
+        if not _applied(conn, pending):
+            if conn.execute(text('SELECT 1 FROM subscriptions LIMIT 1')).first():
+                # Backfilled before this marker existed
+                _mark_applied(conn, name)
+                return 0
+            _mark_applied(conn, pending)
+        cutoff = conn.execute(
+            text(f'SELECT applied_at FROM {MIGRATIONS_TABLE} WHERE name = :name'), {'name': pending}
+        ).scalar()
+        added = 0
+        if 'price_alerts' in tables:
+            added += _subscribe_missing(conn, conn.execute(text('''
+                SELECT DISTINCT COALESCE(user_id, email), product_id FROM price_alerts
+                WHERE COALESCE(user_id, email) IS NOT NULL AND product_id IN (SELECT id FROM products)
+            ''')).all())
+        orphans = conn.execute(text('''
+            SELECT id FROM products
+            WHERE id NOT IN (SELECT product_id FROM subscriptions)
+              AND (created_at IS NULL OR created_at <= :cutoff)
+        '''), {'cutoff': cutoff}).scalars().all()
+        if orphans and not LEGACY_PRODUCTS_OWNER:
+            logger.warning(
+                f"{len(orphans)} products predate subscriptions and are listed for no one; "
+                f"set LEGACY_PRODUCTS_OWNER to the account that should keep them"
+            )
+            return added
+        added += _subscribe_missing(conn, ((LEGACY_PRODUCTS_OWNER, product_id) for product_id in orphans))
+        _mark_applied(conn, name)
+        return added
+
+def migrate_orm_db(engine: Engine) -> dict:
+    """Upgrade the SQLAlchemy database."""
+    migrate_alert_owners(engine)
+    migrate_alert_types(engine)
+    result = migrate_canonical_keys(engine, 'amazon_url')
+    result['subscriptions'] = migrate_subscriptions(engine)
+    result['stats'] = migrate_price_stats(engine, result['merged'])
+    result['search'] = migrate_product_search(engine)
+    result['series'] = migrate_series_store(engine, result['merged'])
+    return result
+
+if __name__ == '__main__':
+    import os
+    from backend.database import engine as orm_engine
+
+    print('prices.db:', migrate_prices_db(os.getenv('PRICES_DB_PATH', 'prices.db')))
+    print('orm:', migrate_orm_db(orm_engine))
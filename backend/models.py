@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, create_engine, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, create_engine, Boolean, JSON, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from backend.database import engine
+from backend.migrations import migrate_orm_db
 
 Base = declarative_base()
 
@@ -10,6 +12,8 @@ class Product(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     amazon_url = Column(String, unique=True, index=True)
+    # ASIN plus marketplace, shared by every URL variant of the product
+    canonical_key = Column(String, unique=True, index=True)
     name = Column(String)
     image_url = Column(String)
     current_price = Column(Float)
@@ -17,6 +21,22 @@ class Product(Base):
     price_history = relationship("PriceHistory", back_populates="product")
     price_alerts = relationship("PriceAlert", back_populates="product")
     price_comparisons = relationship("PriceComparison", back_populates="product")
+    subscriptions = relationship("Subscription", back_populates="product")
+
+class Subscription(Base):
+    """A user's tracking of a product; the product row itself is shared."""
+    __tablename__ = "subscriptions"
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_subscriptions_user_product"),
+        Index("ix_subscriptions_product_id", "product_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Identity returned by auth.get_current_user
+    user_id = Column(String, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    product = relationship("Product", back_populates="subscriptions")
 
 class PriceHistory(Base):
     __tablename__ = "price_history"
@@ -27,13 +47,44 @@ class PriceHistory(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     product = relationship("Product", back_populates="price_history")
 
+class PriceStats(Base):
+    """Summary of a product's history, maintained by backend.price_stats."""
+    __tablename__ = "price_stats"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    current_price = Column(Float)
+    previous_price = Column(Float)
+    min_price = Column(Float)
+    min_at = Column(DateTime)
+    max_price = Column(Float)
+    samples = Column(Integer, default=0)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+    last_change_at = Column(DateTime)
+
+class PriceDaily(Base):
+    """Per-day price sums for the rolling averages read by price_stats.load_averages."""
+    __tablename__ = "price_daily"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    # ISO date, YYYY-MM-DD
+    day = Column(String, primary_key=True)
+    price_sum = Column(Float, nullable=False)
+    samples = Column(Integer, nullable=False)
+
 class PriceAlert(Base):
     __tablename__ = "price_alerts"
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
+    user_id = Column(String, nullable=True, index=True)
     email = Column(String)
+    # 'target', 'percent_drop' or 'all_time_low' (see backend.alert_index)
+    alert_type = Column(String, default="target")
+    # Price threshold; for percent_drop alerts, reference_price less percent_drop
     target_price = Column(Float)
+    percent_drop = Column(Float)
+    reference_price = Column(Float)
     is_sent = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     product = relationship("Product", back_populates="price_alerts")
@@ -52,6 +103,6 @@ class PriceComparison(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     product = relationship("Product", back_populates="price_comparisons")
 
-# Create SQLite database
-engine = create_engine("sqlite:///./pricepulse.db", connect_args={"check_same_thread": False})
-Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+# Create tables in the configured database
+Base.metadata.create_all(bind=engine)
+migrate_orm_db(engine)
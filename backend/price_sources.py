@@ -0,0 +1,288 @@
+"""
+Where scheduled price refreshes get their prices.
+
+The Selling Partner API prices up to 20 ASINs per request, so when
+credentials are configured in amazon_config.yaml the refresh cycle uses it
+and only scrapes the products it could not price. Without credentials every
+product is scraped as before.
+"""
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+import yaml
+
+from backend import scraper
+from backend.canonical import parse_amazon_url
+
+logger = logging.getLogger(__name__)
+
+# Marketplace id and SP-API region for each storefront domain
+MARKETPLACES = {
+    'amazon.com': ('ATVPDKIKX0DER', 'na'),
+    'amazon.ca': ('A2EUQ1WTGCTBG2', 'na'),
+    'amazon.com.mx': ('A1AM78C64UM0Y8', 'na'),
+    'amazon.com.br': ('A2Q3Y263D00KWC', 'na'),
+    'amazon.co.uk': ('A1F83G8C2ARO7P', 'eu'),
+    'amazon.de': ('A1PA6795UKMFR9', 'eu'),
+    'amazon.fr': ('A13V1IB3VIYZZH', 'eu'),
+    'amazon.it': ('APJ6JRA9NG5V4', 'eu'),
+    'amazon.es': ('A1RKKUPIHCS9HS', 'eu'),
+    'amazon.nl': ('A1805IZSGTT6HS', 'eu'),
+    'amazon.se': ('A2NODRKZP88ZB9', 'eu'),
+    'amazon.pl': ('A1C3SOZRARQ6R3', 'eu'),
+    'amazon.com.be': ('AMEN7PMS3EDWL', 'eu'),
+    'amazon.com.tr': ('A33AVAJ2PDY3EV', 'eu'),
+    'amazon.ae': ('A2VIGQ35RCS4UG', 'eu'),
+    'amazon.sa': ('A17E79C6D8DWNP', 'eu'),
+    'amazon.eg': ('ARBP9OOSHTCHU', 'eu'),
+    'amazon.in': ('A21TJRUUN4KGV', 'eu'),
+    'amazon.co.jp': ('A1VC38T7YXB528', 'fe'),
+    'amazon.com.au': ('A39IBJ37TRP1C6', 'fe'),
+    'amazon.sg': ('A19VAU5U5O7RUS', 'fe'),
+}
+
+COMPETITIVE_PRICE_PATH = '/products/pricing/v0/competitivePrice'
+
+# Scrapes per product per cycle while ScrapingBee is failing
+MAX_SCRAPE_ATTEMPTS = 3
+
+# CompetitivePriceId of the new-condition Buy Box price
+BUY_BOX_PRICE_ID = '1'
+
+def load_amazon_config() -> Dict:
+    """Load SP-API configuration; AMAZON_CONFIG_PATH overrides the default file."""
+    config_path = os.getenv('AMAZON_CONFIG_PATH') or os.path.join(os.path.dirname(__file__), 'amazon_config.yaml')
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per second with bursts of `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """Hold off all callers for `seconds` after the API throttles us."""
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class PriceSource(ABC):
+    """Fetches current prices for a set of product URLs."""
+
+    name = 'base'
+
+    @abstractmethod
+    async def get_prices(self, urls: List[str]) -> Dict[str, Optional[float]]:
+        """Price per URL, None where the source has none; keyed by the URLs given."""
+
+class ScrapingPriceSource(PriceSource):
+    """
+    One ScrapingBee scrape per product.
+
+    Scrapes run concurrently up to the upstream guard's current limit. While
+    its circuit is open the workers sleep until the next probe instead of
+    failing every product; whatever is still unscraped once
+    `refresh_budget_seconds` has passed is left for the next cycle.
+    """
+
+    name = 'scraping'
+
+    async def get_prices(self, urls: List[str]) -> Dict[str, Optional[float]]:
+        config = scraper.load_scraping_config()
+        guard = scraper.get_upstream_guard(config)
+        upstream = config.get('upstream') or {}
+        deadline = time.monotonic() + upstream.get('refresh_budget_seconds', 900)
+        prices = {url: None for url in urls}
+        queue = list(reversed(urls))
+        attempts = defaultdict(int)
+        deferred = 0
+
+        async def worker():
+            nonlocal deferred
+            while queue:
+                url = queue.pop()
+                if not await guard.wait_until_available(deadline):
+                    deferred += 1
+                    continue
+                product_data = await scraper.scrape_amazon_product_async(url)
+                attempts[url] += 1
+                if product_data.get('error') == scraper.UPSTREAM_FAILING:
+                    # Try again once the circuit lets requests through
+                    if attempts[url] < MAX_SCRAPE_ATTEMPTS and time.monotonic() < deadline:
+                        queue.insert(0, url)
+                    else:
+                        deferred += 1
+                    continue
+                prices[url] = product_data['current_price']
+
+        workers = min(len(urls), guard.limiter.maximum)
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        if deferred:
+            logger.warning(f"ScrapingBee unavailable; deferred {deferred} products to the next cycle")
+        return prices
+
+class SPAPIPriceSource(PriceSource):
+    """
+    Buy Box prices from the SP-API competitive pricing operation.
+
+    Login with Amazon access tokens are cached until shortly before they
+    expire, and requests go through a token bucket sized to the operation's
+    documented rate (0.5 requests/second, burst 1) unless configured otherwise.
+    """
+
+    name = 'sp_api'
+
+    def __init__(self, config: Dict):
+        self.credentials = config['credentials']
+        self.endpoints = config['endpoints']
+        pricing = config.get('pricing') or {}
+        self.token_url = pricing.get('lwa_token_url', 'https://api.amazon.com/auth/o2/token')
+        self.batch_size = min(int(pricing.get('batch_size', 20)), 20)
+        self.max_retries = int(pricing.get('max_retries', 3))
+        self.timeout_seconds = float(pricing.get('timeout_seconds', 30))
+        self.limiters = defaultdict(lambda: RateLimiter(
+            float(pricing.get('requests_per_second', 0.5)), int(pricing.get('burst', 1))
+        ))
+        self._access_token = None
+        self._token_expires = 0.0
+        self._token_lock = asyncio.Lock()
+        self.requests = 0
+
+    @staticmethod
+    def is_configured(config: Dict) -> bool:
+        credentials = config.get('credentials') or {}
+        pricing = config.get('pricing') or {}
+        return bool(pricing.get('enabled')) and all(
+            credentials.get(key) for key in ('refresh_token', 'lwa_app_id', 'lwa_client_secret')
+        )
+
+    async def _get_access_token(self, session: aiohttp.ClientSession) -> str:
+        async with self._token_lock:
+            # Refresh a minute early so a token never expires mid-request
+            if self._access_token and time.monotonic() < self._token_expires - 60:
+                return self._access_token
+            async with session.post(self.token_url, data={
+                'grant_type': 'refresh_token',
+                'refresh_token': self.credentials['refresh_token'],
+                'client_id': self.credentials['lwa_app_id'],
+                'client_secret': self.credentials['lwa_client_secret'],
+            }) as response:
+                response.raise_for_status()
+                token = await response.json()
+            self._access_token = token['access_token']
+            self._token_expires = time.monotonic() + int(token.get('expires_in', 3600))
+            return self._access_token
+
+    async def _fetch_batch(self, session: aiohttp.ClientSession, region: str,
+                           marketplace_id: str, asins: List[str]) -> Dict[str, Optional[float]]:
+        url = self.endpoints[region].rstrip('/') + COMPETITIVE_PRICE_PATH
+        params = {'MarketplaceId': marketplace_id, 'ItemType': 'Asin', 'Asins': ','.join(asins)}
+        for attempt in range(self.max_retries + 1):
+            await self.limiters[region].acquire()
+            headers = {'x-amz-access-token': await self._get_access_token(session)}
+            self.requests += 1
+            async with session.get(url, params=params, headers=headers) as response:
+                if response.status == 429 and attempt < self.max_retries:
+                    limit = float(response.headers.get('x-amzn-RateLimit-Limit') or 0.5)
+                    logger.warning(f"SP-API throttled; backing off {1 / limit:.1f}s")
+                    self.limiters[region].penalize(1 / limit)
+                    continue
+                if response.status == 403 and attempt < self.max_retries:
+                    # Token revoked or expired early; fetch a new one
+                    self._access_token = None
+                    continue
+                response.raise_for_status()
+                body = await response.json()
+            return parse_competitive_prices(body)
+        return {}
+
+    async def get_prices(self, urls: List[str]) -> Dict[str, Optional[float]]:
+        # Group by marketplace, since each request covers a single marketplace
+        groups = defaultdict(lambda: defaultdict(list))
+        prices = {url: None for url in urls}
+        for url in urls:
+            parsed = parse_amazon_url(url)
+            if parsed and parsed[1] in MARKETPLACES:
+                groups[parsed[1]][parsed[0]].append(url)
+
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout_seconds)) as session:
+            for domain, by_asin in groups.items():
+                marketplace_id, region = MARKETPLACES[domain]
+                asins = list(by_asin)
+                for start in range(0, len(asins), self.batch_size):
+                    batch = asins[start:start + self.batch_size]
+                    try:
+                        found = await self._fetch_batch(session, region, marketplace_id, batch)
+                    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+                        # Timeouts, bad token or pricing responses: this batch is scraped instead
+                        logger.error(f"SP-API pricing request failed for {domain}: {e!r}")
+                        continue
+                    for asin, price in found.items():
+                        for url in by_asin.get(asin, []):
+                            prices[url] = price
+        return prices
+
+def parse_competitive_prices(body: Dict) -> Dict[str, Optional[float]]:
+    """ASIN -> Buy Box landed price (falling back to listing price) from a response."""
+    prices = {}
+    for item in body.get('payload') or []:
+        asin = item.get('ASIN')
+        if not asin or item.get('status') != 'Success':
+            continue
+        offers = ((item.get('Product') or {}).get('CompetitivePricing') or {}).get('CompetitivePrices') or []
+        chosen = next((o for o in offers if str(o.get('CompetitivePriceId')) == BUY_BOX_PRICE_ID), None)
+        chosen = chosen or (offers[0] if offers else None)
+        if not chosen:
+            prices[asin] = None
+            continue
+        price = chosen.get('Price') or {}
+        amount = (price.get('LandedPrice') or {}).get('Amount')
+        if amount is None:
+            amount = (price.get('ListingPrice') or {}).get('Amount')
+        prices[asin] = float(amount) if amount is not None else None
+    return prices
+
+_sp_api_source: Optional[SPAPIPriceSource] = None
+
+def get_price_source() -> PriceSource:
+    """The SP-API source when configured, otherwise scraping."""
+    global _sp_api_source
+    config = load_amazon_config()
+    if not SPAPIPriceSource.is_configured(config):
+        return ScrapingPriceSource()
+    # Reused across cycles so the cached access token and rate limits carry over
+    if _sp_api_source is None:
+        _sp_api_source = SPAPIPriceSource(config)
+    return _sp_api_source
+
+async def fetch_current_prices(urls: Iterable[str]) -> Dict[str, Optional[float]]:
+    """Current price per URL, scraping whatever the configured source missed."""
+    urls = list(dict.fromkeys(urls))
+    source = get_price_source()
+    prices = await source.get_prices(urls)
+    if source.name != ScrapingPriceSource.name:
+        missing = [url for url in urls if prices.get(url) is None]
+        if missing:
+            logger.info(f"{source.name} had no price for {len(missing)} products; scraping them")
+            prices.update(await ScrapingPriceSource().get_prices(missing))
+    return prices
@@ -0,0 +1,203 @@
+"""
+Per-product price statistics kept up to date on every price write.
+
+price_stats holds one row per product (current, previous, min, max, last
+change) and price_daily one row per product per day (sum and count), pruned
+to the last 30 days. Each write touches those two small tables only, so
+listing products with their stats never scans price_history. The 7- and
+30-day averages are read from price_daily for the windows ending today
+(load_averages), so products that stop refreshing age out of them.
+
+The statements use named parameters and ON CONFLICT upserts, which sqlite3,
+SQLite through SQLAlchemy and PostgreSQL all accept. Rebuild from history:
+
+    python -m backend.price_stats
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Days covered by the rolling averages; price_daily keeps the longest
+AVERAGE_WINDOWS = (7, 30)
+
+UPSERT_DAILY_SQL = '''
+    INSERT INTO price_daily (product_id, day, price_sum, samples)
+    VALUES (:product_id, :day, :price, 1)
+    ON CONFLICT (product_id, day) DO UPDATE SET
+        price_sum = price_daily.price_sum + excluded.price_sum,
+        samples = price_daily.samples + 1
+'''
+
+UPSERT_STATS_SQL = '''
+    INSERT INTO price_stats (product_id, current_price, previous_price, min_price, min_at,
+                             max_price, samples, first_seen, last_seen, last_change_at)
+    VALUES (:product_id, :price, NULL, :price, :at, :price, 1, :at, :at, :at)
+    ON CONFLICT (product_id) DO UPDATE SET
+        previous_price = CASE WHEN price_stats.current_price <> excluded.current_price
+                              THEN price_stats.current_price ELSE price_stats.previous_price END,
+        last_change_at = CASE WHEN price_stats.current_price <> excluded.current_price
+                              THEN excluded.last_seen ELSE price_stats.last_change_at END,
+        current_price = excluded.current_price,
+        min_at = CASE WHEN excluded.min_price < price_stats.min_price
+                      THEN excluded.min_at ELSE price_stats.min_at END,
+        min_price = CASE WHEN excluded.min_price < price_stats.min_price
+                         THEN excluded.min_price ELSE price_stats.min_price END,
+        max_price = CASE WHEN excluded.max_price > price_stats.max_price
+                         THEN excluded.max_price ELSE price_stats.max_price END,
+        samples = price_stats.samples + 1,
+        last_seen = excluded.last_seen
+'''
+
+PRUNE_DAILY_SQL = 'DELETE FROM price_daily WHERE product_id = :product_id AND day < :day_30d'
+
+AVERAGES_SQL = text('''
+    SELECT product_id,
+           SUM(CASE WHEN day >= :day_7d THEN price_sum END)
+               / SUM(CASE WHEN day >= :day_7d THEN samples END) AS avg_7d,
+           SUM(price_sum) / SUM(samples) AS avg_30d
+    FROM price_daily
+    WHERE product_id IN :product_ids AND day >= :day_30d
+    GROUP BY product_id
+''').bindparams(bindparam('product_ids', expanding=True))
+
+STATEMENTS = (UPSERT_DAILY_SQL, UPSERT_STATS_SQL, PRUNE_DAILY_SQL)
+
+def _day(at: datetime, days_back: int = 0) -> str:
+    return (at.date() - timedelta(days=days_back)).isoformat()
+
+def _params(product_id: int, price: float, at: datetime) -> Dict:
+    return {
+        'product_id': product_id,
+        'price': price,
+        'at': at,
+        'day': _day(at),
+        'day_30d': _day(at, 29),
+    }
+
+def record_price(cursor, product_id: int, price: float, at: datetime):
+    """Fold one observation into the stats through a sqlite3 cursor."""
+    params = _params(product_id, price, at)
+    for statement in STATEMENTS:
+        cursor.execute(statement, params)
+
+async def record_price_async(db: AsyncSession, product_id: int, price: float, at: datetime):
+    """Fold one observation into the stats in the session's transaction."""
+    params = _params(product_id, price, at)
+    for statement in STATEMENTS:
+        await db.execute(text(statement), params)
+
+async def load_averages(db: AsyncSession, product_ids: Iterable[int]) -> Dict[int, Tuple]:
+    """(avg_7d, avg_30d) over the windows ending today, for products with prices in them."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    now = datetime.utcnow()
+    result = await db.execute(AVERAGES_SQL, {
+        'product_ids': product_ids, 'day_7d': _day(now, 6), 'day_30d': _day(now, 29)
+    })
+    return {product_id: (avg_7d, avg_30d) for product_id, avg_7d, avg_30d in result}
+
+def stats_payload(row, averages: Tuple = (None, None)) -> Optional[Dict]:
+    """
+    API form of a price_stats row with load_averages()' averages, or None when
+    the product has no stats yet.
+    """
+    if row is None or row.current_price is None:
+        return None
+    change_pct = None
+    if row.previous_price:
+        change_pct = round((row.current_price - row.previous_price) / row.previous_price * 100, 2)
+    return {
+        'current': row.current_price,
+        'previous': row.previous_price,
+        'min': row.min_price,
+        'min_at': row.min_at,
+        'max': row.max_price,
+        'avg_7d': averages[0],
+        'avg_30d': averages[1],
+        'change_pct': change_pct,
+        'last_change_at': row.last_change_at,
+        'samples': row.samples,
+        # A first price is trivially the lowest
+        'is_all_time_low': row.samples >= 2 and row.current_price <= row.min_price,
+    }
+
+def _as_datetime(value) -> datetime:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def _flush_product(conn: Connection, product_id: int, state: Dict, days: Dict[date, list]):
+    day_30d = state['last_seen'].date() - timedelta(days=29)
+    conn.execute(text('''
+        INSERT INTO price_stats (product_id, current_price, previous_price, min_price, min_at,
+                                 max_price, samples, first_seen, last_seen, last_change_at)
+        VALUES (:product_id, :current_price, :previous_price, :min_price, :min_at, :max_price,
+                :samples, :first_seen, :last_seen, :last_change_at)
+    '''), {**state, 'product_id': product_id})
+    daily = [
+        {'product_id': product_id, 'day': d.isoformat(), 'price_sum': s, 'samples': n}
+        for d, (s, n) in days.items() if d >= day_30d
+    ]
+    if daily:
+        conn.execute(text('''
+            INSERT INTO price_daily (product_id, day, price_sum, samples)
+            VALUES (:product_id, :day, :price_sum, :samples)
+        '''), daily)
+
+def rebuild_stats(conn: Connection) -> Dict:
+    """Recompute price_stats and price_daily from price_history in one pass."""
+    tables = set(inspect(conn).get_table_names())
+    if not {'price_history', 'price_stats', 'price_daily'} <= tables:
+        return {'products': 0, 'rows': 0}
+    conn.execute(text('DELETE FROM price_stats'))
+    conn.execute(text('DELETE FROM price_daily'))
+
+    rows = conn.execution_options(stream_results=True).execute(text('''
+        SELECT product_id, price, timestamp FROM price_history
+        WHERE price IS NOT NULL AND product_id IS NOT NULL
+        ORDER BY product_id, timestamp, id
+    '''))
+    current_id, state, days = None, None, {}
+    products = count = 0
+    for product_id, price, timestamp in rows:
+        at = _as_datetime(timestamp)
+        count += 1
+        if product_id != current_id:
+            if current_id is not None:
+                _flush_product(conn, current_id, state, days)
+                products += 1
+            current_id, days = product_id, {}
+            state = {
+                'current_price': price, 'previous_price': None, 'min_price': price, 'min_at': at,
+                'max_price': price, 'samples': 0, 'first_seen': at, 'last_seen': at,
+                'last_change_at': at,
+            }
+        elif price != state['current_price']:
+            state['previous_price'] = state['current_price']
+            state['current_price'] = price
+            state['last_change_at'] = at
+        if price < state['min_price']:
+            state['min_price'], state['min_at'] = price, at
+        state['max_price'] = max(state['max_price'], price)
+        state['samples'] += 1
+        state['last_seen'] = at
+        bucket = days.setdefault(at.date(), [0.0, 0])
+        bucket[0] += price
+        bucket[1] += 1
+    if current_id is not None:
+        _flush_product(conn, current_id, state, days)
+        products += 1
+    return {'products': products, 'rows': count}
+
+if __name__ == '__main__':
+    import os
+    from sqlalchemy import create_engine
+    from backend.database import engine as orm_engine
+
+    prices_engine = create_engine(f"sqlite:///{os.getenv('PRICES_DB_PATH', 'prices.db')}")
+    with prices_engine.begin() as conn:
+        print('prices.db:', rebuild_stats(conn))
+    with orm_engine.begin() as conn:
+        print('orm:', rebuild_stats(conn))
@@ -0,0 +1,187 @@
+"""
+Full-text search over tracked products by name and ASIN.
+
+product_search is an FTS5 index over products.name and the bare ASIN
+(canonical_key without its marketplace, e.g. B08N5KWB9H from
+amazon.in:B08N5KWB9H), read through the product_search_source view.
+Triggers on products keep it in sync inside the writing transaction,
+whichever code inserts, renames or merges a product.
+
+Every word of a query matches as a prefix, results are ranked by BM25 with
+ASIN hits weighted above name hits, and pages are fetched by (rank, id)
+keyset rather than OFFSET. Every page still matches and ranks all hits
+before the cursor filters them, so a page costs about as much as the whole
+result set; the keyset only spares re-reading and re-sorting the rows of
+earlier pages, and keeps pages stable while products are added. Only
+products the user is subscribed to are returned.
+
+FTS5 is SQLite-only. On other databases search falls back to a
+case-insensitive substring match ordered by id.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+SEARCH_TABLE = 'product_search'
+
+CONTENT_VIEW = f'{SEARCH_TABLE}_source'
+
+# canonical_key without the marketplace prefix
+ASIN_SQL = "substr({key}, instr({key}, ':') + 1)"
+
+# BM25 weight of ASIN matches relative to name matches
+ASIN_WEIGHT = 5.0
+
+# Words in a query beyond this are ignored
+MAX_QUERY_TERMS = 8
+
+CREATE_SQL = (
+    f'''CREATE VIEW {CONTENT_VIEW} AS
+        SELECT id, name, {ASIN_SQL.format(key='canonical_key')} AS asin FROM products''',
+    f'''CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+        name, asin, content='{CONTENT_VIEW}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )''',
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25(1.0, {ASIN_WEIGHT})')",
+    f'''CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON products BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, name, asin)
+        VALUES (new.id, new.name, {ASIN_SQL.format(key='new.canonical_key')});
+    END''',
+    f'''CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON products BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, asin)
+        VALUES ('delete', old.id, old.name, {ASIN_SQL.format(key='old.canonical_key')});
+    END''',
+    # Refreshes rewrite name with the same value; only reindex real changes
+    f'''CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE OF name, canonical_key ON products
+    WHEN old.name IS NOT new.name OR old.canonical_key IS NOT new.canonical_key BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, asin)
+        VALUES ('delete', old.id, old.name, {ASIN_SQL.format(key='old.canonical_key')});
+        INSERT INTO {SEARCH_TABLE} (rowid, name, asin)
+        VALUES (new.id, new.name, {ASIN_SQL.format(key='new.canonical_key')});
+    END''',
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')",
+)
+
+# The first version indexed the whole canonical_key from products itself
+DROP_SQL = (
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update',
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+    f'DROP VIEW IF EXISTS {CONTENT_VIEW}',
+)
+
+SEARCH_SQL = f'''
+    SELECT p.id, p.amazon_url, p.name, p.image_url, p.current_price, s.rank
+    FROM {SEARCH_TABLE} s
+    JOIN products p ON p.id = s.rowid
+    JOIN subscriptions sub ON sub.product_id = p.id AND sub.user_id = :user_id
+    WHERE {SEARCH_TABLE} MATCH :match {{after}}
+    ORDER BY s.rank, s.rowid
+    LIMIT :limit
+'''
+
+AFTER_SQL = 'AND (s.rank > :rank OR (s.rank = :rank AND s.rowid > :after_id))'
+
+LIKE_SQL = '''
+    SELECT p.id, p.amazon_url, p.name, p.image_url, p.current_price FROM products p
+    JOIN subscriptions sub ON sub.product_id = p.id AND sub.user_id = :user_id
+    WHERE (LOWER(p.name) LIKE :pattern ESCAPE '\\'
+           OR LOWER(p.canonical_key) LIKE :asin_pattern ESCAPE '\\')
+      AND p.id > :after_id
+    ORDER BY p.id
+    LIMIT :limit
+'''
+
+def create_search_index(conn: Connection) -> Dict:
+    """Create and fill product_search on SQLite if it is missing or outdated."""
+    if conn.dialect.name != 'sqlite':
+        return {}
+    existing = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE name = :name"), {'name': SEARCH_TABLE}
+    ).scalar()
+    if existing and CONTENT_VIEW in existing:
+        return {}
+    for statement in DROP_SQL:
+        conn.execute(text(statement))
+    try:
+        for statement in CREATE_SQL:
+            conn.execute(text(statement))
+    except OperationalError as e:
+        # SQLite built without FTS5
+        return {'error': str(e)}
+    return {'products': conn.execute(text('SELECT COUNT(*) FROM products')).scalar()}
+
+def match_query(query: str) -> Optional[str]:
+    """FTS5 query matching every word of `query` as a prefix; None if it has no words."""
+    terms = re.findall(r'\w+', query.lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def encode_cursor(rank: Optional[float], product_id: int) -> str:
+    return f"{product_id}" if rank is None else f"{rank!r}:{product_id}"
+
+def decode_cursor(cursor: str) -> Tuple[Optional[float], int]:
+    """(rank, id) of the last result of the previous page; ValueError if malformed."""
+    rank, _, product_id = cursor.rpartition(':')
+    return (float(rank) if rank else None), int(product_id)
+
+def _item(row, rank: Optional[float]) -> Dict:
+    return {
+        'id': row.id,
+        'amazon_url': row.amazon_url,
+        'name': row.name,
+        'image_url': row.image_url,
+        'current_price': row.current_price,
+        'score': None if rank is None else -rank,
+    }
+
+async def _search_fts(db: AsyncSession, user_id: str, match: str, limit: int,
+                      after: Optional[Tuple[Optional[float], int]]) -> List:
+    params = {'user_id': user_id, 'match': match, 'limit': limit}
+    if after is not None:
+        params['rank'], params['after_id'] = after
+    sql = SEARCH_SQL.format(after=AFTER_SQL if after is not None else '')
+    result = await db.execute(text(sql), params)
+    return [(row, row.rank) for row in result.all()]
+
+async def _search_like(db: AsyncSession, user_id: str, query: str, limit: int,
+                       after: Optional[Tuple[Optional[float], int]]) -> List:
+    escaped = re.sub(r'([\\%_])', r'\\\1', query.strip().lower())
+    result = await db.execute(text(LIKE_SQL), {
+        'user_id': user_id, 'pattern': f"%{escaped}%",
+        # Only the part of canonical_key after the marketplace
+        'asin_pattern': f"%:%{escaped}%",
+        'after_id': after[1] if after else 0, 'limit': limit
+    })
+    return [(row, None) for row in result.all()]
+
+async def search_products(db: AsyncSession, user_id: str, query: str, limit: int = 20,
+                          cursor: Optional[str] = None) -> Dict:
+    """
+    One page of the products `user_id` is subscribed to matching `query`, best first.
+
+    `cursor` is the previous page's next_cursor; next_cursor is None on the
+    last page. Each page matches and ranks every hit again, so broad queries
+    cost the same on every page. Raises ValueError for a malformed cursor.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    match = match_query(query)
+    if match is None:
+        return {'items': [], 'next_cursor': None}
+    # One extra row tells whether another page follows
+    if db.get_bind().dialect.name == 'sqlite':
+        rows = await _search_fts(db, user_id, match, limit + 1, after)
+    else:
+        rows = await _search_like(db, user_id, query, limit + 1, after)
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last, rank = page[-1]
+        next_cursor = encode_cursor(rank, last.id)
+    return {'items': [_item(row, rank) for row, rank in page], 'next_cursor': next_cursor}
@@ -0,0 +1,88 @@
+"""
+Fast JSON responses for price history.
+
+Large history payloads skip Pydantic validation and the stdlib encoder:
+rows from the database are encoded with orjson and compressed with brotli
+or gzip, whichever the client accepts. Histories can also be returned in
+columnar form, {"t": [epoch seconds, ...], "p": [price, ...]}, which is
+about a third the size of a list of objects.
+"""
+import gzip
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Optional, Tuple
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+GZIP_LEVEL = 6
+# Brotli quality for on-the-fly compression; 11 is far too slow per request
+BROTLI_QUALITY = 4
+
+HISTORY_FORMATS = ('rows', 'columnar')
+
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+def epoch_seconds(timestamp) -> Optional[int]:
+    """Unix time for a datetime or SQLite timestamp string; naive values are UTC."""
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH) // _SECOND
+
+def history_payload(rows: Iterable[Tuple[float, Any]], format: str = 'rows'):
+    """
+    Price history from (price, timestamp) rows, in the order given.
+
+    'rows' matches PriceHistoryBase: [{"price": ..., "timestamp": ...}].
+    'columnar' is {"t": [...], "p": [...]} with epoch-second timestamps.
+    """
+    if format == 'columnar':
+        t, p = [], []
+        for price, timestamp in rows:
+            t.append(epoch_seconds(timestamp))
+            p.append(price)
+        return {'t': t, 'p': p}
+    return [{'price': price, 'timestamp': timestamp} for price, timestamp in rows]
+
+def _accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get('accept-encoding', '').split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+def encode_body(body: bytes, request: Request) -> Tuple[bytes, Optional[str]]:
+    """Compress `body` with the best encoding the client accepts."""
+    if len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    accepted = _accepted_encodings(request)
+    if brotli is not None and 'br' in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+    return body, None
+
+def fast_json_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """orjson-encoded, content-negotiated response for `content`."""
+    # NumPy arrays (series_store slices) are encoded directly
+    body, encoding = encode_body(orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY), request)
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, status_code=status_code, media_type='application/json', headers=headers)
@@ -1,92 +1,390 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime, timedelta
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
-from backend.models import Product, PriceHistory, PriceAlert, PriceComparison
-from backend.scraper import scrape_amazon_product
-from backend.database import get_db
-from backend.schemas import Product as ProductSchema, ProductCreate, PriceHistoryBase, PriceAlertCreate, PriceAlert
+from backend.models import Product, PriceHistory, PriceAlert, PriceComparison, PriceStats, Subscription
+from backend.scraper import scrape_amazon_product_async, get_upstream_state, UPSTREAM_FAILING, SCRAPER_ERROR
+from backend.canonical import canonical_key, canonical_url
+from backend.database import get_async_db
+from backend.schemas import Product as ProductSchema, ProductCreate, History, PriceAlertCreate, PriceAlert as PriceAlertSchema
 from backend.auth import get_current_user
-from backend.scheduler import get_multi_platform_prices
+from backend.responses import HISTORY_FORMATS, epoch_seconds, fast_json_response, history_payload
+from backend.price_stats import load_averages, record_price_async, stats_payload
+from backend.analytics import analyze, forecast_payloads, load_series
+from backend.export import EXPORT_FORMATS, stream_export, supports
+from backend.series_store import append_point, series_payload, series_store
+from backend.product_search import search_products
+from backend.scheduler import alert_index, get_multi_platform_prices, pending_alert_ids
+from backend.alert_index import PERCENT_DROP, TARGET, alert_threshold
 
 router = APIRouter()
 
 class ProductRequest(BaseModel):
     url: str
 
-@router.post("/products/", response_model=ProductSchema)
-async def create_product(request: ProductRequest, db: Session = Depends(get_db)):
-    # Check if product already exists
-    existing_product = db.query(Product).filter(Product.amazon_url == request.url).first()
+class ForecastRequest(BaseModel):
+    # Defaults to every product the user tracks
+    product_ids: Optional[List[int]] = Field(None, max_length=10000)
+    horizon_days: float = Field(7, gt=0, le=90)
+    drop_threshold: float = Field(0.05, gt=0, lt=1)
+    days: int = Field(90, ge=2, le=730)
+
+# ?format= for history-carrying responses: 'rows' (default) or 'columnar'
+HistoryFormat = Query('rows', pattern=f"^({'|'.join(HISTORY_FORMATS)})$")
+
+def _documented(model) -> dict:
+    """
+    Route options for handlers returning fast_json_response: FastAPI does not
+    validate the body, so `model` only describes it in the OpenAPI schema.
+    """
+    return {
+        'response_model': None,
+        'responses': {200: {
+            'model': model,
+            'description': "History as rows, or as {t, p} arrays with ?format=columnar; "
+                           "brotli or gzip encoded per Accept-Encoding",
+        }},
+    }
+
+PRODUCT_COLUMNS = (
+    Product.id, Product.amazon_url, Product.name, Product.image_url,
+    Product.current_price, Product.created_at
+)
+
+async def _products_payload(db: AsyncSession, products, format: str, history: bool = True) -> list:
+    """
+    ProductSchema-shaped dicts built from column rows, with summary stats from
+    price_stats. Histories are loaded in one query unless `history` is False.
+    """
+    payload = [
+        {
+            'id': row.id, 'amazon_url': row.amazon_url, 'name': row.name,
+            'image_url': row.image_url, 'current_price': row.current_price,
+            'created_at': row.created_at,
+        }
+        for row in products
+    ]
+    ids = [item['id'] for item in payload]
+    stats = {}
+    if ids:
+        result = await db.execute(select(PriceStats).where(PriceStats.product_id.in_(ids)))
+        stats = {row.product_id: row for row in result.scalars()}
+    averages = await load_averages(db, stats)
+    for item in payload:
+        item['stats'] = stats_payload(stats.get(item['id']), averages.get(item['id'], (None, None)))
+    if not history:
+        return payload
+
+    histories = {product_id: [] for product_id in ids}
+    if histories:
+        result = await db.execute(
+            select(PriceHistory.product_id, PriceHistory.price, PriceHistory.timestamp)
+            .where(PriceHistory.product_id.in_(list(histories)))
+            .order_by(PriceHistory.product_id, PriceHistory.id)
+        )
+        for product_id, price, timestamp in result:
+            histories[product_id].append((price, timestamp))
+    for item in payload:
+        item['price_history'] = history_payload(histories[item['id']], format)
+    return payload
+
+async def _subscribe(db: AsyncSession, user_id: str, product_id: int):
+    result = await db.execute(
+        select(Subscription.id)
+        .where(Subscription.user_id == user_id)
+        .where(Subscription.product_id == product_id)
+    )
+    if result.scalar_one_or_none() is None:
+        db.add(Subscription(user_id=user_id, product_id=product_id))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Same user subscribed concurrently
+            await db.rollback()
+
+async def _subscribe_existing(db: AsyncSession, http_request: Request, user_id: str, product, format: str):
+    await _subscribe(db, user_id, product.id)
+    payload = await _products_payload(db, [product], format)
+    return fast_json_response(http_request, payload[0])
+
+@router.post("/products/", **_documented(ProductSchema))
+async def create_product(
+    request: ProductRequest,
+    http_request: Request,
+    format: str = HistoryFormat,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: str = Depends(get_current_user)
+):
+    product_key = canonical_key(request.url)
+    if not product_key:
+        raise HTTPException(status_code=400, detail="Invalid Amazon product URL")
+
+    # Check if product already exists, under any URL variant
+    result = await db.execute(
+        select(*PRODUCT_COLUMNS).where(Product.canonical_key == product_key)
+    )
+    existing_product = result.one_or_none()
     if existing_product:
-        return existing_product
-    
+        # Already scraped for another user; just add it to this user's list
+        return await _subscribe_existing(db, http_request, user_id, existing_product, format)
+
     # Scrape product information
-    product_data = scrape_amazon_product(request.url)
+    product_url = canonical_url(request.url)
+    product_data = await scrape_amazon_product_async(product_url)
+    if product_data.get('error') == UPSTREAM_FAILING:
+        retry_after = max(1, int(get_upstream_state()['retry_after_s']))
+        raise HTTPException(
+            status_code=503,
+            detail="Price source temporarily unavailable, try again shortly",
+            headers={"Retry-After": str(retry_after)}
+        )
+    if product_data.get('error') == SCRAPER_ERROR:
+        raise HTTPException(status_code=500, detail="Scraper error, see server logs")
     if not product_data['name'] or not product_data['current_price']:
         raise HTTPException(status_code=400, detail="Could not scrape product information")
-    
+
     # Create new product
     db_product = Product(
-        amazon_url=request.url,
+        amazon_url=product_url,
+        canonical_key=product_key,
         name=product_data['name'],
         image_url=product_data['image_url'],
         current_price=product_data['current_price']
     )
-    db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
-    
-    # Add initial price history
-    price_history = PriceHistory(
-        product_id=db_product.id,
-        price=product_data['current_price']
+    now = datetime.utcnow()
+    try:
+        db.add(db_product)
+        await db.flush()
+
+        # Add initial price history
+        price_history = PriceHistory(
+            product_id=db_product.id,
+            price=product_data['current_price'],
+            timestamp=now
+        )
+        db.add(price_history)
+        await record_price_async(db, db_product.id, product_data['current_price'], now)
+        db.add(Subscription(user_id=user_id, product_id=db_product.id))
+        await db.commit()
+    except IntegrityError:
+        # Another request added the same product while this one was scraping
+        await db.rollback()
+        result = await db.execute(
+            select(*PRODUCT_COLUMNS).where(Product.canonical_key == product_key)
+        )
+        return await _subscribe_existing(db, http_request, user_id, result.one(), format)
+    append_point(db_product.id, now, product_data['current_price'])
+    pending_alert_ids.update(alert_index.observe(db_product.id, product_data['current_price']))
+
+    result = await db.execute(select(*PRODUCT_COLUMNS).where(Product.id == db_product.id))
+    payload = await _products_payload(db, result.all(), format)
+    return fast_json_response(http_request, payload[0])
+
+@router.get("/products/", **_documented(List[ProductSchema]))
+async def get_products(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    format: str = HistoryFormat,
+    history: bool = True,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: str = Depends(get_current_user)
+):
+    """The user's products with summary stats; ?history=false skips price histories."""
+    # Walks uq_subscriptions_user_product, so cost depends on this user's list only
+    result = await db.execute(
+        select(*PRODUCT_COLUMNS)
+        .join(Subscription, Subscription.product_id == Product.id)
+        .where(Subscription.user_id == user_id)
+        .order_by(Subscription.product_id)
+        .offset(skip)
+        .limit(limit)
     )
-    db.add(price_history)
-    db.commit()
-    
-    return db_product
-
-@router.get("/products/", response_model=List[ProductSchema])
-def get_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    products = db.query(Product).offset(skip).limit(limit).all()
-    return products
-
-@router.get("/products/{product_id}/price-history", response_model=List[PriceHistoryBase])
-def get_price_history(product_id: int, days: int = 30, db: Session = Depends(get_db)):
+    return fast_json_response(request, await _products_payload(db, result.all(), format, history))
+
+@router.get("/products/search")
+async def search_catalog(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    The user's tracked products whose name or ASIN has words starting with
+    each word of `q`, best match first. Pass the returned next_cursor to get the next page.
+    """
+    try:
+        page = await search_products(db, user_id, q, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return fast_json_response(request, page)
+
+@router.post("/products/forecast")
+async def forecast_products(
+    forecast: ForecastRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: str = Depends(get_current_user)
+):
+    """Trend statistics and forecasts for many products from one history query."""
+    product_ids = forecast.product_ids
+    if product_ids is None:
+        result = await db.execute(select(Subscription.product_id).where(Subscription.user_id == user_id))
+        product_ids = result.scalars().all()
+    series = await load_series(db, product_ids, forecast.days)
+    stats = analyze(series, forecast.horizon_days, forecast.drop_threshold)
+    payloads = forecast_payloads(stats, forecast.horizon_days, forecast.drop_threshold)
+    return fast_json_response(request, list(payloads.values()))
+
+@router.get("/products/{product_id}/forecast")
+async def forecast_product(
+    request: Request,
+    product_id: int,
+    horizon_days: float = Query(7, gt=0, le=90),
+    drop_threshold: float = Query(0.05, gt=0, lt=1),
+    days: int = Query(90, ge=2, le=730),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Moving averages, volatility, trend and a `horizon_days` forecast for one product."""
+    series = await load_series(db, [product_id], days)
+    if not len(series):
+        raise HTTPException(status_code=404, detail="No price history for this product")
+    payloads = forecast_payloads(analyze(series, horizon_days, drop_threshold), horizon_days, drop_threshold)
+    return fast_json_response(request, payloads[product_id])
+
+@router.get("/products/{product_id}/price-history", **_documented(History))
+async def get_price_history(
+    request: Request,
+    product_id: int,
+    days: int = 30,
+    format: str = HistoryFormat,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Price history for the last `days`; ?format=columnar returns {"t": [...], "p": [...]}."""
     start_date = datetime.utcnow() - timedelta(days=days)
-    history = db.query(PriceHistory)\
-        .filter(PriceHistory.product_id == product_id)\
-        .filter(PriceHistory.timestamp >= start_date)\
-        .order_by(PriceHistory.timestamp)\
-        .all()
-    
-    return history
-
-@router.get("/products/{product_id}", response_model=ProductSchema)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+    if series_store is not None and series_store.ready:
+        times, prices = series_store.read(product_id, start=epoch_seconds(start_date))
+        return fast_json_response(request, series_payload(times, prices, format))
+    result = await db.execute(
+        select(PriceHistory.price, PriceHistory.timestamp)
+        .where(PriceHistory.product_id == product_id)
+        .where(PriceHistory.timestamp >= start_date)
+        .order_by(PriceHistory.timestamp)
+    )
+    return fast_json_response(request, history_payload(result.all(), format))
+
+@router.get("/products/{product_id}", **_documented(ProductSchema))
+async def get_product(
+    request: Request,
+    product_id: int,
+    format: str = HistoryFormat,
+    db: AsyncSession = Depends(get_async_db)
+):
+    result = await db.execute(select(*PRODUCT_COLUMNS).where(Product.id == product_id))
+    product = result.one_or_none()
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    payload = await _products_payload(db, [product], format)
+    return fast_json_response(request, payload[0])
+
+@router.delete("/products/{product_id}")
+async def delete_product(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: str = Depends(get_current_user)
+):
+    """Remove a product from the user's list; the shared product row is kept."""
+    result = await db.execute(
+        delete(Subscription)
+        .where(Subscription.user_id == user_id)
+        .where(Subscription.product_id == product_id)
+    )
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Product not in your list")
+    await db.commit()
+    return {"message": "Product removed from tracking"}
 
-@router.post("/alerts/", response_model=PriceAlert)
-async def create_price_alert(alert: PriceAlertCreate, db: Session = Depends(get_db)):
+@router.get("/export/price-history")
+async def export_price_history(
+    format: str = Query('csv', pattern=f"^({'|'.join(EXPORT_FORMATS)})$"),
+    product_ids: Optional[List[int]] = Query(None),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Stream price history of the products the user tracks as CSV, Parquet or
+    Arrow IPC, optionally filtered by product ids and a [start, end) time
+    range.
+    """
+    if not supports(format):
+        raise HTTPException(status_code=501, detail=f"{format} export requires pyarrow on the server")
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream_export(format, product_ids, start, end, user_id=user_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="price-history.{extension}"'}
+    )
+
+@router.post("/alerts/", response_model=PriceAlertSchema)
+async def create_price_alert(
+    alert: PriceAlertCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: str = Depends(get_current_user)
+):
     # Check if product exists
-    product = db.query(Product).filter(Product.id == alert.product_id).first()
+    product = await db.get(Product, alert.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    
+
+    if alert.alert_type == TARGET and alert.target_price is None:
+        raise HTTPException(status_code=422, detail="target_price is required for target alerts")
+    if alert.alert_type == PERCENT_DROP:
+        if alert.percent_drop is None:
+            raise HTTPException(status_code=422, detail="percent_drop is required for percent_drop alerts")
+        if not product.current_price:
+            raise HTTPException(status_code=422, detail="No current price to measure the drop from")
+
+    # Percent drops are stored as the target price they resolve to
+    threshold = alert_threshold(alert.alert_type, alert.target_price, alert.percent_drop, product.current_price)
+
     # Create new alert
     db_alert = PriceAlert(
         product_id=alert.product_id,
+        user_id=user_id,
         email=alert.email,
-        target_price=alert.target_price
+        alert_type=alert.alert_type,
+        target_price=threshold,
+        percent_drop=alert.percent_drop,
+        reference_price=product.current_price
     )
     db.add(db_alert)
-    db.commit()
-    db.refresh(db_alert)
-    
-    return db_alert 
\ No newline at end of file
+    await db.commit()
+    await db.refresh(db_alert)
+    alert_index.add(db_alert.id, db_alert.product_id, threshold)
+    if threshold is not None and product.current_price is not None and product.current_price <= threshold:
+        # Already met; no price change will trigger it
+        pending_alert_ids.add(db_alert.id)
+
+    return db_alert
+
+@router.delete("/alerts/{alert_id}")
+async def delete_price_alert(
+    alert_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: str = Depends(get_current_user)
+):
+    alert = await db.get(PriceAlert, alert_id)
+    if not alert or alert.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    await db.delete(alert)
+    await db.commit()
+    alert_index.remove(alert_id)
+    return {"message": "Price alert deleted"}
@@ -1,10 +1,18 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy.orm import Session
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+from typing import List
 import os
-from . import models, scraper
-from .database import SessionLocal
+from . import models
+from .database import AsyncSessionLocal
 from .email_service import send_price_alert_email
+from .price_sources import fetch_current_prices
+from .price_stats import record_price_async
+from .series_store import append_point
+from .alert_index import AlertIndex, LOWS_SQL, UNSENT_ALERTS_SQL
+from .canonical import canonical_url
+from .scraper import get_upstream_state
 import aiohttp
 import json
 from dotenv import load_dotenv
@@ -13,6 +21,20 @@ load_dotenv()
 
 scheduler = AsyncIOScheduler()
 
+# Unsent alerts of the SQLAlchemy database, by product and threshold
+alert_index = AlertIndex()
+
+# Triggered alerts not yet sent: from refreshes, new products and alerts
+# already met when created. send_pending_alerts drains it.
+pending_alert_ids = set()
+
+async def load_alert_index(db: AsyncSession):
+    """Rebuild alert_index from price_alerts and price_stats."""
+    alerts = (await db.execute(text(UNSENT_ALERTS_SQL))).all()
+    lows = (await db.execute(text(LOWS_SQL))).all()
+    alert_index.rebuild(alerts, lows)
+    print(f"Loaded {len(alert_index)} price alerts into the index")
+
 async def get_multi_platform_prices(product_data: dict) -> dict:
     """Get price comparison from multiple platforms using OpenRouter API."""
     OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
@@ -60,62 +82,120 @@ async def get_multi_platform_prices(product_data: dict) -> dict:
                     return {}
             return {}
 
-async def check_price_alerts(db: Session):
-    """Check and process price alerts."""
-    alerts = db.query(models.PriceAlert).filter(models.PriceAlert.is_sent == False).all()
-    
-    for alert in alerts:
-        product = db.query(models.Product).filter(models.Product.id == alert.product_id).first()
-        if product and product.current_price <= alert.target_price:
-            # Get multi-platform prices
-            product_data = scraper.scrape_amazon_product(product.amazon_url)
-            price_comparison = await get_multi_platform_prices(product_data)
-            
-            # Send email with price comparison
-            email_sent = await send_price_alert_email(
-                alert.email,
-                product.name,
-                product.image_url,
-                product.current_price,
-                alert.target_price,
-                product.amazon_url
-            )
-            
-            if email_sent:
-                alert.is_sent = True
-                db.commit()
+async def check_price_alerts(db: AsyncSession, alert_ids: List[int]) -> List[int]:
+    """
+    Send the alerts in `alert_ids`, which alert_index reported as triggered,
+    fetching price comparisons once per product for all its subscribers.
+    Returns the ids whose email could not be sent.
+    """
+    unsent = []
+    if not alert_ids:
+        return unsent
+    result = await db.execute(
+        select(models.PriceAlert, models.Product)
+        .join(models.Product, models.Product.id == models.PriceAlert.product_id)
+        .where(models.PriceAlert.id.in_(set(alert_ids)))
+        .where(models.PriceAlert.is_sent == False)
+        .order_by(models.PriceAlert.product_id)
+    )
+
+    comparisons = {}
+    for alert, product in result.all():
+        # Get multi-platform prices once per product, from the refreshed row
+        if product.id not in comparisons:
+            try:
+                comparisons[product.id] = await get_multi_platform_prices({'title': product.name})
+            except Exception as e:
+                print(f"Error comparing prices for product {product.id}: {str(e)}")
+                comparisons[product.id] = {}
+
+        # Send email with price comparison
+        email_sent = await send_price_alert_email(
+            alert.email,
+            product.name,
+            product.image_url,
+            product.current_price,
+            alert.target_price,
+            product.amazon_url
+        )
+
+        if email_sent:
+            alert.is_sent = True
+            await db.commit()
+            alert_index.remove(alert.id)
+        else:
+            unsent.append(alert.id)
+    return unsent
+
+async def send_pending_alerts():
+    """Send the alerts queued in pending_alert_ids; they stay queued if sending fails."""
+    if not pending_alert_ids:
+        return
+    alert_ids = list(pending_alert_ids)
+    pending_alert_ids.difference_update(alert_ids)
+    async with AsyncSessionLocal() as db:
+        try:
+            pending_alert_ids.update(await check_price_alerts(db, alert_ids))
+        except Exception as e:
+            print(f"Error sending pending alerts: {str(e)}")
+            # Sent alerts are skipped on the retry, being marked is_sent
+            pending_alert_ids.update(alert_ids)
 
 async def update_product_prices():
-    """Update prices for all products in the database."""
-    db = SessionLocal()
-    try:
-        products = db.query(models.Product).all()
-        for product in products:
-            # Scrape current price
-            product_data = scraper.scrape_amazon_product(product.amazon_url)
-            if product_data['current_price']:
-                # Update current price
-                product.current_price = product_data['current_price']
-                
-                # Add to price history
-                price_history = models.PriceHistory(
-                    product_id=product.id,
-                    price=product_data['current_price']
-                )
-                db.add(price_history)
-        
-        db.commit()
-        
-        # Check price alerts after updating prices
-        await check_price_alerts(db)
-        
-    except Exception as e:
-        print(f"Error updating prices: {str(e)}")
-        db.rollback()
-    finally:
-        db.close()
+    """
+    Update prices for all products in the database.
+
+    Each canonical product is priced once per cycle however many users
+    subscribe to it; their lists and alerts read the shared row. While the
+    ScrapingBee circuit is open the cycle waits for it rather than failing,
+    and products it cannot reach in time keep their last price.
+    """
+    upstream = get_upstream_state()
+    if upstream['circuit'] != 'closed':
+        print(f"ScrapingBee circuit {upstream['circuit']}, retry in {upstream['retry_after_s']}s; "
+              f"refresh will run at reduced pace")
+    async with AsyncSessionLocal() as db:
+        try:
+            if not alert_index.loaded:
+                await load_alert_index(db)
+            result = await db.execute(select(models.Product))
+            products = result.scalars().all()
+            # Priced by canonical URL, as older rows may keep tracking parameters
+            urls = {product.id: canonical_url(product.amazon_url) or product.amazon_url for product in products}
+            # SP-API in batches when configured, scraping for the rest
+            prices = await fetch_current_prices(urls.values())
+            now = datetime.utcnow()
+            for product in products:
+                current_price = prices.get(urls[product.id])
+                if current_price:
+                    # Update current price
+                    product.current_price = current_price
+
+                    # Add to price history
+                    price_history = models.PriceHistory(
+                        product_id=product.id,
+                        price=current_price,
+                        timestamp=now
+                    )
+                    db.add(price_history)
+                    await record_price_async(db, product.id, current_price, now)
+
+            await db.commit()
+            # Only committed prices move the index's lows and trigger alerts.
+            # The index has consumed these crossings, so they are queued
+            # rather than sent inline, where a failure would lose them.
+            for product in products:
+                if prices.get(urls[product.id]):
+                    append_point(product.id, now, product.current_price)
+                    pending_alert_ids.update(alert_index.observe(product.id, product.current_price))
+
+        except Exception as e:
+            print(f"Error updating prices: {str(e)}")
+            await db.rollback()
+    await send_pending_alerts()
 
 def start_scheduler():
     """Start the price update scheduler."""
     scheduler.add_job(update_product_prices, 'interval', minutes=30)
+    scheduler.add_job(send_pending_alerts, 'interval', minutes=1)
     scheduler.start() 
\ No newline at end of file
@@ -1,11 +1,18 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional, Union
 
 class PriceHistoryBase(BaseModel):
     price: float
     timestamp: datetime
 
+class ColumnarHistory(BaseModel):
+    """Price history with ?format=columnar."""
+    t: List[int] = Field(description="Epoch seconds (UTC)")
+    p: List[float]
+
+History = Union[List[PriceHistoryBase], ColumnarHistory]
+
 class ProductBase(BaseModel):
     amazon_url: str
     name: str
@@ -15,17 +22,35 @@ class ProductBase(BaseModel):
 class ProductCreate(ProductBase):
     pass
 
+class PriceStats(BaseModel):
+    current: float
+    previous: Optional[float] = None
+    min: float
+    min_at: Optional[datetime] = None
+    max: float
+    avg_7d: Optional[float] = None
+    avg_30d: Optional[float] = None
+    change_pct: Optional[float] = None
+    last_change_at: Optional[datetime] = None
+    samples: int
+    is_all_time_low: bool
+
 class Product(ProductBase):
     id: int
     created_at: datetime
-    price_history: List[PriceHistoryBase] = []
+    price_history: History = []
+    stats: Optional[PriceStats] = None
 
     class Config:
         from_attributes = True
 
 class PriceAlertBase(BaseModel):
     email: str
-    target_price: float
+    alert_type: Literal['target', 'percent_drop', 'all_time_low'] = 'target'
+    # Required for 'target' alerts
+    target_price: Optional[float] = None
+    # Required for 'percent_drop' alerts, e.g. 10 for a 10% drop
+    percent_drop: Optional[float] = Field(None, gt=0, lt=100)
 
 class PriceAlertCreate(PriceAlertBase):
     product_id: int
@@ -33,6 +58,7 @@ class PriceAlertCreate(PriceAlertBase):
 class PriceAlert(PriceAlertBase):
     id: int
     product_id: int
+    reference_price: Optional[float] = None
     is_sent: bool
     created_at: datetime
 
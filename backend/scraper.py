@@ -1,29 +1,96 @@
-from scrapingbee import ScrapingBeeClient
 from bs4 import BeautifulSoup
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import aiohttp
+import asyncio
+import multiprocessing
 import re
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 import yaml
 import os
 import json
+import time
 import logging
 
+from backend.canonical import parse_amazon_url
+from backend.upstream import (
+    FAILED, UNAVAILABLE, UpstreamGuard, UpstreamUnavailable, classify_status
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SCRAPINGBEE_API_URL = "https://app.scrapingbee.com/api/v1/"
+
+# ASINs whose tier and price strategy are remembered, and for how long; an
+# expired tier is re-probed from the cheapest, in case the page got simpler
+LEARNED_ASINS = int(os.getenv('SCRAPER_LEARNED_ASINS', '10000'))
+LEARNED_TTL_SECONDS = float(os.getenv('SCRAPER_LEARNED_TTL_SECONDS', '86400'))
+
+# Tier index that last produced a complete result for each ASIN;
+# ASIN -> (tier index, learned at), most recently used last
+_asin_tiers: "OrderedDict[str, tuple]" = OrderedDict()
+
+# Per-tier counters reported by get_scrape_stats()
+_tier_stats: Dict[str, Dict] = {}
+
+# Price strategy that last worked for each ASIN (same layout as _asin_tiers),
+# hit counts per category and overall, reported by get_selector_stats()
+_asin_strategies: "OrderedDict[str, tuple]" = OrderedDict()
+_category_strategies: Dict[str, Dict[str, int]] = {}
+_strategy_stats: Dict[str, Dict[str, int]] = {}
+
+# Worker processes for HTML parsing and the shared ScrapingBee session
+_parser_pool: Optional[ProcessPoolExecutor] = None
+_http_session: Optional[aiohttp.ClientSession] = None
+_http_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Concurrency limit and circuit breaker shared by every ScrapingBee request
+_upstream_guard: Optional[UpstreamGuard] = None
+
+# Values of the 'error' key in a failed scrape result
+PRODUCT_UNAVAILABLE = 'unavailable'
+UPSTREAM_FAILING = 'upstream'
+SCRAPER_ERROR = 'internal'
+
 def load_scraping_config() -> Dict:
     """Load ScrapingBee configuration from YAML file."""
     config_path = os.path.join(os.path.dirname(__file__), 'scraping_config.yaml')
     with open(config_path, 'r') as f:
         return yaml.safe_load(f)
 
+def _learned(cache: OrderedDict, asin: Optional[str]):
+    """What `cache` remembers for `asin`, or None if nothing or expired."""
+    entry = cache.get(asin)
+    if entry is None:
+        return None
+    value, learned_at = entry
+    if time.monotonic() - learned_at >= LEARNED_TTL_SECONDS:
+        del cache[asin]
+        return None
+    cache.move_to_end(asin)
+    return value
+
+def _learn(cache: OrderedDict, asin: str, value):
+    """Remember `value` for `asin`, evicting the least recently used ASIN."""
+    cache[asin] = (value, time.monotonic())
+    cache.move_to_end(asin)
+    if len(cache) > LEARNED_ASINS:
+        cache.popitem(last=False)
+
+def extract_asin(url: str) -> Optional[str]:
+    """Extract the ASIN from an Amazon product URL."""
+    parsed = parse_amazon_url(url)
+    return parsed[0] if parsed else None
+
 def extract_price(price_str: str) -> Optional[float]:
     """Extract price from string and convert to float."""
     if not price_str:
         return None
-    
+
     logger.info(f"Attempting to extract price from: {price_str}")
-    
+
     # Remove currency symbols and convert to float
     price = re.sub(r'[^\d.]', '', price_str)
     try:
@@ -39,163 +106,438 @@ def save_debug_html(html_content: str, filename: str = "debug_page.html"):
         f.write(html_content)
     logger.info(f"Saved debug HTML to {debug_path}")
 
-def scrape_amazon_product(url: str) -> Dict:
-    """Scrape product information using ScrapingBee."""
+def empty_product(url: str, error: Optional[str] = PRODUCT_UNAVAILABLE) -> Dict:
+    """
+    Result returned when a product could not be scraped.
+
+    `error` is PRODUCT_UNAVAILABLE when ScrapingBee answered but the page had
+    no product, UPSTREAM_FAILING when ScrapingBee itself could not be used
+    (HTTP failures, timeouts, connection errors, open circuit) and
+    SCRAPER_ERROR for anything else, such as missing configuration or a bug.
+    """
+    return {
+        'name': None,
+        'image_url': None,
+        'current_price': None,
+        'amazon_url': url,
+        'error': error
+    }
+
+# Price extraction strategies in default order: CSS selectors, then the
+# JSON-LD block, then a regex scan over inline scripts
+PRICE_SELECTORS = [
+    'span.a-offscreen',
+    'span.a-price span.a-offscreen',
+    'span.a-price-whole',
+    'span#priceblock_ourprice',
+    'span#priceblock_dealprice',
+    'span.a-price',
+    'div.a-section span.a-price',
+    'div#price',
+    'div#priceblock_ourprice',
+    'div#priceblock_dealprice',
+    'span.a-color-price',  # Additional selector
+    'span.a-color-base span.a-color-price',  # Additional selector
+    'div.a-section span.a-color-price',  # Additional selector
+]
+JSON_LD_STRATEGY = 'json-ld'
+SCRIPT_STRATEGY = 'script'
+PRICE_STRATEGIES = PRICE_SELECTORS + [JSON_LD_STRATEGY, SCRIPT_STRATEGY]
+
+def _price_from_json_ld(soup: BeautifulSoup) -> Optional[float]:
+    price_data = soup.find('script', {'type': 'application/ld+json'})
+    if price_data:
+        try:
+            data = json.loads(price_data.string)
+            if isinstance(data, dict) and 'offers' in data:
+                if 'price' in data['offers']:
+                    price = float(data['offers']['price'])
+                    logger.info(f"Found price in JSON-LD: {price}")
+                    return price
+        except (json.JSONDecodeError, ValueError, TypeError) as e:
+            logger.error(f"Error parsing JSON-LD: {e}")
+    return None
+
+def _price_from_scripts(soup: BeautifulSoup) -> Optional[float]:
+    for script in soup.find_all('script'):
+        if script.string and 'price' in script.string.lower():
+            # Look for price patterns in the script
+            price_matches = re.findall(r'price["\']?\s*:\s*["\']?(\d+\.?\d*)["\']?', script.string)
+            if price_matches:
+                try:
+                    price = float(price_matches[0])
+                    logger.info(f"Found price in script: {price}")
+                    return price
+                except ValueError:
+                    continue
+    return None
+
+def _run_price_strategy(soup: BeautifulSoup, strategy: str) -> Optional[float]:
+    if strategy == JSON_LD_STRATEGY:
+        return _price_from_json_ld(soup)
+    if strategy == SCRIPT_STRATEGY:
+        return _price_from_scripts(soup)
+    price_element = soup.select_one(strategy)
+    if price_element:
+        price_text = price_element.text.strip()
+        return extract_price(price_text)
+    return None
+
+def extract_category(soup: BeautifulSoup) -> Optional[str]:
+    """Top-level category from the breadcrumb trail, if the page has one."""
+    breadcrumbs = soup.find(id='wayfinding-breadcrumbs_feature_div')
+    if not breadcrumbs:
+        return None
+    link = breadcrumbs.find('a')
+    return link.text.strip() if link else None
+
+def parse_product_html(
+    html: str,
+    url: str,
+    preferred: Optional[str] = None,
+    category_preferred: Optional[Dict[str, str]] = None
+) -> Tuple[Dict, Optional[str], Optional[str]]:
+    """
+    Extract name, image and price from an Amazon product page.
+
+    `preferred` is the strategy that last worked for this product and
+    `category_preferred` maps categories to their most successful strategy;
+    both are tried before the default order. Returns the product info, the
+    strategy that found the price and the page's category.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Get product name
+    name = soup.find('span', {'id': 'productTitle'})
+    name = name.text.strip() if name else None
+    logger.info(f"Found product name: {name}")
+
+    # Get product image
+    image = soup.find('img', {'id': 'landingImage'})
+    image_url = image.get('data-old-hires') if image else None
+    if not image_url:
+        image_url = image.get('src') if image else None
+    logger.info(f"Found image URL: {image_url}")
+
+    category = extract_category(soup)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for selector in PRICE_SELECTORS:
+            for elem in soup.select(selector):
+                logger.debug(f"Selector '{selector}' matched: {elem.text.strip()}")
+
+    # Learned strategies first, then the default order
+    order = []
+    for strategy in (preferred, (category_preferred or {}).get(category)):
+        if strategy in PRICE_STRATEGIES and strategy not in order:
+            order.append(strategy)
+    order.extend(s for s in PRICE_STRATEGIES if s not in order)
+
+    price = None
+    winner = None
+    for strategy in order:
+        price = _run_price_strategy(soup, strategy)
+        if price:
+            winner = strategy
+            logger.info(f"Successfully extracted price {price} with '{strategy}'")
+            break
+
+    if not name or not price:
+        logger.error(f"\nCould not extract required data. Name: {name}, Price: {price}")
+        return empty_product(url), None, category
+
+    return {
+        'name': name,
+        'image_url': image_url,
+        'current_price': price,
+        'amazon_url': url
+    }, winner, category
+
+def _learn_strategy(asin: Optional[str], category: Optional[str], strategy: Optional[str]):
+    """Record the strategy that found a price so the next scrape tries it first."""
+    stats = _strategy_stats.setdefault(strategy or 'none', {'hits': 0, 'first_try': 0})
+    stats['hits'] += 1
+    if not strategy:
+        return
+    if asin:
+        if _learned(_asin_strategies, asin) == strategy:
+            stats['first_try'] += 1
+        _learn(_asin_strategies, asin, strategy)
+    if category:
+        counts = _category_strategies.setdefault(category, {})
+        counts[strategy] = counts.get(strategy, 0) + 1
+
+def get_category_preferences() -> Dict[str, str]:
+    """Most successful price strategy for each category seen so far."""
+    return {
+        category: max(counts, key=counts.get)
+        for category, counts in _category_strategies.items()
+    }
+
+def get_selector_stats() -> Dict:
+    """Hit rates of the price extraction strategies, overall and per category."""
+    total = sum(stats['hits'] for stats in _strategy_stats.values())
+    return {
+        'extractions': total,
+        'products_learned': len(_asin_strategies),
+        'strategies': {
+            strategy: {
+                'hits': stats['hits'],
+                'hit_rate': stats['hits'] / total if total else 0.0,
+                'learned_first_try': stats['first_try'],
+            }
+            for strategy, stats in sorted(_strategy_stats.items(), key=lambda item: -item[1]['hits'])
+        },
+        'categories': _category_strategies,
+    }
+
+def get_scrape_tiers(config: Dict) -> List[Dict]:
+    """Return the configured fetch tiers, cheapest first."""
+    return config['scrapingbee']['tiers']
+
+def _record_attempt(tier: Dict, latency: float, success: bool):
+    stats = _tier_stats.setdefault(tier['name'], {
+        'attempts': 0,
+        'successes': 0,
+        'total_latency': 0.0,
+        'credits_spent': 0,
+        'credits_saved': 0,
+        'latency_saved': 0.0,
+    })
+    stats['attempts'] += 1
+    stats['total_latency'] += latency
+    stats['credits_spent'] += tier['cost']
+    if success:
+        stats['successes'] += 1
+
+def _record_savings(tiers: List[Dict], tier: Dict, credits_used: int, latency_used: float):
+    """Credit the winning tier with what a top-tier-only scrape would have cost."""
+    top = tiers[-1]
+    top_stats = _tier_stats.get(top['name'])
+    stats = _tier_stats[tier['name']]
+    stats['credits_saved'] += top['cost'] - credits_used
+    if top_stats and top_stats['attempts']:
+        top_latency = top_stats['total_latency'] / top_stats['attempts']
+        stats['latency_saved'] += top_latency - latency_used
+
+def get_scrape_stats() -> Dict:
+    """Per-tier attempts, success rate, latency and ScrapingBee credits saved."""
+    report = {}
+    for name, stats in _tier_stats.items():
+        attempts = stats['attempts']
+        report[name] = {
+            'attempts': attempts,
+            'successes': stats['successes'],
+            'success_rate': stats['successes'] / attempts if attempts else 0.0,
+            'avg_latency_ms': round(stats['total_latency'] / attempts * 1000, 1) if attempts else 0.0,
+            'credits_spent': stats['credits_spent'],
+            'credits_saved': stats['credits_saved'],
+            'latency_saved_ms': round(stats['latency_saved'] * 1000, 1),
+        }
+    return report
+
+def _init_parser_worker(log_level: int):
+    """Parser workers log at the same level as the server process."""
+    logger.setLevel(log_level)
+
+def _get_parser_pool(config: Dict) -> Optional[ProcessPoolExecutor]:
+    """Process pool for HTML parsing, created on first use."""
+    global _parser_pool
+    workers = config.get('parser', {}).get('workers')
+    if workers == 0:
+        return None
+    if _parser_pool is None:
+        # Spawn rather than fork: the server process runs the event loop and
+        # scheduler threads, which must not be copied into the workers
+        _parser_pool = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_parser_worker,
+            initargs=(logger.getEffectiveLevel(),)
+        )
+    return _parser_pool
+
+def shutdown_parser_pool():
+    """Stop the parser worker processes."""
+    global _parser_pool
+    if _parser_pool is not None:
+        _parser_pool.shutdown(wait=True, cancel_futures=True)
+        _parser_pool = None
+
+def parse_product_bytes(
+    html: bytes,
+    url: str,
+    preferred: Optional[str] = None,
+    category_preferred: Optional[Dict[str, str]] = None
+) -> Tuple[Dict, Optional[str], Optional[str]]:
+    """parse_product_html for raw response bytes, run inside a parser worker."""
+    return parse_product_html(html.decode('utf-8', errors='replace'), url, preferred, category_preferred)
+
+async def parse_product_async(
+    html: bytes,
+    url: str,
+    preferred: Optional[str] = None,
+    category_preferred: Optional[Dict[str, str]] = None,
+    config: Optional[Dict] = None
+) -> Tuple[Dict, Optional[str], Optional[str]]:
+    """Parse a page in the parser pool (or a thread when workers is 0)."""
+    loop = asyncio.get_running_loop()
+    pool = _get_parser_pool(config or load_scraping_config())
+    return await loop.run_in_executor(
+        pool, parse_product_bytes, html, url, preferred, category_preferred
+    )
+
+async def _get_http_session() -> aiohttp.ClientSession:
+    """Shared HTTP session for ScrapingBee requests on the current event loop."""
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        _http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=90))
+        _http_session_loop = loop
+    return _http_session
+
+async def close_http_session():
+    """Close the shared ScrapingBee HTTP session."""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+def get_upstream_guard(config: Optional[Dict] = None) -> UpstreamGuard:
+    """The guard for ScrapingBee requests, built from the `upstream` config section."""
+    global _upstream_guard
+    if _upstream_guard is None:
+        config = config or load_scraping_config()
+        _upstream_guard = UpstreamGuard('scrapingbee', config.get('upstream'))
+    return _upstream_guard
+
+def get_upstream_state() -> Dict:
+    """Circuit and concurrency state of the ScrapingBee guard."""
+    return get_upstream_guard().state()
+
+def _api_params(api_key: str, url: str, params: Dict) -> Dict:
+    """ScrapingBee query string; booleans are sent as lowercase strings."""
+    query = {'api_key': api_key, 'url': url}
+    for key, value in params.items():
+        query[key] = str(value).lower() if isinstance(value, bool) else str(value)
+    return query
+
+async def scrape_amazon_product_async(url: str) -> Dict:
+    """
+    Scrape product information using ScrapingBee.
+
+    Tiers are tried cheapest first (static fetch with resources blocked, then
+    JS rendering, then premium proxies) and the first one whose page yields a
+    name and price wins. The winning tier is remembered per ASIN for
+    LEARNED_TTL_SECONDS so the next scrape of that product starts there. Pages are fetched asynchronously and
+    parsed in the parser process pool.
+
+    Requests go through the upstream guard: throttling, server errors and
+    timeouts stop the scrape (no escalation) and count towards opening the
+    circuit, while a 404 marks the product unavailable.
+    """
     try:
         # Load configuration
         config = load_scraping_config()
         api_key = config['scrapingbee']['api_key']
-        
+        api_url = os.getenv('SCRAPINGBEE_API_URL') or config['scrapingbee'].get('api_url', SCRAPINGBEE_API_URL)
+
         if not api_key:
             logger.error("ScrapingBee API key not configured")
-            return {
-                'name': None,
-                'image_url': None,
-                'current_price': None,
-                'amazon_url': url
-            }
-        
-        logger.info(f"Using ScrapingBee to scrape: {url}")
-        
-        # Initialize ScrapingBee client
-        client = ScrapingBeeClient(api_key=api_key)
-        
-        # Configure scraping parameters
-        params = {
-            'render_js': True,  # Always enable JS rendering
-            'premium_proxy': True,  # Always use premium proxies
-            'country_code': "us",  # Use US proxies
-            'wait': 5000,  # Wait 5 seconds for JavaScript to load
-            'block_resources': False,  # Don't block any resources
-            'block_ads': False,  # Don't block ads
-        }
-        
-        # Make the request
-        logger.info("Sending request to ScrapingBee...")
-        response = client.get(url, params=params)
-        
-        logger.info(f"ScrapingBee response status: {response.status_code}")
-        
-        if response.status_code != 200:
-            logger.error(f"Error from ScrapingBee: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return {
-                'name': None,
-                'image_url': None,
-                'current_price': None,
-                'amazon_url': url
-            }
-        
-        # Save HTML for debugging
-        save_debug_html(response.text)
-        
-        # Parse the response
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Get product name
-        name = soup.find('span', {'id': 'productTitle'})
-        name = name.text.strip() if name else None
-        logger.info(f"Found product name: {name}")
-        
-        # Get product image
-        image = soup.find('img', {'id': 'landingImage'})
-        image_url = image.get('data-old-hires') if image else None
-        if not image_url:
-            image_url = image.get('src') if image else None
-        logger.info(f"Found image URL: {image_url}")
-        
-        # Get price - try multiple price selectors
-        price = None
-        price_selectors = [
-            'span.a-offscreen',
-            'span.a-price span.a-offscreen',
-            'span.a-price-whole',
-            'span#priceblock_ourprice',
-            'span#priceblock_dealprice',
-            'span.a-price',
-            'div.a-section span.a-price',
-            'div#price',
-            'div#priceblock_ourprice',
-            'div#priceblock_dealprice',
-            'span.a-color-price',  # Additional selector
-            'span.a-color-base span.a-color-price',  # Additional selector
-            'div.a-section span.a-color-price',  # Additional selector
-        ]
-        
-        logger.info("\nSearching for price elements...")
-        for selector in price_selectors:
-            elements = soup.select(selector)
-            if elements:
-                logger.info(f"\nFound elements for selector '{selector}':")
-                for elem in elements:
-                    logger.info(f"Text: {elem.text.strip()}")
-                    if elem.get('class'):
-                        logger.info(f"Classes: {elem.get('class')}")
-        
-        # Try to find price in the page
-        for selector in price_selectors:
-            price_element = soup.select_one(selector)
-            if price_element:
-                price_text = price_element.text.strip()
-                logger.info(f"\nTrying to extract price from element: {price_text}")
-                price = extract_price(price_text)
-                if price:
-                    logger.info(f"Successfully extracted price: {price}")
-                    break
-        
-        # If still no price, try to find it in the page data
-        if not price:
-            logger.info("\nTrying to find price in page data...")
-            # Look for price in the page data
-            price_data = soup.find('script', {'type': 'application/ld+json'})
-            if price_data:
-                try:
-                    data = json.loads(price_data.string)
-                    logger.info(f"Found JSON-LD data: {json.dumps(data, indent=2)}")
-                    if isinstance(data, dict) and 'offers' in data:
-                        if 'price' in data['offers']:
-                            price = float(data['offers']['price'])
-                            logger.info(f"Found price in JSON-LD: {price}")
-                except (json.JSONDecodeError, ValueError) as e:
-                    logger.error(f"Error parsing JSON-LD: {e}")
-            
-            # Try to find price in embedded JavaScript
-            if not price:
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    if script.string and 'price' in script.string.lower():
-                        logger.info(f"Found script with price: {script.string[:200]}...")
-                        # Look for price patterns in the script
-                        price_matches = re.findall(r'price["\']?\s*:\s*["\']?(\d+\.?\d*)["\']?', script.string)
-                        if price_matches:
-                            try:
-                                price = float(price_matches[0])
-                                logger.info(f"Found price in script: {price}")
-                                break
-                            except ValueError:
-                                continue
-        
-        if not name or not price:
-            logger.error(f"\nCould not extract required data. Name: {name}, Price: {price}")
-            return {
-                'name': None,
-                'image_url': None,
-                'current_price': None,
-                'amazon_url': url
-            }
-        
-        return {
-            'name': name,
-            'image_url': image_url,
-            'current_price': price,
-            'amazon_url': url
-        }
-        
+            return empty_product(url, SCRAPER_ERROR)
+
+        session = await _get_http_session()
+        guard = get_upstream_guard(config)
+
+        tiers = get_scrape_tiers(config)
+        asin = extract_asin(url)
+        start = _learned(_asin_tiers, asin) or 0
+        credits_used = 0
+        latency_used = 0.0
+
+        for index in range(start, len(tiers)):
+            tier = tiers[index]
+            params = dict(tier['params'])
+            params['country_code'] = config['scrapingbee'].get('country_code', 'us')
+
+            logger.info(f"Using ScrapingBee tier '{tier['name']}' to scrape: {url}")
+            try:
+                await guard.acquire()
+            except UpstreamUnavailable as e:
+                logger.warning(f"Skipping {url}: {e}")
+                return empty_product(url, UPSTREAM_FAILING)
+            outcome = None
+            started = time.perf_counter()
+            try:
+                async with session.get(api_url, params=_api_params(api_key, url, params)) as response:
+                    status = response.status
+                    body = await response.read()
+                outcome = classify_status(status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                outcome = FAILED
+                logger.error(f"ScrapingBee request failed: {e!r}")
+                return empty_product(url, UPSTREAM_FAILING)
+            finally:
+                latency = time.perf_counter() - started
+                if outcome is None:
+                    # Our own error or a cancellation; says nothing about ScrapingBee
+                    await guard.abandon()
+                else:
+                    await guard.release(outcome, latency)
+            credits_used += tier['cost']
+            latency_used += latency
+
+            logger.info(f"ScrapingBee response status: {status}")
+
+            if status != 200:
+                logger.error(f"Error from ScrapingBee: {status}")
+                logger.error(f"Response content: {body[:500]!r}")
+                _record_attempt(tier, latency, False)
+                if outcome == FAILED:
+                    # Throttled or erroring; a pricier tier would fail the same way
+                    return empty_product(url, UPSTREAM_FAILING)
+                if outcome == UNAVAILABLE:
+                    _asin_tiers.pop(asin, None)
+                    return empty_product(url, PRODUCT_UNAVAILABLE)
+                continue
+
+            if logger.isEnabledFor(logging.DEBUG):
+                # Save HTML for debugging
+                save_debug_html(body.decode('utf-8', errors='replace'))
+
+            product_info, strategy, category = await parse_product_async(
+                body, url, _learned(_asin_strategies, asin), get_category_preferences(), config
+            )
+            _learn_strategy(asin, category, strategy)
+            success = bool(product_info['name'] and product_info['current_price'])
+            _record_attempt(tier, latency, success)
+
+            if success:
+                if asin:
+                    _learn(_asin_tiers, asin, index)
+                _record_savings(tiers, tier, credits_used, latency_used)
+                logger.info(
+                    f"Scraped {url} with tier '{tier['name']}' "
+                    f"({credits_used} credits, {latency_used * 1000:.0f} ms)"
+                )
+                return product_info
+
+            logger.info(f"Tier '{tier['name']}' missing required fields, escalating")
+
+        # Nothing worked; retry from the cheapest tier next time
+        _asin_tiers.pop(asin, None)
+        return empty_product(url)
+
     except Exception as e:
-        logger.error(f"Error scraping product: {str(e)}")
-        return {
-            'name': None,
-            'image_url': None,
-            'current_price': None,
-            'amazon_url': url
-        } 
\ No newline at end of file
+        # Not an upstream failure; it must not count against ScrapingBee or be retried as one
+        logger.error(f"Unexpected error scraping {url}: {e!r}", exc_info=True)
+        return empty_product(url, SCRAPER_ERROR)
+
+def scrape_amazon_product(url: str) -> Dict:
+    """Blocking wrapper around scrape_amazon_product_async for scripts."""
+    async def scrape() -> Dict:
+        try:
+            return await scrape_amazon_product_async(url)
+        finally:
+            await close_http_session()
+    return asyncio.run(scrape())
@@ -0,0 +1,290 @@
+"""
+Optional append-only binary store of price history for chart reads.
+
+Each product's history is one segment file of 8-byte points, (uint32 epoch
+seconds, float32 price), appended in time order. Reads memory-map the
+segment and binary-search its sorted timestamps for the requested range, so
+a chart read is a slice of the mapped pages: no row objects and no
+timestamp parsing. float32 keeps about seven significant digits, exact to
+the cent below 100,000.
+
+price_history stays the source of truth. The store is enabled by setting
+PRICE_SERIES_DIR, built from the database at startup when missing or out of
+step with it (see migrations.py) and can be rebuilt by hand:
+
+    python -m backend.series_store
+
+Writers hold the directory's LOCK file, so appends never interleave. Open
+segments are cached per process, though: run one API process per directory.
+"""
+import logging
+import mmap
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import orjson
+from sqlalchemy import DateTime, Float, Integer, column, extract, func, inspect, select, table
+from sqlalchemy.engine import Connection
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writers are only serialized within the process
+    fcntl = None
+
+from backend.responses import epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+POINT = np.dtype([('t', '<u4'), ('p', '<f4')])
+
+SERIES_DIR = os.getenv('PRICE_SERIES_DIR')
+
+# Segments kept mapped at once
+MAX_OPEN_SEGMENTS = int(os.getenv('PRICE_SERIES_MAX_OPEN', '1024'))
+
+# Written last by rebuild_store(); the store is only read once it exists.
+# Holds the build's point count and highest price_history id as JSON.
+READY_FILE = 'READY'
+
+LOCK_FILE = 'LOCK'
+
+REBUILD_CHUNK_ROWS = 200000
+
+_EMPTY = np.zeros(0, dtype=POINT)
+
+_history = table(
+    'price_history',
+    column('id', Integer), column('product_id', Integer), column('timestamp', DateTime), column('price', Float)
+)
+
+# Rows the store holds a point for
+_STORED = (_history.c.product_id.isnot(None), _history.c.price.isnot(None))
+
+class SeriesStore:
+    """Per-product segments of (epoch seconds, price) points under one directory."""
+
+    def __init__(self, directory: str, max_open: int = MAX_OPEN_SEGMENTS):
+        self.directory = directory
+        self.max_open = max_open
+        # product_id -> mapped points, least recently read first. Dropping an
+        # entry unmaps the segment once no slice of it is still referenced.
+        self._open: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def ready(self) -> bool:
+        return os.path.exists(os.path.join(self.directory, READY_FILE))
+
+    def ready_stats(self) -> Optional[Dict]:
+        """What mark_ready() recorded, or None if missing or unreadable."""
+        try:
+            with open(os.path.join(self.directory, READY_FILE), 'rb') as f:
+                return orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+    @contextmanager
+    def locked(self):
+        """Exclusive hold on the segments for writing, across processes where flock exists."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, LOCK_FILE), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def point_count(self) -> int:
+        """Whole points across every segment."""
+        count = 0
+        for name in os.listdir(self.directory):
+            if not name.isdigit():
+                continue
+            with os.scandir(os.path.join(self.directory, name)) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.pts'):
+                        count += entry.stat().st_size // POINT.itemsize
+        return count
+
+    def path(self, product_id: int) -> str:
+        # At most 1000 segments per subdirectory
+        return os.path.join(self.directory, str(product_id // 1000), f'{product_id}.pts')
+
+    def _points(self, product_id: int) -> np.ndarray:
+        points = self._open.get(product_id)
+        if points is not None:
+            self._open.move_to_end(product_id)
+            return points
+        try:
+            with open(self.path(product_id), 'rb') as f:
+                # Ignore a torn trailing write
+                size = os.fstat(f.fileno()).st_size // POINT.itemsize * POINT.itemsize
+                if size:
+                    points = np.frombuffer(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ), dtype=POINT)
+        except FileNotFoundError:
+            pass
+        if points is None:
+            points = _EMPTY
+        self._open[product_id] = points
+        if len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+        return points
+
+    def read(self, product_id: int, start: Optional[int] = None,
+             end: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and prices in [start, end) epoch seconds, as views of the segment."""
+        points = self._points(product_id)
+        times = points['t']
+        lo = 0 if start is None else int(np.searchsorted(times, max(start, 0)))
+        hi = len(points) if end is None else int(np.searchsorted(times, max(end, 0)))
+        window = points[lo:hi]
+        return window['t'], window['p']
+
+    def append(self, product_id: int, at: datetime, price: float):
+        """Add one observation; a point older than the segment's last is inserted in order."""
+        with self.locked():
+            self._append(product_id, at, price)
+
+    def _append(self, product_id: int, at: datetime, price: float):
+        point = np.array([(epoch_seconds(at), price)], dtype=POINT)
+        path = self.path(product_id)
+        self._open.pop(product_id, None)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a+b') as f:
+            # Under the lock a partial trailing point can only be a crashed
+            # writer's; it is cut off before appending
+            size = f.tell() // POINT.itemsize * POINT.itemsize
+            last = None
+            if size:
+                f.seek(size - POINT.itemsize)
+                last = np.frombuffer(f.read(POINT.itemsize), dtype=POINT)['t'][0]
+            if last is None or point['t'][0] >= last:
+                f.truncate(size)
+                f.write(point.tobytes())
+                return
+            f.seek(0)
+            points = np.frombuffer(f.read(size), dtype=POINT)
+        # Late point: rewrite the segment with it in place
+        position = int(np.searchsorted(points['t'], point['t'][0], side='right'))
+        self._write(path, np.concatenate((points[:position], point, points[position:])))
+
+    def _write(self, path: str, points: np.ndarray):
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(points.tobytes())
+        os.replace(temporary, path)
+
+    def clear(self):
+        """Delete every segment and the ready marker."""
+        self._open.clear()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name == READY_FILE:
+                os.remove(path)
+            elif name.isdigit() and os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def mark_ready(self, stats: Dict):
+        with open(os.path.join(self.directory, READY_FILE), 'wb') as f:
+            f.write(orjson.dumps(stats))
+
+series_store = SeriesStore(SERIES_DIR) if SERIES_DIR else None
+
+def append_point(product_id: int, at: datetime, price: float):
+    """Mirror a committed price_history row into the store, if enabled."""
+    if series_store is None or not series_store.ready or price is None:
+        return
+    try:
+        series_store.append(product_id, at, price)
+    except OSError as e:
+        # The database still has the point; a rebuild restores it
+        logger.error(f"Series store append failed for product {product_id}: {e}")
+
+def series_payload(times: np.ndarray, prices: np.ndarray, format: str = 'rows'):
+    """Same shapes as responses.history_payload, from store slices."""
+    if format == 'columnar':
+        # Serialized by orjson straight from the arrays
+        return {'t': np.ascontiguousarray(times), 'p': np.ascontiguousarray(prices)}
+    # Through orjson for the shortest float32 repr, e.g. 19.99 rather than 19.989999771118164
+    prices = orjson.loads(orjson.dumps(np.ascontiguousarray(prices), option=orjson.OPT_SERIALIZE_NUMPY))
+    # ISO strings built in NumPy, as orjson would write the naive UTC datetimes
+    timestamps = times.astype('datetime64[s]').astype(str).tolist()
+    return [{'price': price, 'timestamp': timestamp} for timestamp, price in zip(timestamps, prices)]
+
+def store_in_sync(conn: Connection, store: SeriesStore) -> bool:
+    """
+    Whether the store holds a point for every stored price_history row: those
+    counted at the last rebuild plus those written since (ids above its
+    high-water mark), which append_point mirrors.
+    """
+    stats = store.ready_stats()
+    if not stats or 'max_id' not in stats:
+        return False
+    if 'price_history' not in inspect(conn).get_table_names():
+        return stats['points'] == 0
+    added = conn.execute(
+        select(func.count()).select_from(_history).where(_history.c.id > stats['max_id'], *_STORED)
+    ).scalar()
+    return store.point_count() == stats['points'] + added
+
+def rebuild_store(conn: Connection, store: SeriesStore) -> Dict:
+    """Rewrite every segment from price_history in one ordered pass."""
+    with store.locked():
+        return _rebuild(conn, store)
+
+def _rebuild(conn: Connection, store: SeriesStore) -> Dict:
+    store.clear()
+    if 'price_history' not in inspect(conn).get_table_names():
+        stats = {'products': 0, 'points': 0, 'max_id': 0}
+        store.mark_ready(stats)
+        return stats
+    # Rows committed during the rebuild are above the mark; the next startup
+    # check finds them missing and rebuilds again
+    max_id = conn.execute(select(func.max(_history.c.id))).scalar() or 0
+    result = conn.execution_options(stream_results=True, yield_per=REBUILD_CHUNK_ROWS).execute(
+        select(_history.c.product_id, extract('epoch', _history.c.timestamp), _history.c.price)
+        .where(_history.c.id <= max_id, *_STORED)
+        .order_by(_history.c.product_id, _history.c.timestamp)
+    )
+    products, count, last_id = 0, 0, None
+    for rows in result.partitions(REBUILD_CHUNK_ROWS):
+        # Column by column: np.array() over Row objects is far slower
+        ids, times, prices = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        points = np.empty(len(ids), dtype=POINT)
+        points['t'] = times
+        points['p'] = prices
+        starts = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1, [len(ids)]))
+        for begin, stop in zip(starts[:-1], starts[1:]):
+            product_id = int(ids[begin])
+            path = store.path(product_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A product's rows may continue from the previous chunk
+            with open(path, 'ab') as f:
+                f.write(points[begin:stop].tobytes())
+            if product_id != last_id:
+                products += 1
+                last_id = product_id
+        count += len(ids)
+    stats = {'products': products, 'points': count, 'max_id': max_id}
+    store.mark_ready(stats)
+    return stats
+
+if __name__ == '__main__':
+    from backend.database import engine
+
+    if series_store is None:
+        raise SystemExit('Set PRICE_SERIES_DIR to the store directory')
+    with engine.connect() as conn:
+        print(rebuild_store(conn, series_store))
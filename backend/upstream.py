@@ -0,0 +1,229 @@
+"""
+Back-pressure for calls to a paid upstream (ScrapingBee).
+
+AdaptiveLimiter caps how many requests are in flight and adjusts the cap
+AIMD-style: +1 per window of healthy responses, halved on throttling, server
+errors or slow responses. CircuitBreaker stops requests entirely once the
+failure rate crosses a threshold, then lets single probes through after a
+cool-down until one succeeds. UpstreamGuard combines the two and is what
+the scraper and scheduler use.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# Request outcomes. A missing product is a healthy response from upstream.
+OK = 'ok'
+UNAVAILABLE = 'unavailable'
+FAILED = 'failed'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# How often waiters check whether a half-open probe has finished
+PROBE_POLL_SECONDS = 0.2
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling upstream while the circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+def classify_status(status: int) -> str:
+    """Outcome of an HTTP response from the scraping API."""
+    if status == 200:
+        return OK
+    if status in (404, 410):
+        return UNAVAILABLE
+    if status in (401, 402, 429) or status >= 500:
+        return FAILED
+    # Other 4xx come from the target page (e.g. bot blocks); upstream is fine
+    return OK
+
+class AdaptiveLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.latency = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+        self._loop = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # The sync scraper wrapper runs each call on a fresh event loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    async def acquire(self):
+        async with self._get_condition():
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, congested: bool, latency: float):
+        async with self._get_condition():
+            self.in_flight -= 1
+            self.latency = latency if not self.latency else 0.8 * self.latency + 0.2 * latency
+            now = time.monotonic()
+            if congested:
+                # Responses already in flight reflect the old limit; halve at
+                # most once per round trip
+                if now - self._last_decrease >= self.latency:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    async def discard(self):
+        """Free a slot whose request says nothing about upstream health."""
+        async with self._get_condition():
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+class CircuitBreaker:
+    """Opens when the recent failure rate crosses `threshold`, probes when half-open."""
+
+    def __init__(self, threshold: float, window: int, min_requests: int,
+                 open_seconds: float, max_open_seconds: float):
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_until = 0.0
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self.probing = False
+
+    def failure_rate(self) -> float:
+        return sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() >= self.opened_until:
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def abandon(self):
+        """A request allow() let through was never sent; free the probe slot."""
+        self.probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.trips += 1
+        self.opened_until = time.monotonic() + self.open_seconds
+
+    def record(self, failed: bool):
+        if self.state == HALF_OPEN:
+            self.probing = False
+            if failed:
+                # Still failing; wait longer before the next probe
+                self.open_seconds = min(self.max_open_seconds, self.open_seconds * 2)
+                self._open()
+            else:
+                self.state = CLOSED
+                self.open_seconds = self.base_open_seconds
+                self._outcomes.clear()
+            return
+        self._outcomes.append(failed)
+        if (self.state == CLOSED and len(self._outcomes) >= self.min_requests
+                and self.failure_rate() >= self.threshold):
+            self._open()
+
+class UpstreamGuard:
+    """Adaptive limiter and circuit breaker for one upstream service."""
+
+    def __init__(self, name: str, config: Optional[Dict] = None):
+        config = config or {}
+        self.name = name
+        self.slow_seconds = config.get('slow_ms', 30000) / 1000
+        self.limiter = AdaptiveLimiter(
+            initial=config.get('initial_concurrency', 4),
+            minimum=config.get('min_concurrency', 1),
+            maximum=config.get('max_concurrency', 10),
+        )
+        self.breaker = CircuitBreaker(
+            threshold=config.get('failure_threshold', 0.5),
+            window=config.get('window', 20),
+            min_requests=config.get('min_requests', 10),
+            open_seconds=config.get('open_seconds', 30),
+            max_open_seconds=config.get('max_open_seconds', 600),
+        )
+        self.counts = {OK: 0, UNAVAILABLE: 0, FAILED: 0, 'rejected': 0}
+
+    async def acquire(self):
+        """Wait for a request slot; raises UpstreamUnavailable if the circuit is open."""
+        if not self.breaker.allow():
+            self.counts['rejected'] += 1
+            raise UpstreamUnavailable(self.name, self.breaker.retry_after())
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            # Cancelled while queued; a half-open circuit would otherwise wait
+            # forever for this probe's verdict
+            self.breaker.abandon()
+            raise
+
+    async def release(self, outcome: str, latency: float):
+        """Report how the request went and free its slot."""
+        self.counts[outcome] += 1
+        failed = outcome == FAILED
+        try:
+            await self.limiter.release(failed or latency > self.slow_seconds, latency)
+        finally:
+            self.breaker.record(failed)
+
+    async def abandon(self):
+        """Free the slot of a request that failed on our side or was cancelled; no verdict."""
+        try:
+            await self.limiter.discard()
+        finally:
+            self.breaker.abandon()
+
+    async def wait_until_available(self, deadline: float) -> bool:
+        """Sleep through an open circuit; False if it stays open past `deadline`."""
+        while True:
+            if self.breaker.state == HALF_OPEN and self.breaker.probing:
+                # Wait for the probe's verdict
+                delay = PROBE_POLL_SECONDS
+            else:
+                delay = self.breaker.retry_after()
+            if delay <= 0:
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            await asyncio.sleep(delay)
+
+    def state(self) -> Dict:
+        return {
+            'name': self.name,
+            'circuit': self.breaker.state,
+            'retry_after_s': round(self.breaker.retry_after(), 1),
+            'trips': self.breaker.trips,
+            'failure_rate': round(self.breaker.failure_rate(), 3),
+            'concurrency_limit': round(self.limiter.limit, 2),
+            'in_flight': self.limiter.in_flight,
+            'latency_ewma_ms': round(self.limiter.latency * 1000, 1),
+            'outcomes': dict(self.counts),
+        }